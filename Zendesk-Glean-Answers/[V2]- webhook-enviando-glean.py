@@ -5,10 +5,13 @@ from typing import List, Dict # Glean
 from flask import Flask, request # Flask
 import warnings #retira um warning de SSL do prompt
 import datetime
-import threading
+import atexit
 import logging
 import os
-from openpyxl import Workbook, load_workbook
+import http_client
+from token_store import SqliteTokenStore
+import zendesk_rate_limit
+from bounded_executor import BoundedExecutor
 
 warnings.filterwarnings("ignore", category=UserWarning, module="urllib3")
 
@@ -31,6 +34,13 @@ def get_env_variable(var_name, default_value=None, is_secret=False):
 app = Flask(__name__)
 from config import *  # Importa as variáveis de ambiente do arquivo config.py
 
+# Pool limitado de workers: rajadas de webhooks esperam na fila ou recebem 503
+ticket_executor = BoundedExecutor(
+    max_workers=int(get_env_variable('FLASK_WORKER_POOL_SIZE', '4')),
+    max_queue=int(get_env_variable('FLASK_WORKER_QUEUE_SIZE', '50')),
+)
+atexit.register(ticket_executor.shutdown, wait=True) # Drena os tickets em andamento ao encerrar
+
 # Headers para Glean e Zendesk
 GLEAN_HEADERS = {
     'Content-Type': 'application/json',
@@ -39,12 +49,22 @@ GLEAN_HEADERS = {
 ZENDESK_HEADERS = {
     'Content-Type': 'application/json'
 }
+# Mesmo timeout da Glean do pipeline principal (GLEAN_API_TIMEOUT): o stream do chat passa dos 10s padrão do http_client
+GLEAN_TIMEOUT = int(get_env_variable('GLEAN_API_TIMEOUT', '30'))
+# Sessões pooled (keep-alive) por host; a autenticação é aplicada só na criação
+def zendesk_session():
+    return http_client.get_session(
+        f"https://{ZENDESK_DOMAIN}.zendesk.com", auth=(ZENDESK_EMAIL, ZENDESK_TOKEN), headers=ZENDESK_HEADERS,
+        agendador=zendesk_rate_limit.get_agendador() # 429/Retry-After e rate limit da conta
+    )
+
+def glean_session():
+    return http_client.get_session(GLEAN_API_URL, headers=GLEAN_HEADERS, timeout=GLEAN_TIMEOUT)
 ##--------------------------------------------------------------------------##
 ##--------------------------------------------------------------------------##
 def buscar_dados_completos_do_ticket(ticket_id): # Busca os dados completos do ticket via API, usando do ticket ID
     url = f"https://{ZENDESK_DOMAIN}.zendesk.com/api/v2/tickets/{ticket_id}.json" # URL da API do Zendesk para pegar o ticket
-    auth = (ZENDESK_EMAIL, ZENDESK_TOKEN) # Autenticação com email e token
-    response = requests.get(url, auth=auth) # Faz a requisição GET com autenticação
+    response = zendesk_session().get(url) # Faz a requisição GET com a sessão autenticada
     if response.status_code == 200: # Verifica se a requisição foi bem sucedida
         return response.json()["ticket"] # Retorna os dados do ticket
         
@@ -54,8 +74,7 @@ def buscar_dados_completos_do_ticket(ticket_id): # Busca os dados completos do t
 ##--------------------------------------------------------------------------##
 def buscar_comentarios_do_ticket(ticket_id): # Busca os comentários do ticket via API, usando do ticket ID
     url = f"https://{ZENDESK_DOMAIN}.zendesk.com/api/v2/tickets/{ticket_id}/comments.json" # URL da API do Zendesk para pegar os comentários do ticket
-    auth = (ZENDESK_EMAIL, ZENDESK_TOKEN) # Autenticação com email e token
-    response = requests.get(url, headers=ZENDESK_HEADERS, auth=auth) #Extrai os comentários dos tickets
+    response = zendesk_session().get(url) #Extrai os comentários dos tickets
     if response.status_code == 200:  #a resposta sendo positiva, retornamos
         return response.json().get("comments", [])
     else: #retorna vazio caso exista erro
@@ -83,14 +102,13 @@ def gerar_texto_completo_do_ticket(ticket_id, ticket, comentarios): #pega as inf
 ##--------------------------------------------------------------------------##
 def get_user_info(user_id):
     url = f"https://{ZENDESK_DOMAIN}.zendesk.com/api/v2/users/{user_id}.json" # URL da API do Zendesk para pegar o usuário
-    auth = (ZENDESK_EMAIL, ZENDESK_TOKEN) # Autenticação com email e token
-    res = requests.get(url, headers=ZENDESK_HEADERS, auth=auth) # Faz a requisição GET
+    res = zendesk_session().get(url) # Faz a requisição GET
     if res.status_code != 200: # Verifica se a requisição foi bem sucedida
         return "Erro Desconhecido ao buscar email", [] # Retorna erro se não foi bem sucedida
     user_data = res.json().get("user", {}) # Pega os dados do usuário
     email = user_data.get("email", "Sem email") # Pega o email do usuário
     groups_url = f"https://{ZENDESK_DOMAIN}.zendesk.com/api/v2/users/{user_id}/groups.json"
-    response = requests.get(groups_url, auth=auth)
+    response = zendesk_session().get(groups_url)
     groups = [] # Inicializa a lista de grupos
     if response.status_code == 200:
         groups = response.json().get("groups", [])
@@ -125,15 +143,20 @@ def ask_glean(texto_ticket_completo, application_id): # Envia o texto do ticket
     with open(filename, "w", encoding="utf-8") as f:
         f.write("Payload enviado para a Glean:\n\n")
         f.write(json.dumps(payload, indent=2)) 
-    response = requests.post(GLEAN_API_URL, headers=GLEAN_HEADERS, json=payload, stream=True) # Envia o payload para a Glean
-    #print(response.status_code) # Imprime o status da resposta
-    if response.status_code == 200: # Verifica se a resposta foi bem sucedida
-        reply,token= process_response_message_stream(response) # Processa a resposta da Glean, ignorando a segunda variável de token
-        return reply, token # Retorna a resposta
+    try:
+        response = glean_session().post(GLEAN_API_URL, json=payload, stream=True, timeout=GLEAN_TIMEOUT) # Envia o payload para a Glean
+        #print(response.status_code) # Imprime o status da resposta
+        if response.status_code == 200: # Verifica se a resposta foi bem sucedida
+            reply,token= process_response_message_stream(response) # Processa a resposta da Glean, ignorando a segunda variável de token
+            return reply, token # Retorna a resposta
 
-    else: # Se a resposta não foi bem sucedida
-        print("Erro Glean:", response.status_code, response.text) # Imprime o erro
-        return None # Retorna None
+        else: # Se a resposta não foi bem sucedida
+            print("Erro Glean:", response.status_code, response.text) # Imprime o erro
+    except requests.exceptions.Timeout:
+        logging.error(f"Timeout ({GLEAN_TIMEOUT}s) ao chamar a API da Glean.")
+    except requests.exceptions.RequestException as req_err:
+        logging.error(f"Erro de requisição para API da Glean: {req_err}")
+    return None, None # Sem resposta nem token
 ##--------------------------------------------------------------------------##
 def make_system_message(text):  # Novo tipo de mensagem para o sistema da Glean
     return {
@@ -211,8 +234,7 @@ def process_message_fragment(message): # Processa uma mensagem fragmentada e ret
     if message['messageType'] == 'CONTENT': # Verifica se o tipo da mensagem é conteúdo
         for fragment in message.get('fragments', []): # Itera pelos fragmentos da mensagem
             text += fragment.get('text', '') # Adiciona o texto do fragmento ao texto
-        for citation in message.get('citations', []): #Itera pelas citaçoes da mensagem
-            citations += message.get('citations', []) # Adiciona as citações da mensagem
+        citations += message.get('citations', []) # Adiciona as citações da mensagem (uma vez só, não uma por citação)
     return text, citations # Retorna o texto e as citações
 ##--------------------------------------------------------------------------##
 def salvar_resposta_em_txt(ticket_id, resposta):
@@ -222,7 +244,6 @@ def salvar_resposta_em_txt(ticket_id, resposta):
 ##--------------------------------------------------------------------------##
 def post_internal_note_to_zendesk(ticket_id, note_text):
     url = f"https://{ZENDESK_DOMAIN}.zendesk.com/api/v2/tickets/{ticket_id}.json"
-    auth = (ZENDESK_EMAIL, ZENDESK_TOKEN)
     aviso = (
         "⚠️ This is a suggestion made automatically by a *pilot version* of Glean Assistant for Zendesk. I am triggered by tagging Glean on any ticket!\n\n"
         "Please review the veracity and clarity of the answer before sending to the client. Any feedback can be sent to #glean-hub!\n\n"
@@ -236,7 +257,7 @@ def post_internal_note_to_zendesk(ticket_id, note_text):
         }
     }
     try:
-        res = requests.put(url, headers=ZENDESK_HEADERS, auth=auth, json=payload)
+        res = zendesk_session().put(url, json=payload)
         if res.status_code == 200:
             print(f"Resposta postada no ticket {ticket_id}")
         else:
@@ -247,8 +268,7 @@ def post_internal_note_to_zendesk(ticket_id, note_text):
 def buscar_formulario_para_tickets(ticket_id):
         # 1. Buscar os dados do ticket
         url = f"https://{ZENDESK_DOMAIN}.zendesk.com/api/v2/tickets/{ticket_id}.json"
-        auth = (ZENDESK_EMAIL, ZENDESK_TOKEN) # Autenticação com email e token
-        resp = requests.get(url, auth=auth, headers=ZENDESK_HEADERS)
+        resp = zendesk_session().get(url)
         if resp.status_code == 200:
             ticket = resp.json().get("ticket", {})
             ticket_form_id = ticket.get("ticket_form_id")
@@ -287,25 +307,22 @@ def processa_ticket(data):
     texto_ticket_completo = gerar_texto_completo_do_ticket(ticket_id, ticket, comentarios)
     response_from_glean, token = ask_glean(texto_ticket_completo, application_id)
 
-    # 📝 Salvar token e ticket_id no Excel
+    # 📝 Salvar token e ticket_id no armazenamento de tokens
     if token:
-        salvar_token_em_excel(ticket_id, token)
+        salvar_token(ticket_id, token, application_id)
     if response_from_glean:
         post_internal_note_to_zendesk(ticket_id, response_from_glean)
         salvar_resposta_em_txt(ticket_id, response_from_glean)
 ##--------------------------------------------------------------------------##
-def salvar_token_em_excel(ticket_id, token, arquivo="tokens.xlsx"):
-    if os.path.exists(arquivo):
-        wb = load_workbook(arquivo)
-        ws = wb.active
-    else:
-        wb = Workbook()
-        ws = wb.active
-        ws.append(["ticket_id", "tracking_token"])  # cabeçalho
+## Append em SQLite (WAL): seguro com vários workers. A planilha vira só relatório (token_store.py exportar)
+token_store = SqliteTokenStore(TOKEN_STORE_PATH)
 
-    ws.append([ticket_id, token])
-    wb.save(arquivo)
-    print(f"✅ Token salvo para o ticket {ticket_id}: {token}")
+def salvar_token(ticket_id, token, application_id=None):
+    try:
+        token_store.salvar(ticket_id, token, application_id)
+        print(f"✅ Token salvo para o ticket {ticket_id}: {token}")
+    except Exception as e:
+        logging.error(f"Erro ao salvar token do ticket {ticket_id}: {e}", exc_info=True)
 ##--------------------------------------------------------------------------##
 ##--------------------------------------------------------------------------##
 ## Função que recebe o webhook do Zendesk e chama as outras funções
@@ -315,10 +332,16 @@ def zendesk_webhook():
     print("Payload recebido:")
     print(json.dumps(data, indent=2))
 
-    # Dispara a thread e responde já
-    threading.Thread(target=processa_ticket, args=(data,)).start()
+    # Agenda no pool e responde já; se o pool estiver cheio, pede para o Zendesk reenviar depois
+    if ticket_executor.try_submit(processa_ticket, data) is None:
+        print("Pool de workers saturado:", ticket_executor.stats())
+        return {"status": "busy"}, 503, {"Retry-After": "30"}
     return {"status": "received"}, 200
 
+@app.route("/metrics", methods=["GET"]) # Profundidade da fila e utilização dos workers
+def metrics():
+    return ticket_executor.stats(), 200
+
 ##--------------------------------------------------------------------------##
 ## Função principal para executar o Flask apenas quando o script está sendo chamado diretamente
 if __name__ == "__main__": # Executa o Flask
@@ -0,0 +1,26 @@
+"""
+Clientes AWS criados uma vez por container e reaproveitados entre invocações "quentes".
+
+O boto3 só é importado na primeira chamada, então quem não usa DynamoDB/SQS não paga o import.
+"""
+import functools
+import os
+
+
+@functools.lru_cache(maxsize=None)
+def dynamodb_resource(region_name=None):
+    import boto3
+    region_name = region_name or os.environ.get("AWS_REGION_DYNAMODB") or os.environ.get("AWS_REGION")
+    return boto3.resource("dynamodb", region_name=region_name) if region_name else boto3.resource("dynamodb")
+
+
+@functools.lru_cache(maxsize=None)
+def dynamodb_table(table_name, region_name=None):
+    return dynamodb_resource(region_name).Table(table_name)
+
+
+@functools.lru_cache(maxsize=None)
+def sqs_client(region_name=None):
+    import boto3
+    region_name = region_name or os.environ.get("AWS_REGION")
+    return boto3.client("sqs", region_name=region_name) if region_name else boto3.client("sqs")
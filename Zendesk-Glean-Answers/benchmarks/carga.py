@@ -0,0 +1,284 @@
+"""
+Benchmark de carga do pipeline contra os stubs locais do Zendesk e da Glean (benchmarks/stubs.py).
+
+Sobe os stubs, aponta o pipeline para eles e envia webhooks sintéticos a uma taxa fixa
+(chegadas em malha aberta: o envio não espera o ticket anterior terminar):
+
+- processa: chama `processa_ticket` num pool de --concorrencia threads;
+- lambda: `lambda_handler` enfileira numa fila SQLite temporária e o worker (`drenar_fila`)
+  consome com --concorrencia tickets em paralelo;
+- flask: sobe o servidor Flask local (`webhook_glean_zendesk.py`) num subprocesso e posta em
+  /zendesk-to-glean; as latências vêm do /metrics dele.
+
+Relata tickets/s, p50/p95/p99 por etapa (ticket_metrics), chamadas HTTP por ticket por host e
+os contadores dos stubs. `--salvar` grava o resultado em JSON e `--comparar` mostra a variação
+em relação a um resultado salvo, para comparar execuções.
+
+    python benchmarks/carga.py --modo processa --tickets 200 --taxa 20 --concorrencia 8
+    python benchmarks/carga.py --modo lambda --tickets 200 --taxa 20 --salvar base.json
+    python benchmarks/carga.py --modo lambda --tickets 200 --taxa 20 --comparar base.json
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(AQUI)
+for caminho in (RAIZ, AQUI):
+    if caminho not in sys.path:
+        sys.path.insert(0, caminho)
+
+from stubs import ConfigGleanFalso, ConfigZendeskFalso, ServidorGleanFalso, ServidorZendeskFalso
+
+
+def _ambiente_do_pipeline(args, zendesk, glean, tmp):
+    """Variáveis do pipeline apontando para os stubs, sem nenhum serviço da AWS."""
+    return {
+        "AWS_LAMBDA_FUNCTION_NAME": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "benchmark"), # Não carrega o .env
+        "ZENDESK_SUBDOMAIN": "benchmark",
+        "ZENDESK_EMAIL": "benchmark@exemplo.com",
+        "ZENDESK_API_TOKEN": "benchmark",
+        "ZENDESK_API_BASE_URL": f"{zendesk.url}/api/v2",
+        "GLEAN_API_URL": f"{glean.url}/rest/api/v1/chat",
+        "GLEAN_TOKEN": "benchmark",
+        "DEFAULT_GLEAN_APP_ID": "benchmark-app",
+        "ZENDESK_RATE_LIMIT_PER_MINUTE": str(args.zendesk_limite_por_minuto or 100000),
+        "TOKEN_PERSISTENCE_METHOD": "none",
+        "RETRY_STORE": "none",
+        "DEDUP_WINDOW_SECONDS": "0",
+        "GLEAN_CACHE_BACKEND": "memory" if args.cache_glean else "none",
+        "METRICS_RECENT_TICKETS": str(args.tickets + 100),
+        "TICKET_QUEUE_SQLITE_PATH": os.path.join(tmp, "fila.sqlite3") if args.modo == "lambda" else "",
+        "WORKER_BATCH_SIZE": str(args.concorrencia),
+        "WORKER_RETRY_DELAY_SECONDS": "1",
+    }
+
+
+def _payload(i, base_id):
+    ticket_id = base_id + i
+    return {"ticket": {"id": ticket_id, "updated_at": f"2024-01-01T00:00:00Z#{ticket_id}"}}
+
+
+def _em_taxa_fixa(n, taxa, enviar):
+    """Chama enviar(i) para i em 0..n-1 no instante t0 + i/taxa. Retorna o t0."""
+    t0 = time.perf_counter()
+    for i in range(n):
+        atraso = t0 + i / taxa - time.perf_counter()
+        if atraso > 0:
+            time.sleep(atraso)
+        enviar(i)
+    return t0
+
+
+def _esperar(condicao, timeout):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+##--------------------------------------------------------------------------##
+## Modos
+##--------------------------------------------------------------------------##
+def rodar_processa(args):
+    import ticket_metrics
+    import webhook_glean_zendesk
+
+    resultados, fim_a_fim = [], []
+    lock = threading.Lock()
+
+    def executar(payload, chegada):
+        ok = webhook_glean_zendesk.processa_ticket(payload)
+        with lock:
+            resultados.append(ok is True)
+            fim_a_fim.append((time.perf_counter() - chegada) * 1000) # Inclui a espera por uma thread livre
+
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as pool:
+        t0 = _em_taxa_fixa(args.tickets, args.taxa, lambda i: pool.submit(executar, _payload(i, args.base_id), time.perf_counter()))
+    duracao = time.perf_counter() - t0
+    fim_a_fim.sort()
+    return duracao, sum(resultados), ticket_metrics.resumo(ticket_metrics.recentes()), fim_a_fim
+
+
+def rodar_lambda(args):
+    import lambda_zendesk_glean
+    import ticket_metrics
+
+    parar = threading.Event()
+
+    def worker():
+        while not parar.is_set():
+            lambda_zendesk_glean.drenar_fila(max_workers=args.concorrencia, parar_quando_vazia=True)
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=worker, name="benchmark-worker", daemon=True)
+    thread.start()
+    t0 = _em_taxa_fixa(args.tickets, args.taxa, lambda i: lambda_zendesk_glean.lambda_handler({"body": json.dumps(_payload(i, args.base_id))}, None))
+    _esperar(lambda: len(ticket_metrics.recentes()) >= args.tickets, args.timeout)
+    duracao = time.perf_counter() - t0
+    parar.set()
+    thread.join(timeout=30)
+    registros = ticket_metrics.recentes()
+    return duracao, sum(1 for r in registros if r["resultado"] is True), ticket_metrics.resumo(registros), None
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rodar_flask(args):
+    porta = _porta_livre()
+    env = dict(os.environ, FLASK_RUN_HOST="127.0.0.1", FLASK_RUN_PORT=str(porta),
+               FLASK_WORKER_POOL_SIZE=str(args.concorrencia), FLASK_WORKER_QUEUE_SIZE=str(args.tickets + 10))
+    env.pop("AWS_LAMBDA_FUNCTION_NAME", None) # O servidor Flask é o caminho local
+    servidor = subprocess.Popen([sys.executable, os.path.join(RAIZ, "webhook_glean_zendesk.py")], cwd=RAIZ, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{porta}"
+
+    def metricas():
+        with urllib.request.urlopen(f"{base}/metrics", timeout=5) as r:
+            return json.loads(r.read())
+
+    def no_ar():
+        try:
+            metricas()
+            return True
+        except OSError:
+            return False
+
+    def enviar(i):
+        dados = json.dumps(_payload(i, args.base_id)).encode("utf-8")
+        pedido = urllib.request.Request(f"{base}/zendesk-to-glean", data=dados, headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(pedido, timeout=10).close()
+        except OSError as e:
+            print(f"Webhook {i} recusado: {e}", file=sys.stderr)
+
+    try:
+        if not _esperar(no_ar, 30):
+            raise RuntimeError("O servidor Flask local não subiu (Flask instalado?).")
+        t0 = _em_taxa_fixa(args.tickets, args.taxa, enviar)
+        _esperar(lambda: metricas()["latencia"]["tickets"] >= args.tickets, args.timeout)
+        duracao = time.perf_counter() - t0
+        latencia = metricas()["latencia"]
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=30)
+    return duracao, None, latencia, None
+
+
+MODOS = {"processa": rodar_processa, "lambda": rodar_lambda, "flask": rodar_flask}
+
+
+##--------------------------------------------------------------------------##
+## Relatório
+##--------------------------------------------------------------------------##
+def _percentis(valores):
+    from ticket_metrics import PERCENTIS, percentil
+    return {f"p{p}": round(percentil(valores, p), 1) for p in PERCENTIS} if valores else {}
+
+
+def imprimir(resultado, base=None):
+    def variacao(atual, anterior):
+        if anterior in (None, 0) or atual is None:
+            return ""
+        return f" ({(atual - anterior) / anterior * 100:+.1f}%)"
+
+    b = base or {}
+    print(f"\nModo {resultado['modo']}: {resultado['tickets_concluidos']} de {resultado['tickets']} ticket(s) "
+          f"em {resultado['duracao_s']:.2f}s")
+    print(f"Vazão: {resultado['tickets_por_s']:.2f} tickets/s{variacao(resultado['tickets_por_s'], b.get('tickets_por_s'))}")
+    if resultado["sucesso"] is not None:
+        print(f"Notas postadas: {resultado['sucesso']}")
+    if resultado.get("fim_a_fim_ms"):
+        print("Fim a fim (ms): " + ", ".join(f"{k}={v}" for k, v in resultado["fim_a_fim_ms"].items()))
+
+    print(f"\n{'etapa':<24}{'n':>6}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    etapas_base = b.get("etapas_ms", {})
+    for nome, estat in resultado["etapas_ms"].items():
+        anterior = etapas_base.get(nome, {})
+        print(f"{nome:<24}{estat['n']:>6}{estat['p50']:>12.1f}{estat['p95']:>12.1f}{estat['p99']:>12.1f}"
+              f"{variacao(estat['p95'], anterior.get('p95'))}")
+    print("\nChamadas HTTP por ticket:")
+    for host, media in resultado["http_chamadas_por_ticket"].items():
+        print(f"  {host}: {media}")
+    for nome, contadores in resultado["stubs"].items():
+        print(f"\nStub {nome}: {contadores}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga do pipeline com stubs locais do Zendesk e da Glean.")
+    parser.add_argument("--modo", choices=sorted(MODOS), default="processa")
+    parser.add_argument("--tickets", type=int, default=100)
+    parser.add_argument("--taxa", type=float, default=10.0, help="Webhooks por segundo")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--base-id", type=int, default=100000, help="ID do primeiro ticket sintético")
+    parser.add_argument("--timeout", type=float, default=600, help="Espera máxima pelo fim do processamento (s)")
+    parser.add_argument("--cache-glean", action="store_true", help="Mantém o cache de respostas da Glean ligado")
+    parser.add_argument("--zendesk-latencia-ms", type=float, default=30)
+    parser.add_argument("--zendesk-limite-por-minuto", type=int, default=0)
+    parser.add_argument("--zendesk-prob-429", type=float, default=0.0)
+    parser.add_argument("--comentarios-por-ticket", type=int, default=8)
+    parser.add_argument("--glean-ttft-ms", type=float, default=400)
+    parser.add_argument("--glean-tokens", type=int, default=150)
+    parser.add_argument("--glean-tokens-por-segundo", type=float, default=100)
+    parser.add_argument("--glean-citacoes", type=int, default=3)
+    parser.add_argument("--salvar", help="Grava o resultado em JSON")
+    parser.add_argument("--comparar", help="Resultado JSON salvo antes, para comparar")
+    args = parser.parse_args(argv)
+
+    zendesk = ServidorZendeskFalso(ConfigZendeskFalso(
+        latencia_ms=args.zendesk_latencia_ms, limite_por_minuto=args.zendesk_limite_por_minuto,
+        prob_429=args.zendesk_prob_429, comentarios_por_ticket=args.comentarios_por_ticket,
+    )).iniciar()
+    glean = ServidorGleanFalso(ConfigGleanFalso(
+        ttft_ms=args.glean_ttft_ms, tokens=args.glean_tokens,
+        tokens_por_segundo=args.glean_tokens_por_segundo, citacoes=args.glean_citacoes,
+    )).iniciar()
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-carga-") as tmp:
+        os.environ.update({k: v for k, v in _ambiente_do_pipeline(args, zendesk, glean, tmp).items() if v})
+        try:
+            duracao, sucesso, latencia, fim_a_fim = MODOS[args.modo](args)
+        finally:
+            zendesk.parar()
+            glean.parar()
+
+    resultado = {
+        "modo": args.modo,
+        "parametros": vars(args),
+        "tickets": args.tickets,
+        "tickets_concluidos": latencia["tickets"],
+        "duracao_s": round(duracao, 3),
+        "tickets_por_s": round(latencia["tickets"] / duracao, 3) if duracao else 0.0,
+        "sucesso": sucesso,
+        "fim_a_fim_ms": _percentis(fim_a_fim),
+        "etapas_ms": latencia["etapas_ms"],
+        "http_chamadas_por_ticket": latencia["http_chamadas_por_ticket"],
+        "stubs": {"zendesk": dict(zendesk.contadores), "glean": dict(glean.contadores)},
+    }
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+    imprimir(resultado, base)
+    if args.salvar:
+        with open(args.salvar, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"\nResultado salvo em {args.salvar}")
+
+
+if __name__ == "__main__":
+    main()
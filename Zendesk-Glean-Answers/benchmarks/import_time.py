@@ -0,0 +1,122 @@
+"""
+Benchmark do tempo de import (cold start) do entry point do Lambda.
+
+Cada amostra é um interpretador novo, como em um cold start: mede só o `import`, sem o
+tempo de subir o Python. Compara o import do Lambda na árvore atual com o mesmo import numa
+revisão do git extraída com `git archive` num diretório temporário: o "antes" é o código
+real daquela revisão, com os imports que ela fazia. Por padrão é o merge base com a branch
+principal (`--base`, padrão main), ou seja, o código de produção que este branch altera.
+
+    python benchmarks/import_time.py                  # 15 amostras de cada cenário
+    python benchmarks/import_time.py -n 30 --top 20   # mais amostras e os 20 imports mais caros
+    python benchmarks/import_time.py --antes v1.2.0   # compara com outra revisão (tag, branch, SHA)
+"""
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_DO_LAMBDA = "import lambda_zendesk_glean"
+BRANCH_BASE = "main" # O "antes" padrão é o merge base com ela
+
+_MEDIR = "import time; t = time.perf_counter(); {codigo}; print(time.perf_counter() - t)"
+
+
+def _ambiente(raiz):
+    env = dict(os.environ)
+    env.setdefault("AWS_LAMBDA_FUNCTION_NAME", "benchmark") # Mesmo caminho de import do Lambda
+    env["PYTHONPATH"] = raiz + os.pathsep + env.get("PYTHONPATH", "")
+    env["PYTHONDONTWRITEBYTECODE"] = "1" # O /var/task do Lambda é somente leitura
+    return env
+
+
+def revisao_base(branch):
+    """Retorna o merge base de HEAD com `branch` (remota ou local); RuntimeError se não houver."""
+    for ref in (f"origin/{branch}", branch):
+        r = subprocess.run(["git", "merge-base", "HEAD", ref], cwd=RAIZ, capture_output=True, text=True)
+        if r.returncode == 0 and r.stdout.strip():
+            return r.stdout.strip()
+    raise RuntimeError(f"sem merge base com '{branch}'; informe a revisão com --antes <rev>")
+
+
+def extrair_revisao(revisao, destino):
+    """Extrai este diretório (RAIZ) na `revisao` do git para `destino` e retorna `destino`."""
+    r = subprocess.run(["git", "archive", revisao, "--", "."], cwd=RAIZ, capture_output=True)
+    if r.returncode != 0:
+        raise RuntimeError(f"git archive: {r.stderr.decode(errors='replace').strip() or 'falhou'}")
+    with tarfile.open(fileobj=io.BytesIO(r.stdout)) as tar:
+        tar.extractall(destino)
+    return destino
+
+
+def medir(codigo, amostras, raiz=RAIZ):
+    """Retorna a lista de tempos (s) do import em `amostras` interpretadores novos, com `raiz` no path."""
+    tempos = []
+    for _ in range(amostras):
+        r = subprocess.run(
+            [sys.executable, "-c", _MEDIR.format(codigo=codigo)],
+            cwd=raiz, env=_ambiente(raiz), capture_output=True, text=True,
+        )
+        if r.returncode != 0:
+            raise RuntimeError(r.stderr.strip().splitlines()[-1] if r.stderr.strip() else "falhou")
+        tempos.append(float(r.stdout.strip().splitlines()[-1]))
+    return tempos
+
+
+def imports_mais_caros(codigo, top, profundidade_max=2):
+    """
+    Usa `-X importtime` e retorna [(cumulativo_us, modulo)] dos imports mais caros até
+    `profundidade_max` níveis abaixo do módulo importado (1 = imports diretos dele).
+    """
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=RAIZ, env=_ambiente(RAIZ), capture_output=True, text=True,
+    )
+    linhas = []
+    for linha in r.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, cumulativo, nome = linha[len("import time:"):].split("|")
+        profundidade = (len(nome) - len(nome.lstrip()) - 1) // 2 # O importtime indenta 2 espaços por nível
+        if 1 <= profundidade <= profundidade_max:
+            linhas.append((int(cumulativo), nome.strip()))
+    return sorted(linhas, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--amostras", type=int, default=15)
+    parser.add_argument("--top", type=int, default=10, help="Imports mais caros da árvore atual (0 desativa)")
+    parser.add_argument("--antes", help="Revisão do git do cenário 'antes' (padrão: merge base com --base)")
+    parser.add_argument("--base", default=BRANCH_BASE, help=f"Branch cujo merge base é o 'antes' padrão (padrão: {BRANCH_BASE})")
+    args = parser.parse_args(argv)
+
+    print(f"Python {sys.version.split()[0]} | {args.amostras} amostra(s) por cenário")
+    print(f"{'cenário':<40} {'mín':>8} {'mediana':>8} {'p90':>8}  (ms)")
+    with tempfile.TemporaryDirectory(prefix="import_time_") as temporario:
+        antes = args.antes or f"merge base com {args.base}"
+        revisao = lambda: args.antes or revisao_base(args.base)
+        cenarios = [("atual (lazy)", lambda: RAIZ), (f"antes ({antes})", lambda: extrair_revisao(revisao(), temporario))]
+        for nome, raiz in cenarios:
+            try:
+                tempos = sorted(medir(IMPORT_DO_LAMBDA, args.amostras, raiz=raiz()))
+            except RuntimeError as e:
+                print(f"{nome:<40} indisponível: {e}")
+                continue
+            p90 = tempos[min(len(tempos) - 1, int(round(0.9 * (len(tempos) - 1))))]
+            print(f"{nome:<40} {tempos[0] * 1000:>8.1f} {statistics.median(tempos) * 1000:>8.1f} {p90 * 1000:>8.1f}")
+
+    if args.top:
+        print(f"\nImports mais caros ({IMPORT_DO_LAMBDA}, árvore atual):")
+        for cumulativo, nome in imports_mais_caros(IMPORT_DO_LAMBDA, args.top):
+            print(f"{cumulativo / 1000:>10.1f} ms  {nome}")
+
+
+if __name__ == "__main__":
+    main()
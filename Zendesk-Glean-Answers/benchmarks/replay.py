@@ -0,0 +1,281 @@
+"""
+Replay determinístico de tickets capturados em produção (ticket_capture.py, CAPTURE_DIR).
+
+Sobe um servidor local que responde no lugar do Zendesk e da Glean com as trocas gravadas,
+no mesmo ritmo em que chegaram (cabeçalhos e cada linha do corpo, inclusive o TTFT do stream da
+Glean), e reexecuta `processa_ticket` com os payloads gravados. Assim uma otimização pode ser
+medida contra tráfego real, sem tocar em produção:
+
+- as requisições são casadas por (método, serviço, caminho, query), preferindo a gravação com o
+  mesmo corpo; sem gravação, o servidor responde 404 e conta `sem_gravacao`;
+- --escala multiplica os tempos gravados (1 = latência real, 0 = sem espera);
+- os tickets chegam nos intervalos gravados (× --escala) ou todos de uma vez com --imediato,
+  processados por --concorrencia threads;
+- --perfil roda os tickets em sequência sob o cProfile e mostra as funções mais caras.
+
+O relatório é o mesmo do benchmark de carga (benchmarks/carga.py), inclusive --salvar e --comparar.
+
+    python benchmarks/replay.py capturas/
+    python benchmarks/replay.py capturas/ --escala 0 --imediato --concorrencia 8 --repeticoes 5
+    python benchmarks/replay.py capturas/ --escala 0 --perfil replay.prof
+"""
+import argparse
+import cProfile
+import datetime
+import glob
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(AQUI)
+for caminho in (RAIZ, AQUI):
+    if caminho not in sys.path:
+        sys.path.insert(0, caminho)
+
+import ticket_capture
+from carga import _percentis, imprimir
+from stubs import _HandlerBase, _Servidor
+
+SERVICOS = ("zendesk", "glean")
+BASES_PADRAO = {"zendesk": "/api/v2", "glean": "/rest/api/v1/chat"}
+
+
+def carregar_capturas(caminhos):
+    """Capturas dos arquivos informados e dos *.json.gz dos diretórios, em ordem de captura."""
+    arquivos = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            arquivos.extend(sorted(glob.glob(os.path.join(caminho, "*.json.gz"))))
+        else:
+            arquivos.append(caminho)
+    capturas = [ticket_capture.carregar(arquivo) for arquivo in arquivos]
+    capturas.sort(key=lambda c: c["capturado_em"])
+    return capturas
+
+
+def _servico_da_url(url, bases):
+    host = urlsplit(url).netloc
+    for servico, base in bases.items():
+        if base and urlsplit(base).netloc == host:
+            return servico
+    return "zendesk" if "zendesk" in host else "glean" # Captura sem as URLs base da configuração
+
+
+def _chave(metodo, servico, url):
+    partes = urlsplit(url)
+    return metodo, servico, partes.path, tuple(sorted(parse_qsl(partes.query, keep_blank_values=True)))
+
+
+##--------------------------------------------------------------------------##
+## Servidor de replay
+##--------------------------------------------------------------------------##
+class ServidorReplay(_Servidor):
+    """Responde com as trocas gravadas; cada serviço fica sob um prefixo (/zendesk, /glean)."""
+
+    def __init__(self, capturas, escala=1.0, porta=0):
+        super().__init__(_HandlerReplay, porta)
+        self.escala = escala
+        self._gravacoes = defaultdict(deque) # chave -> trocas, servidas em rodízio
+        self._gravacoes_por_caminho = defaultdict(deque)
+        for captura in capturas:
+            bases = captura.get("bases") or {}
+            for troca in captura["trocas"]:
+                chave = _chave(troca["metodo"], _servico_da_url(troca["url"], bases), troca["url"])
+                self._gravacoes[chave].append(troca)
+                self._gravacoes_por_caminho[chave[:3]].append(troca)
+
+    def gravacao(self, metodo, servico, caminho_com_query, corpo):
+        chave = _chave(metodo, servico, caminho_com_query)
+        with self._lock:
+            for fila in (self._gravacoes.get(chave), self._gravacoes_por_caminho.get(chave[:3])):
+                if not fila:
+                    continue
+                escolhida = next((t for t in fila if corpo and t["corpo"] == corpo), fila[0])
+                fila.remove(escolhida)
+                fila.append(escolhida) # Rodízio: a mesma rota gravada várias vezes alterna entre as gravações
+                return escolhida
+        return None
+
+    def url_base(self, servico, base_gravada):
+        return f"{self.url}/{servico}{urlsplit(base_gravada).path.rstrip('/')}"
+
+
+class _HandlerReplay(_HandlerBase):
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_POST(self):
+        self._atender("POST")
+
+    def do_PUT(self):
+        self._atender("PUT")
+
+    def do_DELETE(self):
+        self._atender("DELETE")
+
+    def _atender(self, metodo):
+        inicio = time.perf_counter()
+        stub = self.server.stub
+        corpo = self._ler_corpo().decode("utf-8", errors="replace") or None
+        servico, _, caminho = self.path.lstrip("/").partition("/")
+        troca = stub.gravacao(metodo, servico, "/" + caminho, corpo) if servico in SERVICOS else None
+        if troca is None:
+            stub.contar("sem_gravacao")
+            return self._responder_json(404, {"error": f"sem gravação para {metodo} {self.path}"})
+        stub.contar(f"{servico} {metodo}")
+
+        def esperar_ate(ms):
+            atraso = inicio + (ms or 0) * stub.escala / 1000 - time.perf_counter()
+            if atraso > 0:
+                time.sleep(atraso)
+
+        esperar_ate(troca["cabecalhos_ms"])
+        if troca["erro"]: # Falha de rede gravada (timeout, conexão recusada): o cliente vê a conexão cair
+            stub.contar(f"erro {troca['erro']}")
+            self.close_connection = True
+            return
+        self.send_response(troca["status"])
+        for nome, valor in troca["cabecalhos"].items():
+            self.send_header(nome, valor)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for ms, texto in troca["pedacos"]:
+            esperar_ate(ms)
+            dados = texto.encode("utf-8")
+            self.wfile.write(f"{len(dados):X}\r\n".encode("ascii") + dados + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+##--------------------------------------------------------------------------##
+## Execução
+##--------------------------------------------------------------------------##
+def _ambiente_do_replay(servidor, capturas, total):
+    """Variáveis do pipeline apontando para o servidor de replay, sem cache, dedup nem AWS."""
+    bases = dict(BASES_PADRAO) # As capturas de um mesmo ambiente compartilham as bases
+    bases.update({k: v for k, v in (capturas[0].get("bases") or {}).items() if v})
+    return {
+        "AWS_LAMBDA_FUNCTION_NAME": os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "replay"), # Não carrega o .env
+        "ZENDESK_SUBDOMAIN": "replay",
+        "ZENDESK_EMAIL": "replay@exemplo.com",
+        "ZENDESK_API_TOKEN": "replay",
+        "ZENDESK_API_BASE_URL": servidor.url_base("zendesk", bases["zendesk"]),
+        "GLEAN_API_URL": servidor.url_base("glean", bases["glean"]),
+        "GLEAN_TOKEN": "replay",
+        "DEFAULT_GLEAN_APP_ID": os.environ.get("DEFAULT_GLEAN_APP_ID", "replay-app"),
+        "ZENDESK_RATE_LIMIT_PER_MINUTE": "100000",
+        "TOKEN_PERSISTENCE_METHOD": "none",
+        "RETRY_STORE": "none",
+        "DEDUP_WINDOW_SECONDS": "0",
+        "GLEAN_CACHE_BACKEND": "none",
+        "METRICS_RECENT_TICKETS": str(total + 100),
+        "CAPTURE_DIR": "", # Não recaptura o próprio replay
+    }
+
+
+def _chegadas(capturas, escala, imediato):
+    """Instante (s desde o início) de cada ticket: os intervalos gravados × escala, ou 0."""
+    if imediato or not capturas:
+        return [0.0] * len(capturas)
+    instantes = [datetime.datetime.fromisoformat(c["capturado_em"].rstrip("Z")) for c in capturas]
+    return [(t - instantes[0]).total_seconds() * escala for t in instantes]
+
+
+def rodar(capturas, chegadas, concorrencia, perfil=None):
+    import ticket_metrics
+    import webhook_glean_zendesk
+
+    resultados, fim_a_fim = [], []
+    lock = threading.Lock()
+
+    def executar(payload, chegada):
+        ok = webhook_glean_zendesk.processa_ticket(payload)
+        with lock:
+            resultados.append(ok is True)
+            fim_a_fim.append((time.perf_counter() - chegada) * 1000)
+
+    t0 = time.perf_counter()
+    if perfil:
+        profiler = cProfile.Profile() # O cProfile só enxerga a thread atual: os tickets rodam em sequência
+        profiler.enable()
+        for captura in capturas:
+            executar(captura["payload"], time.perf_counter())
+        profiler.disable()
+        profiler.dump_stats(perfil)
+    else:
+        with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+            for captura, instante in zip(capturas, chegadas):
+                atraso = t0 + instante - time.perf_counter()
+                if atraso > 0:
+                    time.sleep(atraso)
+                pool.submit(executar, captura["payload"], time.perf_counter())
+    duracao = time.perf_counter() - t0
+    fim_a_fim.sort()
+    return duracao, sum(resultados), ticket_metrics.resumo(ticket_metrics.recentes()), fim_a_fim
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay de tickets capturados contra um servidor local com as respostas gravadas.")
+    parser.add_argument("capturas", nargs="+", help="Arquivos .json.gz ou diretórios de captura (CAPTURE_DIR)")
+    parser.add_argument("--escala", type=float, default=1.0, help="Multiplica latências e intervalos gravados (0 = sem espera)")
+    parser.add_argument("--imediato", action="store_true", help="Envia todos os tickets de uma vez")
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--repeticoes", type=int, default=1, help="Repete o conjunto de capturas")
+    parser.add_argument("--perfil", help="Grava o perfil do cProfile neste arquivo (tickets em sequência)")
+    parser.add_argument("--perfil-linhas", type=int, default=30)
+    parser.add_argument("--salvar", help="Grava o resultado em JSON")
+    parser.add_argument("--comparar", help="Resultado JSON salvo antes, para comparar")
+    args = parser.parse_args(argv)
+
+    capturas = carregar_capturas(args.capturas)
+    if not capturas:
+        parser.error("Nenhuma captura encontrada.")
+    chegadas = _chegadas(capturas, args.escala, args.imediato)
+    ciclo = chegadas[-1] + (0.0 if args.imediato else 1.0) # Cada repetição começa depois da anterior
+    chegadas = [t + ciclo * r for r in range(args.repeticoes) for t in chegadas]
+    capturas = capturas * args.repeticoes
+
+    servidor = ServidorReplay(capturas, escala=args.escala).iniciar()
+    os.environ.update(_ambiente_do_replay(servidor, capturas, len(capturas)))
+    try:
+        duracao, sucesso, latencia, fim_a_fim = rodar(capturas, chegadas, args.concorrencia, args.perfil)
+    finally:
+        servidor.parar()
+
+    resultado = {
+        "modo": "replay",
+        "parametros": vars(args),
+        "tickets": len(capturas),
+        "tickets_concluidos": latencia["tickets"],
+        "duracao_s": round(duracao, 3),
+        "tickets_por_s": round(latencia["tickets"] / duracao, 3) if duracao else 0.0,
+        "sucesso": sucesso,
+        "fim_a_fim_ms": _percentis(fim_a_fim),
+        "etapas_ms": latencia["etapas_ms"],
+        "http_chamadas_por_ticket": latencia["http_chamadas_por_ticket"],
+        "stubs": {"replay": dict(servidor.contadores)},
+    }
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+    imprimir(resultado, base)
+    if args.perfil:
+        print(f"\nPerfil salvo em {args.perfil}:\n")
+        pstats.Stats(args.perfil).sort_stats("cumulative").print_stats(args.perfil_linhas)
+    if args.salvar:
+        with open(args.salvar, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"\nResultado salvo em {args.salvar}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Servidores locais que imitam o Zendesk e a Glean, para benchmarks sem tocar em produção.
+
+Zendesk (`ServidorZendeskFalso`), com os endpoints usados pelo pipeline:
+- GET  /api/v2/tickets/{id}.json              (com comment_count)
+- GET  /api/v2/tickets/{id}/comments.json     (paginação por cursor, include=users)
+- GET  /api/v2/users/show_many.json           (include=groups)
+- GET  /api/v2/users/{id}/groups.json
+- PUT  /api/v2/tickets/{id}.json              (nota interna)
+Latência configurável e 429 com Retry-After, seja por um limite por minuto (com os cabeçalhos
+X-Rate-Limit / X-Rate-Limit-Remaining), seja por uma probabilidade fixa.
+
+Glean (`ServidorGleanFalso`): POST em qualquer caminho devolve um stream de chat (linhas
+JSON, chunked) com TTFT, tokens por segundo, quantidade de fragmentos e de citações ajustáveis.
+
+Os dois contam as requisições por rota. Para rodá-los sozinhos (ex.: com o Flask local):
+
+    python benchmarks/stubs.py --zendesk-porta 8081 --glean-porta 8082 --glean-tokens-por-segundo 200
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+@dataclass
+class ConfigZendeskFalso:
+    latencia_ms: float = 30.0
+    jitter_ms: float = 10.0
+    comentarios_por_ticket: int = 8
+    tamanho_comentario: int = 400 # Caracteres por corpo de comentário
+    agentes: int = 40
+    usuarios_finais: int = 200
+    grupos: int = 10
+    ticket_form_id: Optional[int] = None
+    limite_por_minuto: int = 0 # 0 = sem rate limit
+    prob_429: float = 0.0
+    retry_after: int = 1
+    semente: int = 42
+
+
+@dataclass
+class ConfigGleanFalso:
+    ttft_ms: float = 400.0
+    tokens: int = 150 # Fragmentos de texto no stream
+    tokens_por_segundo: float = 100.0
+    citacoes: int = 3
+    prob_erro: float = 0.0 # Probabilidade de responder 503
+
+
+class _Servidor:
+    """Base: ThreadingHTTPServer em um thread de fundo, numa porta livre (ou a informada)."""
+
+    def __init__(self, handler, porta=0, host="127.0.0.1"):
+        self.httpd = ThreadingHTTPServer((host, porta), handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.contadores = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self.httpd.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def contar(self, rota):
+        with self._lock:
+            self.contadores[rota] += 1
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _HandlerBase(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, como o pool de conexões do pipeline espera
+
+    def log_message(self, *args): # Silencioso: o benchmark não deve medir o log do stub
+        pass
+
+    def _ler_corpo(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(tamanho) if tamanho else b""
+
+    def _responder_json(self, status, corpo, headers=None):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, str(valor))
+        self.end_headers()
+        self.wfile.write(dados)
+
+
+##--------------------------------------------------------------------------##
+## Zendesk
+##--------------------------------------------------------------------------##
+class ServidorZendeskFalso(_Servidor):
+
+    def __init__(self, config=None, porta=0):
+        super().__init__(_HandlerZendesk, porta)
+        self.config = config or ConfigZendeskFalso()
+        self._rng = random.Random(self.config.semente)
+        self._janela_inicio = time.monotonic()
+        self._usadas_na_janela = 0
+        self.notas = Counter() # ticket_id -> notas postadas
+        ids_grupos = [9000 + g for g in range(self.config.grupos)]
+        self.grupos = {g: f"Grupo {g - 9000}" for g in ids_grupos}
+        self.usuarios = {}
+        for i in range(self.config.agentes):
+            uid = 1000 + i
+            self.usuarios[uid] = {"id": uid, "email": f"agente{i}@exemplo.com", "role": "agent",
+                                  "group_ids": self._rng.sample(ids_grupos, k=min(2, len(ids_grupos)))}
+        for i in range(self.config.usuarios_finais):
+            uid = 5000 + i
+            self.usuarios[uid] = {"id": uid, "email": f"cliente{i}@exemplo.com", "role": "end-user"}
+
+    def comentarios(self, ticket_id):
+        """Comentários determinísticos do ticket (em ordem cronológica)."""
+        rng = random.Random(f"{self.config.semente}:{ticket_id}")
+        agentes = [u for u in self.usuarios.values() if u["role"] == "agent"]
+        clientes = [u for u in self.usuarios.values() if u["role"] == "end-user"]
+        cliente = rng.choice(clientes)["id"] if clientes else None
+        comentarios = []
+        for n in range(self.config.comentarios_por_ticket):
+            autor = cliente if n % 2 == 0 or not agentes else rng.choice(agentes)["id"]
+            palavras = []
+            while sum(len(p) + 1 for p in palavras) < self.config.tamanho_comentario:
+                palavras.append(rng.choice(("pedido", "pagamento", "erro", "checkout", "integração", "API", "loja", "prazo", "status")))
+            comentarios.append({
+                "id": int(ticket_id) * 1000 + n + 1, "author_id": autor, "body": " ".join(palavras), "public": True,
+                "created_at": f"2024-01-01T00:{n // 60:02d}:{n % 60:02d}Z",
+                "attachments": [{"id": n, "file_name": "log.txt", "content_url": "https://exemplo/anexo", "size": 1024}],
+            })
+        return comentarios
+
+    def rate_limit(self):
+        """None se a requisição pode ser atendida, ou os cabeçalhos do 429."""
+        c = self.config
+        with self._lock:
+            if c.prob_429 and self._rng.random() < c.prob_429:
+                return {"Retry-After": c.retry_after}
+            if not c.limite_por_minuto:
+                return None
+            agora = time.monotonic()
+            if agora - self._janela_inicio >= 60:
+                self._janela_inicio, self._usadas_na_janela = agora, 0
+            if self._usadas_na_janela >= c.limite_por_minuto:
+                return {"Retry-After": max(1, int(60 - (agora - self._janela_inicio)) + 1),
+                        "X-Rate-Limit": c.limite_por_minuto, "X-Rate-Limit-Remaining": 0}
+            self._usadas_na_janela += 1
+            return None
+
+    def cabecalhos_rate_limit(self):
+        c = self.config
+        if not c.limite_por_minuto:
+            return {}
+        with self._lock:
+            return {"X-Rate-Limit": c.limite_por_minuto,
+                    "X-Rate-Limit-Remaining": max(0, c.limite_por_minuto - self._usadas_na_janela)}
+
+    def latencia(self):
+        with self._lock:
+            jitter = self._rng.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        time.sleep(max(0.0, self.config.latencia_ms + jitter) / 1000)
+
+
+_ROTAS_ZENDESK = [
+    ("GET", re.compile(r"^/api/v2/tickets/(\d+)\.json$"), "ticket"),
+    ("GET", re.compile(r"^/api/v2/tickets/(\d+)/comments\.json$"), "comentarios"),
+    ("GET", re.compile(r"^/api/v2/users/show_many\.json$"), "usuarios_lote"),
+    ("GET", re.compile(r"^/api/v2/users/(\d+)/groups\.json$"), "grupos_usuario"),
+    ("PUT", re.compile(r"^/api/v2/tickets/(\d+)\.json$"), "nota"),
+]
+
+
+class _HandlerZendesk(_HandlerBase):
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_PUT(self):
+        self._atender("PUT")
+
+    def _atender(self, metodo):
+        stub = self.server.stub
+        self._ler_corpo()
+        partes = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+        for metodo_rota, padrao, nome in _ROTAS_ZENDESK:
+            achou = padrao.match(partes.path) if metodo == metodo_rota else None
+            if achou:
+                break
+        else:
+            stub.contar("404")
+            return self._responder_json(404, {"error": "RecordNotFound"})
+
+        stub.latencia()
+        bloqueio = stub.rate_limit()
+        if bloqueio is not None:
+            stub.contar("429")
+            return self._responder_json(429, {"error": "TooManyRequests"}, bloqueio)
+        stub.contar(nome)
+        corpo = getattr(self, f"_rota_{nome}")(stub, params, *achou.groups())
+        self._responder_json(200, corpo, stub.cabecalhos_rate_limit())
+
+    def _rota_ticket(self, stub, params, ticket_id):
+        ticket = {"id": int(ticket_id), "subject": f"Problema no pedido do ticket {ticket_id}",
+                  "ticket_form_id": stub.config.ticket_form_id, "status": "open"}
+        if "comment_count" in params.get("include", ""):
+            ticket["comment_count"] = stub.config.comentarios_por_ticket
+        return {"ticket": ticket}
+
+    def _rota_comentarios(self, stub, params, ticket_id):
+        comentarios = stub.comentarios(ticket_id)
+        if params.get("sort", "created_at").startswith("-"):
+            comentarios.reverse()
+        tamanho = int(params.get("page[size]", 100))
+        inicio = int(params.get("page[after]", 0))
+        pagina = comentarios[inicio:inicio + tamanho]
+        mais = inicio + tamanho < len(comentarios)
+        corpo = {"comments": pagina, "meta": {"has_more": mais, "after_cursor": str(inicio + tamanho) if mais else None}}
+        if "users" in params.get("include", ""):
+            ids = {c["author_id"] for c in pagina}
+            corpo["users"] = [stub.usuarios[i] for i in ids if i in stub.usuarios]
+        return corpo
+
+    def _rota_usuarios_lote(self, stub, params):
+        ids = [int(i) for i in params.get("ids", "").split(",") if i]
+        usuarios = [stub.usuarios[i] for i in ids if i in stub.usuarios]
+        grupos = {g for u in usuarios for g in u.get("group_ids", ())}
+        return {"users": usuarios, "groups": [{"id": g, "name": stub.grupos[g]} for g in grupos]}
+
+    def _rota_grupos_usuario(self, stub, params, user_id):
+        usuario = stub.usuarios.get(int(user_id), {})
+        return {"groups": [{"id": g, "name": stub.grupos[g]} for g in usuario.get("group_ids", ())]}
+
+    def _rota_nota(self, stub, params, ticket_id):
+        with stub._lock:
+            stub.notas[ticket_id] += 1
+        return {"ticket": {"id": int(ticket_id)}}
+
+
+##--------------------------------------------------------------------------##
+## Glean
+##--------------------------------------------------------------------------##
+class ServidorGleanFalso(_Servidor):
+
+    def __init__(self, config=None, porta=0):
+        super().__init__(_HandlerGlean, porta)
+        self.config = config or ConfigGleanFalso()
+        self._sequencia = 0
+
+    def proximo_id(self):
+        with self._lock:
+            self._sequencia += 1
+            return self._sequencia
+
+
+class _HandlerGlean(_HandlerBase):
+
+    def do_POST(self):
+        stub = self.server.stub
+        c = stub.config
+        self._ler_corpo()
+        if c.prob_erro and random.random() < c.prob_erro:
+            stub.contar("503")
+            return self._responder_json(503, {"error": "indisponível"})
+        stub.contar("chat")
+        n = stub.proximo_id()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._linha({"chatId": f"chat-{n}", "messages": [{"author": "GLEAN_AI", "messageType": "UPDATE", "fragments": [{"text": "Buscando..."}]}]})
+        time.sleep(c.ttft_ms / 1000)
+        intervalo = 1.0 / c.tokens_por_segundo if c.tokens_por_segundo > 0 else 0.0
+        for i in range(c.tokens):
+            self._linha({"messages": [{"author": "GLEAN_AI", "messageType": "CONTENT", "fragments": [{"text": f"palavra{i} "}]}]})
+            if intervalo:
+                time.sleep(intervalo)
+        citacoes = [{"sourceDocument": {"title": f"Artigo {k}", "url": f"https://help.exemplo.com/artigo/{k}"}} for k in range(c.citacoes)]
+        self._linha({"messages": [{"author": "GLEAN_AI", "messageType": "CONTENT", "citations": citacoes,
+                                   "messageTrackingToken": f"token-{n}"}]})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _linha(self, obj):
+        dados = json.dumps(obj).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(dados):X}\r\n".encode("ascii") + dados + b"\r\n")
+        self.wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stubs locais do Zendesk e da Glean.")
+    parser.add_argument("--zendesk-porta", type=int, default=8081)
+    parser.add_argument("--glean-porta", type=int, default=8082)
+    parser.add_argument("--zendesk-latencia-ms", type=float, default=30)
+    parser.add_argument("--zendesk-limite-por-minuto", type=int, default=0)
+    parser.add_argument("--zendesk-prob-429", type=float, default=0.0)
+    parser.add_argument("--comentarios-por-ticket", type=int, default=8)
+    parser.add_argument("--glean-ttft-ms", type=float, default=400)
+    parser.add_argument("--glean-tokens", type=int, default=150)
+    parser.add_argument("--glean-tokens-por-segundo", type=float, default=100)
+    parser.add_argument("--glean-citacoes", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    zendesk = ServidorZendeskFalso(ConfigZendeskFalso(
+        latencia_ms=args.zendesk_latencia_ms, limite_por_minuto=args.zendesk_limite_por_minuto,
+        prob_429=args.zendesk_prob_429, comentarios_por_ticket=args.comentarios_por_ticket,
+    ), porta=args.zendesk_porta).iniciar()
+    glean = ServidorGleanFalso(ConfigGleanFalso(
+        ttft_ms=args.glean_ttft_ms, tokens=args.glean_tokens,
+        tokens_por_segundo=args.glean_tokens_por_segundo, citacoes=args.glean_citacoes,
+    ), porta=args.glean_porta).iniciar()
+    print(f"ZENDESK_API_BASE_URL={zendesk.url}/api/v2")
+    print(f"GLEAN_API_URL={glean.url}/rest/api/v1/chat")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"zendesk: {dict(zendesk.contadores)} | glean: {dict(glean.contadores)}")
+    except KeyboardInterrupt:
+        zendesk.parar()
+        glean.parar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Pool de workers limitado, com fila limitada e backpressure, para os endpoints Flask.
+
+Em vez de abrir um thread por webhook, os tickets vão para um pool de tamanho fixo.
+Quando os workers e a fila estão cheios, `try_submit` recusa o trabalho (retorna None)
+e o endpoint responde 503, deixando o Zendesk reenviar o webhook mais tarde.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor com no máximo `max_workers` em execução e `max_queue` aguardando."""
+
+    def __init__(self, max_workers=4, max_queue=50, name="ticket-worker"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._vagas = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._na_fila = 0
+        self._ativos = 0
+        self._concluidos = 0
+        self._recusados = 0
+        self._encerrado = False
+
+    def try_submit(self, fn, *args, **kwargs):
+        """Agenda `fn` se houver vaga. Retorna o Future, ou None quando o pool está saturado."""
+        if self._encerrado or not self._vagas.acquire(blocking=False):
+            with self._lock:
+                self._recusados += 1
+            return None
+        with self._lock:
+            self._na_fila += 1
+        try:
+            return self._executor.submit(self._executar, fn, args, kwargs)
+        except RuntimeError: # Pool já encerrado
+            with self._lock:
+                self._na_fila -= 1
+                self._recusados += 1
+            self._vagas.release()
+            return None
+
+    def _executar(self, fn, args, kwargs):
+        with self._lock:
+            self._na_fila -= 1
+            self._ativos += 1
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logging.error(f"Erro não tratado no worker do pool: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._ativos -= 1
+                self._concluidos += 1
+            self._vagas.release()
+
+    def stats(self):
+        """Profundidade da fila e utilização dos workers, para monitoramento."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._na_fila,
+                "active_workers": self._ativos,
+                "utilization": self._ativos / self.max_workers,
+                "completed": self._concluidos,
+                "rejected": self._recusados,
+            }
+
+    def shutdown(self, wait=True):
+        """Para de aceitar tickets e, com `wait=True`, aguarda os que já estão na fila ou em execução."""
+        self._encerrado = True
+        logging.info(f"Encerrando pool de workers. Estado atual: {self.stats()}")
+        self._executor.shutdown(wait=wait)
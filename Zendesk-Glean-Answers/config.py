@@ -28,10 +28,13 @@ FSE_ID=os.getenv('FSE_ID')
 FIN_ID=os.getenv('FIN_ID')
 #print("NON_PS_ID", os.getenv("NON_PS_ID"))
 #print("GLEAN_API_URL:", os.getenv("GLEAN_API_URL"))
-EXCEL_PATH = "tokens.xlsx"
+EXCEL_PATH = "tokens.xlsx"  # Só para importação/relatório; os tokens ficam em TOKEN_STORE_PATH
+TOKEN_STORE_PATH = os.getenv("TOKEN_STORE_PATH", "tokens.sqlite3")
+TOKEN_LOOKUP_BACKEND = os.getenv("TOKEN_LOOKUP_BACKEND", "sqlite").lower()  # sqlite | excel | dynamodb
+DYNAMODB_TOKENS_TABLE_NAME = os.getenv("DYNAMODB_TOKENS_TABLE_NAME")
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "100"))
+FEEDBACK_FLUSH_INTERVAL_SECONDS = float(os.getenv("FEEDBACK_FLUSH_INTERVAL_SECONDS", "2"))
+FEEDBACK_MAX_RETRIES = int(os.getenv("FEEDBACK_MAX_RETRIES", "3"))
 PS_ZENDESK_ID = os.getenv("PS_ZENDESK_ID")
 FSE_ZENDESK_ID = os.getenv("FSE_ZENDESK_ID")
 FIN_ZENDESK_ID = os.getenv("FIN_ZENDESK_ID")
-print("PS_ZENDESK_ID", os.getenv("PS_ZENDESK_ID"))
-print("FSE_ZENDESK_ID", os.getenv("FSE_ZENDESK_ID"))
-print("FIN_ZENDESK_ID", os.getenv("FIN_ZENDESK_ID"))
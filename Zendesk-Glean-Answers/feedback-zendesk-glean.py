@@ -1,57 +1,84 @@
-import pandas as pd
+import atexit
 import requests
 from flask import Flask, request, jsonify
-from config import EXCEL_PATH, GLEAN_TOKEN, GLEAN_FEEDBACK_URL
+from config import (
+    EXCEL_PATH, GLEAN_TOKEN, GLEAN_FEEDBACK_URL, TOKEN_LOOKUP_BACKEND, TOKEN_STORE_PATH, DYNAMODB_TOKENS_TABLE_NAME,
+    FEEDBACK_BATCH_SIZE, FEEDBACK_FLUSH_INTERVAL_SECONDS, FEEDBACK_MAX_RETRIES
+)
+import http_client
+from feedback_dispatcher import DespachanteFeedback
+import token_index
 
 app = Flask(__name__)
 
+# Índice carregado uma vez por processo; a planilha só é relida quando muda
+indice_tokens = token_index.criar_indice(
+    TOKEN_LOOKUP_BACKEND, excel_path=EXCEL_PATH, dynamodb_table=DYNAMODB_TOKENS_TABLE_NAME,
+    sqlite_path=TOKEN_STORE_PATH
+)
+
 def buscar_tracking_token(ticket_id):
     try:
-        df = pd.read_excel(EXCEL_PATH)
-        linhas = df[df['ticket_id'] == ticket_id]
-        print(linhas)
-        if not linhas.empty:
-            return linhas['tracking_token'].tolist()
-        else:
-            print("❌ Ticket ID não encontrado na planilha.")
-            return []
+        tokens = indice_tokens.buscar(ticket_id)
+        print(f"Tokens encontrados para o ticket {ticket_id}: {tokens}")
+        if not tokens:
+            print("❌ Ticket ID não encontrado no índice de tokens.")
+        return tokens
     except Exception as e:
-        print(f"❌ Erro ao ler a planilha: {e}")
+        print(f"❌ Erro ao consultar o índice de tokens: {e}")
         return []
 
+EVENTOS_FEEDBACK = {
+    "positive": "UPVOTE",
+    "negative": "DOWNVOTE"
+}
+
+def _glean_feedback_session():
+    # Sessão pooled: reaproveita a conexão TLS com a Glean entre feedbacks
+    return http_client.get_session(
+        GLEAN_FEEDBACK_URL,
+        headers={
+            "Authorization": f"Bearer {GLEAN_TOKEN}",
+            "Content-Type": "application/json"
+        }
+    )
+
+def enviar_lote_para_glean(tracking_tokens, event):
+    """Envia um único POST com vários tokens. Levanta exceção em falhas que valem nova tentativa."""
+    body = {
+        "tracking_tokens": list(tracking_tokens),
+        "event": event
+    }
+    response = _glean_feedback_session().post(GLEAN_FEEDBACK_URL, json=body)
+    if 400 <= response.status_code < 500 and response.status_code != 429:
+        # Erro do cliente: repetir o mesmo lote não adianta
+        print(f"❌ Glean recusou o lote de feedback '{event}' ({response.status_code}): {response.text[:500]}")
+        return
+    response.raise_for_status()
+    print(f"✅ Feedback '{event}' enviado para {len(body['tracking_tokens'])} token(s).")
+
 def enviar_feedback_para_glean(tracking_token, feedback):
-    event = {
-        "positive": "UPVOTE",
-        "negative": "DOWNVOTE"
-    }.get(feedback.lower())
+    event = EVENTOS_FEEDBACK.get(feedback.lower())
 
     if not event:
         print(f"❌ Tipo de feedback inválido: {feedback}")
         return
 
     print(f"Enviando feedback '{event}' para o token {tracking_token}...")
-
-    headers = {
-        "Authorization": f"Bearer {GLEAN_TOKEN}",
-        "Content-Type": "application/json"
-    }
-
-    body = {
-        "tracking_tokens": [tracking_token],
-        "event": event
-    }
-
     try:
-        response = requests.post(
-            GLEAN_FEEDBACK_URL,
-            headers=headers,
-            json=body
-        )
-        response.raise_for_status()
-        print(f"✅ Feedback '{event}' enviado para token {tracking_token}.")
+        enviar_lote_para_glean([tracking_token], event)
     except requests.exceptions.RequestException as e:
         print(f"❌ Erro ao enviar feedback para Glean: {e}")
 
+# Agrupa os tokens por evento (entre tickets) e envia em lotes, com retry
+despachante = DespachanteFeedback(
+    enviar_lote_para_glean,
+    chunk_size=FEEDBACK_BATCH_SIZE,
+    flush_interval=FEEDBACK_FLUSH_INTERVAL_SECONDS,
+    max_tentativas=FEEDBACK_MAX_RETRIES
+)
+atexit.register(despachante.encerrar)
+
 @app.route("/webhook/feedback", methods=["POST"])
 def receber_webhook_feedback():
     data = request.json
@@ -72,10 +99,9 @@ def receber_webhook_feedback():
     if not tracking_tokens:
         return jsonify({"error": "Tracking token não encontrado para o ticket informado."}), 404
 
-    for token in tracking_tokens:
-        enviar_feedback_para_glean(token, feedback)
+    despachante.adicionar(EVENTOS_FEEDBACK[feedback], tracking_tokens)
 
-    return jsonify({"status": f"Feedback enviado para {len(tracking_tokens)} token(s)."}), 200
+    return jsonify({"status": f"Feedback agendado para {len(tracking_tokens)} token(s)."}), 202
 
 if __name__ == "__main__":
     app.run(port=5001, debug=True)
@@ -0,0 +1,92 @@
+"""
+Envio de feedback para a Glean em lotes.
+
+O endpoint de feedback da Glean aceita uma lista de `tracking_tokens` por evento. Em vez de
+um POST por token, `DespachanteFeedback` acumula os tokens por evento (UPVOTE/DOWNVOTE)
+durante `flush_interval` segundos, vindos de vários tickets, e envia um POST por lote de até
+`chunk_size` tokens. Um lote que falha é tentado de novo com backoff exponencial e jitter.
+"""
+import logging
+import random
+import threading
+import time
+
+
+class DespachanteFeedback:
+    """Buffer de feedback por evento, esvaziado periodicamente por um thread em segundo plano."""
+
+    def __init__(self, enviar_lote, chunk_size=100, flush_interval=2.0, max_tentativas=3,
+                 backoff_base=1.0, sleep=time.sleep):
+        """
+        enviar_lote(tokens, evento): envia um lote; uma exceção indica falha e provoca nova tentativa.
+        """
+        self._enviar_lote = enviar_lote
+        self.chunk_size = max(1, int(chunk_size))
+        self.flush_interval = float(flush_interval)
+        self.max_tentativas = max(1, int(max_tentativas))
+        self.backoff_base = float(backoff_base)
+        self._sleep = sleep
+        self._pendentes = {} # evento -> dict ordenado de tokens (de-duplica sem perder a ordem)
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self.lotes_enviados = 0
+        self.lotes_falhados = 0
+
+    def adicionar(self, evento, tokens):
+        """Coloca os tokens no buffer do evento. Retorna quantos tokens foram aceitos."""
+        with self._lock:
+            pendentes = self._pendentes.setdefault(evento, {})
+            for token in tokens:
+                if token:
+                    pendentes[token] = None
+            cheio = len(pendentes) >= self.chunk_size
+            if self._thread is None and not self._parar.is_set():
+                self._thread = threading.Thread(target=self._loop, name="feedback-dispatcher", daemon=True)
+                self._thread.start()
+        if cheio: # Um lote completo não precisa esperar o intervalo
+            self._acordar.set()
+        return len(tokens)
+
+    def _loop(self):
+        while not self._parar.is_set():
+            self._acordar.wait(self.flush_interval)
+            self._acordar.clear()
+            self.flush()
+
+    def flush(self):
+        """Envia tudo o que está no buffer. Retorna a quantidade de lotes que falharam."""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+        falhas = 0
+        for evento, tokens in pendentes.items():
+            tokens = list(tokens)
+            for i in range(0, len(tokens), self.chunk_size):
+                if not self._enviar_com_retry(tokens[i:i + self.chunk_size], evento):
+                    falhas += 1
+        return falhas
+
+    def _enviar_com_retry(self, lote, evento):
+        for tentativa in range(1, self.max_tentativas + 1):
+            try:
+                self._enviar_lote(lote, evento)
+                self.lotes_enviados += 1
+                return True
+            except Exception as e:
+                if tentativa == self.max_tentativas:
+                    self.lotes_falhados += 1
+                    logging.error(f"Lote de feedback '{evento}' com {len(lote)} token(s) descartado após {tentativa} tentativa(s): {e}. Tokens: {lote}")
+                    return False
+                espera = self.backoff_base * (2 ** (tentativa - 1))
+                espera = random.uniform(espera / 2, espera) # Jitter evita rajadas sincronizadas
+                logging.warning(f"Falha ao enviar lote de feedback '{evento}' (tentativa {tentativa}): {e}. Nova tentativa em {espera:.1f}s.")
+                self._sleep(espera)
+
+    def encerrar(self, timeout=None):
+        """Para o thread de fundo e envia o que restou no buffer."""
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
@@ -0,0 +1,223 @@
+"""
+Proteção das chamadas à Glean: limite de concorrência e circuit breaker por applicationId.
+
+Cada applicationId tem:
+- um limite de chamadas simultâneas (GLEAN_MAX_CONCURRENCY_PER_APP, ou GLEAN_APP_CONCURRENCY
+  "app_id:n,..."); quem não consegue vaga em GLEAN_CONCURRENCY_WAIT_SECONDS desiste na hora;
+- um circuit breaker sobre as últimas GLEAN_BREAKER_WINDOW chamadas. Ele abre quando a taxa
+  de erros ou de chamadas lentas passa de GLEAN_BREAKER_FAILURE_RATE. Uma chamada é lenta quando
+  o tempo até o primeiro token (ou, sem ele, a duração da chamada) passa de GLEAN_BREAKER_SLOW_SECONDS:
+  uma resposta saudável leva dezenas de segundos de stream, então a duração total não serve.
+  Aberto, recusa chamadas por GLEAN_BREAKER_OPEN_SECONDS e depois deixa passar uma sonda
+  (meio-aberto): sucesso fecha o circuito, falha o reabre.
+
+Uma chamada recusada levanta `GleanIndisponivel` imediatamente. O ticket falha como
+"tentar de novo" e volta para a fila, em vez de segurar um worker até o timeout.
+"""
+import contextlib
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio-aberto"
+
+
+class GleanIndisponivel(Exception):
+    """A chamada não foi feita: circuito aberto ou limite de concorrência do applicationId esgotado."""
+
+    def __init__(self, mensagem, tentar_em=0.0):
+        super().__init__(mensagem)
+        self.tentar_em = tentar_em # Segundos sugeridos até a próxima tentativa
+
+
+class CircuitBreaker:
+    """Circuit breaker por janela deslizante de chamadas, contando erros e chamadas lentas."""
+
+    def __init__(self, nome, janela=20, min_chamadas=5, taxa_falha=0.5, lenta_segundos=20.0,
+                 aberto_segundos=30.0, sondas=1, clock=time.monotonic):
+        self.nome = nome
+        self.min_chamadas = max(1, int(min_chamadas))
+        self.taxa_falha = float(taxa_falha)
+        self.lenta_segundos = float(lenta_segundos)
+        self.aberto_segundos = float(aberto_segundos)
+        self.sondas = max(1, int(sondas))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._janela = deque(maxlen=max(1, int(janela))) # (falhou, lenta)
+        self.estado = FECHADO
+        self._aberto_ate = 0.0
+        self._sondas_em_voo = 0
+
+    def permitir(self):
+        """Retorna True se a chamada pode ser feita (reservando uma sonda no estado meio-aberto)."""
+        with self._lock:
+            if self.estado == ABERTO:
+                if self._clock() < self._aberto_ate:
+                    return False
+                self.estado = MEIO_ABERTO
+                self._sondas_em_voo = 0
+                logging.info(f"Circuit breaker da Glean ({self.nome}) meio-aberto: testando recuperação.")
+            if self.estado == MEIO_ABERTO:
+                if self._sondas_em_voo >= self.sondas:
+                    return False
+                self._sondas_em_voo += 1
+            return True
+
+    def registrar(self, falhou, duracao):
+        lenta = duracao >= self.lenta_segundos
+        with self._lock:
+            if self.estado == MEIO_ABERTO:
+                self._sondas_em_voo = max(0, self._sondas_em_voo - 1)
+                if falhou or lenta:
+                    self._abrir("sonda falhou" if falhou else f"sonda lenta ({duracao:.1f}s)")
+                else:
+                    self.estado = FECHADO
+                    self._janela.clear()
+                    logging.info(f"Circuit breaker da Glean ({self.nome}) fechado: Glean recuperada.")
+                return
+            self._janela.append((falhou, lenta))
+            if self.estado == FECHADO and len(self._janela) >= self.min_chamadas:
+                ruins = sum(1 for f, l in self._janela if f or l)
+                if ruins / len(self._janela) >= self.taxa_falha:
+                    self._abrir(f"{ruins} de {len(self._janela)} chamadas recentes com erro ou lentas")
+
+    def _abrir(self, motivo):
+        self.estado = ABERTO
+        self._aberto_ate = self._clock() + self.aberto_segundos
+        self._janela.clear()
+        logging.warning(f"Circuit breaker da Glean ({self.nome}) aberto por {self.aberto_segundos:.0f}s: {motivo}.")
+
+    def segundos_ate_sonda(self):
+        with self._lock:
+            return max(0.0, self._aberto_ate - self._clock()) if self.estado == ABERTO else 0.0
+
+
+class _Chamada:
+    def __init__(self):
+        self.falhou = False
+        self.latencia = None
+
+    def marcar_falha(self):
+        """Conta a chamada como falha no breaker mesmo sem exceção (ex.: stream sem conteúdo)."""
+        self.falhou = True
+
+    def registrar_latencia(self, segundos):
+        """Latência usada na detecção de lentidão (o tempo até o primeiro token), no lugar da duração do bloco."""
+        self.latencia = segundos
+
+
+def _latencia(chamada, inicio):
+    return chamada.latencia if chamada.latencia is not None else time.monotonic() - inicio
+
+
+class ProtecaoGlean:
+    """Limite de concorrência + circuit breaker, um par por applicationId."""
+
+    def __init__(self, max_concorrencia=4, concorrencia_por_app=None, espera_vaga_segundos=5.0,
+                 eh_falha=None, **opcoes_breaker):
+        self.max_concorrencia = max(1, int(max_concorrencia))
+        self.concorrencia_por_app = dict(concorrencia_por_app or {})
+        self.espera_vaga_segundos = float(espera_vaga_segundos)
+        self._eh_falha = eh_falha or (lambda exc: True)
+        self._opcoes_breaker = opcoes_breaker
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._vagas = {}
+
+    def _do_app(self, application_id):
+        with self._lock:
+            if application_id not in self._breakers:
+                self._breakers[application_id] = CircuitBreaker(str(application_id), **self._opcoes_breaker)
+                limite = self.concorrencia_por_app.get(str(application_id), self.max_concorrencia)
+                self._vagas[application_id] = threading.BoundedSemaphore(max(1, int(limite)))
+            return self._breakers[application_id], self._vagas[application_id]
+
+    @contextlib.contextmanager
+    def chamada(self, application_id):
+        """
+        Envolve uma chamada à Glean. Levanta GleanIndisponivel sem chamar se o circuito estiver aberto
+        ou sem vaga. Exceções que passam pelo bloco contam como falha (conforme `eh_falha`), assim como
+        `marcar_falha()`. A detecção de lentidão usa `registrar_latencia()` ou, sem ela, a duração do bloco.
+        """
+        breaker, vagas = self._do_app(application_id)
+        if not vagas.acquire(timeout=self.espera_vaga_segundos):
+            raise GleanIndisponivel(
+                f"limite de chamadas simultâneas à Glean atingido para o applicationId {application_id}",
+                tentar_em=self.espera_vaga_segundos,
+            )
+        try:
+            if not breaker.permitir():
+                raise GleanIndisponivel(
+                    f"circuit breaker da Glean aberto para o applicationId {application_id}",
+                    tentar_em=breaker.segundos_ate_sonda(),
+                )
+            chamada = _Chamada()
+            inicio = time.monotonic()
+            try:
+                yield chamada
+            except Exception as e:
+                breaker.registrar(self._eh_falha(e), _latencia(chamada, inicio))
+                raise
+            breaker.registrar(chamada.falhou, _latencia(chamada, inicio))
+        finally:
+            vagas.release()
+
+    def circuito_aberto(self, application_id):
+        """Segundos até a próxima sonda se o circuito do applicationId estiver aberto, senão 0."""
+        with self._lock:
+            breaker = self._breakers.get(application_id)
+        return breaker.segundos_ate_sonda() if breaker else 0.0
+
+    def segundos_ate_nova_tentativa(self):
+        """Maior tempo restante de circuito aberto entre os applicationIds (0 se todos fechados)."""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return max((b.segundos_ate_sonda() for b in breakers), default=0.0)
+
+    def stats(self):
+        with self._lock:
+            return {app: b.estado for app, b in self._breakers.items()}
+
+
+def falha_da_glean(exc):
+    """Erros do cliente (4xx exceto 429) não indicam Glean degradada e não abrem o circuito."""
+    status = getattr(getattr(exc, "response", None), "status_code", None) # HTTPError do requests
+    if status is not None:
+        return not (400 <= status < 500 and status != 429)
+    return True
+
+
+def _concorrencia_por_app(valor):
+    pares = (item.split(":", 1) for item in (valor or "").split(",") if ":" in item)
+    return {app.strip(): int(n) for app, n in pares if app.strip()}
+
+
+_protecao = None
+_protecao_lock = threading.Lock()
+
+
+def get_protecao():
+    """
+    Proteção compartilhada pelo processo (limites e breakers sobrevivem entre invocações "quentes").
+    Classifica as falhas sempre com `falha_da_glean`, qualquer que seja o primeiro chamador.
+    """
+    global _protecao
+    if _protecao is None:
+        with _protecao_lock:
+            if _protecao is None:
+                _protecao = ProtecaoGlean(
+                    max_concorrencia=int(os.environ.get("GLEAN_MAX_CONCURRENCY_PER_APP", 4)),
+                    concorrencia_por_app=_concorrencia_por_app(os.environ.get("GLEAN_APP_CONCURRENCY")),
+                    espera_vaga_segundos=float(os.environ.get("GLEAN_CONCURRENCY_WAIT_SECONDS", 5)),
+                    eh_falha=falha_da_glean,
+                    janela=int(os.environ.get("GLEAN_BREAKER_WINDOW", 20)),
+                    min_chamadas=int(os.environ.get("GLEAN_BREAKER_MIN_CALLS", 5)),
+                    taxa_falha=float(os.environ.get("GLEAN_BREAKER_FAILURE_RATE", 0.5)),
+                    lenta_segundos=float(os.environ.get("GLEAN_BREAKER_SLOW_SECONDS", 20)),
+                    aberto_segundos=float(os.environ.get("GLEAN_BREAKER_OPEN_SECONDS", 30)),
+                )
+    return _protecao
@@ -0,0 +1,113 @@
+"""
+Cache de respostas da Glean endereçado pelo conteúdo da requisição.
+
+A chave é o hash SHA-256 do texto do ticket, do prompt de sistema e do applicationId: se um
+ticket é re-tagueado sem comentários novos, a mesma pergunta não volta para a Glean.
+Cada entrada guarda o texto da resposta, as citações e o tracking token.
+
+Backends:
+- LocalAnswerCache: em memória, com TTL e limite de entradas (sobrevive entre invocações "quentes").
+- DynamoDBAnswerCache: compartilhado entre containers; a expiração usa o atributo de TTL `expira_em`.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import aws_clients
+from pipeline_config import get_config
+from ttl_cache import TTLCache
+
+DYNAMODB_ITEM_LIMIT_BYTES = 350 * 1024 # Margem abaixo do limite de 400 KB por item
+
+
+def chave_resposta(texto_ticket, system_prompt, application_id):
+    """Hash do conteúdo que determina a resposta da Glean."""
+    h = hashlib.sha256()
+    for parte in (application_id, system_prompt, texto_ticket):
+        dados = str(parte or "").encode("utf-8")
+        h.update(len(dados).to_bytes(8, "big")) # Prefixo de tamanho evita colisões por concatenação
+        h.update(dados)
+    return h.hexdigest()
+
+
+class LocalAnswerCache:
+    """Cache em memória com TTL e descarte por tamanho (LRU)."""
+
+    def __init__(self, max_entries=256, ttl_seconds=3600):
+        self._cache = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def get(self, chave):
+        return self._cache.get(chave)
+
+    def set(self, chave, entrada):
+        self._cache.set(chave, entrada)
+
+
+class DynamoDBAnswerCache:
+    """Cache em DynamoDB: chave de partição `chave` (string), entrada serializada em `entrada`."""
+
+    def __init__(self, table_name, ttl_seconds=3600, table=None, clock=time.time):
+        self.table = table if table is not None else aws_clients.dynamodb_table(table_name)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+
+    def get(self, chave):
+        try:
+            item = self.table.get_item(Key={"chave": chave}).get("Item")
+        except Exception as e:
+            logging.error(f"Erro ao ler cache de respostas da Glean no DynamoDB: {e}")
+            return None
+        if not item or int(item.get("expira_em", 0)) <= self._clock(): # O TTL do DynamoDB não apaga na hora
+            return None
+        return json.loads(item["entrada"])
+
+    def set(self, chave, entrada):
+        serializada = json.dumps(entrada, ensure_ascii=False)
+        if len(serializada.encode("utf-8")) > DYNAMODB_ITEM_LIMIT_BYTES:
+            logging.info("Resposta da Glean grande demais para o cache no DynamoDB; não armazenada.")
+            return
+        try:
+            self.table.put_item(Item={
+                "chave": chave,
+                "entrada": serializada,
+                "expira_em": int(self._clock() + self.ttl_seconds),
+            })
+        except Exception as e:
+            logging.error(f"Erro ao gravar cache de respostas da Glean no DynamoDB: {e}")
+
+
+_cache = None
+_cache_opcoes = None
+_cache_lock = threading.Lock()
+_desabilitado = object()
+
+
+def _opcoes(config):
+    return (config.glean_cache_backend, config.glean_cache_dynamodb_table,
+            config.glean_cache_ttl_seconds, config.glean_cache_max_entries)
+
+
+def get_answer_cache(config=None):
+    """
+    Retorna o cache do container, ou None se desabilitado. As opções vêm de `config` (padrão:
+    get_config()); o cache é remontado só quando um recarregamento as muda.
+    GLEAN_CACHE_BACKEND: memory (padrão) | dynamodb | none.
+    """
+    global _cache, _cache_opcoes
+    config = config or get_config()
+    opcoes = _opcoes(config)
+    if _cache_opcoes != opcoes:
+        with _cache_lock:
+            if _cache_opcoes != opcoes:
+                backend, tabela, ttl, max_entries = opcoes
+                if backend == "none":
+                    _cache = _desabilitado
+                elif backend == "dynamodb":
+                    _cache = DynamoDBAnswerCache(tabela, ttl_seconds=ttl)
+                else:
+                    _cache = LocalAnswerCache(max_entries=max_entries, ttl_seconds=ttl)
+                _cache_opcoes = opcoes
+                logging.info(f"Cache de respostas da Glean: '{backend}'.")
+    return None if _cache is _desabilitado else _cache
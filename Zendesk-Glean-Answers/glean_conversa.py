@@ -0,0 +1,66 @@
+"""
+Estado de conversa por ticket para o modo incremental da Glean.
+
+No primeiro disparo o ticket inteiro é enviado num chat novo. O ID desse chat e o ID do último
+comentário processado ficam guardados; nos disparos seguintes só os comentários novos são
+enviados, como mensagem de continuação no mesmo chat.
+
+Habilitado com GLEAN_CONVERSATION_MODE=true. O estado usa um store de `kv_store`
+(GLEAN_CONVERSATION_STORE: memory | sqlite | dynamodb). As opções vêm de `pipeline_config`.
+"""
+import json
+import logging
+import threading
+
+import kv_store
+from pipeline_config import get_config
+
+_store = None
+_store_opcoes = None
+_store_lock = threading.Lock()
+
+
+def modo_incremental_habilitado(config=None):
+    return (config or get_config()).conversation_mode
+
+
+def _get_store(config=None):
+    global _store, _store_opcoes
+    config = config or get_config()
+    opcoes = (config.conversation_store, config.conversation_sqlite_path, config.conversation_dynamodb_table)
+    if _store_opcoes != opcoes:
+        with _store_lock:
+            if _store_opcoes != opcoes:
+                backend, sqlite_path, tabela = opcoes
+                _store = kv_store.criar_store(backend, sqlite_path=sqlite_path, dynamodb_table=tabela)
+                _store_opcoes = opcoes
+    return _store
+
+
+def carregar_estado(ticket_id, config=None):
+    """Retorna {'chat_id', 'ultimo_comentario_id', 'application_id'} do ticket, ou None no primeiro disparo."""
+    try:
+        bruto = _get_store(config).get(f"conversa:{ticket_id}")
+    except Exception as e:
+        logging.error(f"Erro ao carregar estado de conversa do ticket {ticket_id}: {e}")
+        return None
+    return json.loads(bruto) if bruto else None
+
+
+def salvar_estado(ticket_id, chat_id, ultimo_comentario_id, application_id, config=None):
+    estado = {
+        "chat_id": chat_id,
+        "ultimo_comentario_id": ultimo_comentario_id,
+        "application_id": application_id,
+    }
+    try:
+        config = config or get_config()
+        _get_store(config).put(f"conversa:{ticket_id}", json.dumps(estado), config.conversation_ttl_seconds)
+    except Exception as e:
+        logging.error(f"Erro ao salvar estado de conversa do ticket {ticket_id}: {e}")
+
+
+def comentarios_novos(comentarios, estado):
+    """Comentários com ID maior que o último processado (os IDs do Zendesk são crescentes)."""
+    ultimo = estado.get("ultimo_comentario_id") or 0
+    return [c for c in comentarios if (c.get("id") or 0) > ultimo]
@@ -0,0 +1,91 @@
+"""
+Consumidor incremental do stream de resposta do chat da Glean.
+
+Cada linha do stream é um JSON com `messages`; os fragmentos de texto vão para um buffer em
+lista (juntado uma única vez no final) e as citações são de-duplicadas pela URL normalizada
+à medida que chegam. Usa o `orjson` quando instalado, com fallback para o `json` padrão.
+Também mede o tempo até o primeiro fragmento de texto (TTFT) e o tempo total do stream.
+"""
+import json
+import logging
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _JSONDecodeError = orjson.JSONDecodeError
+except ImportError: # Dependência opcional
+    _loads = json.loads
+    _JSONDecodeError = json.JSONDecodeError
+
+
+def normalizar_url(url):
+    """Normaliza a URL para comparação: esquema e host em minúsculas, sem fragmento e sem barra final."""
+    if not url:
+        return None
+    partes = urlsplit(url.strip())
+    caminho = partes.path.rstrip("/") or ""
+    return urlunsplit((partes.scheme.lower(), partes.netloc.lower(), caminho, partes.query, ""))
+
+
+def url_da_citacao(citacao):
+    return citacao.get("url") or citacao.get("sourceDocument", {}).get("url")
+
+
+class ConsumidorStreamGlean:
+    """Acumula texto, citações únicas, tracking token e chatId de um stream da Glean."""
+
+    def __init__(self, inicio=None, clock=time.monotonic):
+        self._clock = clock
+        self.inicio = inicio if inicio is not None else clock()
+        self._partes = []
+        self.citacoes = []
+        self._urls_vistas = set()
+        self.token = None
+        self.chat_id = None
+        self.tempo_primeiro_token = None # Segundos desde `inicio` até o primeiro fragmento de texto
+        self.tempo_total = None
+        self.linhas = 0
+        self.linhas_invalidas = 0
+
+    @property
+    def texto(self):
+        return "".join(self._partes)
+
+    def consumir(self, response):
+        """Consome o stream inteiro de `response` (requests com stream=True) e retorna o próprio consumidor."""
+        try:
+            for linha in response.iter_lines():
+                if linha: # Ignora keep-alives
+                    self.consumir_linha(linha)
+        finally:
+            self.tempo_total = self._clock() - self.inicio
+        return self
+
+    def consumir_linha(self, linha):
+        self.linhas += 1
+        try:
+            dados = _loads(linha)
+        except (_JSONDecodeError, ValueError) as e:
+            self.linhas_invalidas += 1
+            logging.error(f"Erro ao decodificar linha do stream da Glean: {e}. Linha: {linha[:200]!r}")
+            return
+        if self.chat_id is None:
+            self.chat_id = dados.get("chatId")
+        for mensagem in dados.get("messages", ()):
+            if self.token is None: # Captura o primeiro messageTrackingToken
+                self.token = mensagem.get("messageTrackingToken")
+            if mensagem.get("messageType") != "CONTENT":
+                continue
+            for fragmento in mensagem.get("fragments", ()):
+                texto = fragmento.get("text")
+                if texto:
+                    if self.tempo_primeiro_token is None:
+                        self.tempo_primeiro_token = self._clock() - self.inicio
+                    self._partes.append(texto)
+            for citacao in mensagem.get("citations") or ():
+                url = normalizar_url(url_da_citacao(citacao))
+                if url and url not in self._urls_vistas:
+                    self._urls_vistas.add(url)
+                    self.citacoes.append(citacao)
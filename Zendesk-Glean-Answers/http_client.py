@@ -0,0 +1,100 @@
+"""
+Cliente HTTP compartilhado para as chamadas ao Zendesk e à Glean.
+
+Mantém uma `requests.Session` por host, com pool de conexões keep-alive dimensionado no
+adapter e timeout padrão. As sessões ficam no nível do módulo, então a conexão TCP+TLS
+aberta numa invocação é reaproveitada pelas próximas invocações "quentes" do Lambda.
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import ticket_capture
+import ticket_metrics
+
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_TIMEOUT_SECONDS = 10
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter que aplica um timeout padrão quando a chamada não informa um.
+    Com `agendador` (ex.: zendesk_rate_limit.AgendadorZendesk), cada envio passa por `agendador.executar`.
+    Cada envio é contado por host nas métricas do ticket em andamento (ticket_metrics) e,
+    com CAPTURE_DIR, gravado na captura do ticket (ticket_capture).
+    """
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT_SECONDS, agendador=None, **kwargs):
+        self.timeout = timeout
+        self.agendador = agendador
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        if self.agendador is not None:
+            return self.agendador.executar(lambda: self._enviar(request, **kwargs))
+        return self._enviar(request, **kwargs)
+
+    def _enviar(self, request, **kwargs):
+        inicio = time.perf_counter() # Só o envio: a espera no agendador não entra no tempo do host
+        try:
+            resposta = super().send(request, **kwargs)
+        except Exception as e:
+            ticket_capture.registrar_erro(request, e, inicio)
+            raise
+        finally:
+            ticket_metrics.registrar_http(request.url, time.perf_counter() - inicio)
+        ticket_capture.registrar_resposta(request, resposta, inicio)
+        return resposta
+
+
+def _pool_maxsize():
+    try:
+        return int(os.environ.get("HTTP_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE))
+    except ValueError:
+        return DEFAULT_POOL_MAXSIZE
+
+
+def _host_de(url):
+    partes = urlsplit(url if "://" in url else f"https://{url}")
+    return f"{partes.scheme}://{partes.netloc}"
+
+
+def get_session(url, auth=None, headers=None, timeout=DEFAULT_TIMEOUT_SECONDS, pool_maxsize=None, agendador=None):
+    """
+    Retorna a sessão pooled do host de `url`, criando-a na primeira chamada.
+    `auth`, `headers`, `timeout` e `agendador` só são aplicados na criação: a autenticação é lida uma vez por container.
+    """
+    host = _host_de(url)
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            maxsize = pool_maxsize or _pool_maxsize()
+            session = requests.Session()
+            adapter = TimeoutHTTPAdapter(timeout=timeout, agendador=agendador, pool_connections=1, pool_maxsize=maxsize)
+            session.mount(host + "/", adapter)
+            if auth is not None:
+                session.auth = auth
+            if headers:
+                session.headers.update(headers)
+            _sessions[host] = session
+    return session
+
+
+def close_all():
+    """Fecha todas as sessões (útil em testes ou ao recarregar credenciais)."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,165 @@
+"""
+Stores chave-valor com expiração (TTL), compartilhados pelos módulos que guardam estado por ticket.
+
+- MemoryStore: um único processo (Flask local, testes).
+- SqliteStore: threads e processos da mesma máquina.
+- DynamoDBStore: vários containers Lambda.
+
+Todos expõem `reservar` (put-if-absent atômico), `put`, `get` e `liberar`; os valores são strings.
+"""
+import sqlite3
+import threading
+import time
+
+import aws_clients
+
+
+class MemoryStore:
+    """Store em memória: serve para um único processo (Flask local, testes)."""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def _vivo(self, chave):
+        item = self._dados.get(chave)
+        if item is not None and item[1] <= self._clock():
+            del self._dados[chave]
+            return None
+        return item
+
+    def reservar(self, chave, valor, ttl_seconds):
+        """Grava a chave somente se ela não existir (ou estiver expirada). Retorna True se gravou."""
+        with self._lock:
+            if self._vivo(chave) is not None:
+                return False
+            self._dados[chave] = (valor, self._clock() + ttl_seconds)
+            return True
+
+    def put(self, chave, valor, ttl_seconds):
+        with self._lock:
+            self._dados[chave] = (valor, self._clock() + ttl_seconds)
+
+    def get(self, chave):
+        with self._lock:
+            item = self._vivo(chave)
+            return None if item is None else item[0]
+
+    def liberar(self, chave, valor=None):
+        """Remove a chave (se `valor` for informado, só remove se ainda for o mesmo dono)."""
+        with self._lock:
+            item = self._vivo(chave)
+            if item is not None and (valor is None or item[0] == valor):
+                del self._dados[chave]
+
+
+class SqliteStore:
+    """Store em SQLite: compartilhado entre threads e processos da mesma máquina."""
+
+    def __init__(self, path="/tmp/ticket_state.sqlite3", clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (chave TEXT PRIMARY KEY, valor TEXT, expira_em REAL NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def reservar(self, chave, valor, ttl_seconds):
+        agora = self._clock()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE chave = ? AND expira_em <= ?", (chave, agora))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO kv (chave, valor, expira_em) VALUES (?, ?, ?)",
+                (chave, valor, agora + ttl_seconds),
+            )
+            conn.execute("COMMIT")
+            return cur.rowcount == 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put(self, chave, valor, ttl_seconds):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (chave, valor, expira_em) VALUES (?, ?, ?)",
+            (chave, valor, self._clock() + ttl_seconds),
+        )
+
+    def get(self, chave):
+        linha = self._conn().execute(
+            "SELECT valor FROM kv WHERE chave = ? AND expira_em > ?", (chave, self._clock())
+        ).fetchone()
+        return None if linha is None else linha[0]
+
+    def liberar(self, chave, valor=None):
+        if valor is None:
+            self._conn().execute("DELETE FROM kv WHERE chave = ?", (chave,))
+        else:
+            self._conn().execute("DELETE FROM kv WHERE chave = ? AND valor = ?", (chave, valor))
+
+
+class DynamoDBStore:
+    """
+    Store em DynamoDB.
+    Tabela com chave de partição `chave` (string); `expira_em` (epoch) pode ser o atributo de TTL da tabela.
+    """
+
+    def __init__(self, table_name, region_name=None, table=None, clock=time.time):
+        self._clock = clock
+        self.table = table if table is not None else aws_clients.dynamodb_table(table_name, region_name)
+
+    def reservar(self, chave, valor, ttl_seconds):
+        from botocore.exceptions import ClientError
+        agora = self._clock()
+        try:
+            self.table.put_item(
+                Item={"chave": chave, "valor": valor, "expira_em": int(agora + ttl_seconds)},
+                ConditionExpression="attribute_not_exists(chave) OR expira_em <= :agora",
+                ExpressionAttributeValues={":agora": int(agora)},
+            )
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    def put(self, chave, valor, ttl_seconds):
+        self.table.put_item(Item={"chave": chave, "valor": valor, "expira_em": int(self._clock() + ttl_seconds)})
+
+    def get(self, chave):
+        item = self.table.get_item(Key={"chave": chave}, ConsistentRead=True).get("Item")
+        if not item or int(item.get("expira_em", 0)) <= self._clock():
+            return None
+        return item.get("valor")
+
+    def liberar(self, chave, valor=None):
+        from botocore.exceptions import ClientError
+        kwargs = {"Key": {"chave": chave}}
+        if valor is not None:
+            kwargs.update(ConditionExpression="valor = :valor", ExpressionAttributeValues={":valor": valor})
+        try:
+            self.table.delete_item(**kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+
+
+def criar_store(backend, sqlite_path=None, dynamodb_table=None):
+    """Cria o store pelo nome do backend: memory (padrão), sqlite ou dynamodb."""
+    backend = (backend or "memory").lower()
+    if backend == "dynamodb":
+        if not dynamodb_table:
+            raise ValueError("Tabela DynamoDB não configurada para o store.")
+        return DynamoDBStore(dynamodb_table)
+    if backend == "sqlite":
+        return SqliteStore(sqlite_path) if sqlite_path else SqliteStore()
+    return MemoryStore()
@@ -1,27 +1,53 @@
 # -*- coding: utf-8 -*-
 """
-AWS Lambda handler for Zendesk to Glean webhook.
+AWS Lambda handlers for Zendesk to Glean webhook.
 
-This module loads the existing Flask-based webhook script and invokes its processa_ticket function asynchronously.
+lambda_handler is the receiver: it only enqueues the webhook payload and returns.
+worker_handler is the worker: it consumes queued payloads (SQS event source) and runs
+processa_ticket from webhook_glean_zendesk with bounded concurrency.
 """
 import json
+import logging
 import os
-import threading
-import importlib.util
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Dynamically load the Flask-based webhook module
 HERE = os.path.dirname(__file__)
-MODULE_PATH = os.path.join(HERE, "webhook-glean-zendesk.py")
-spec = importlib.util.spec_from_file_location("webhook_module", MODULE_PATH)
-webhook_module = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(webhook_module)
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)  # Let the pipeline import its sibling helper modules
+
+# Plain import (no Flask, dotenv or boto3 at import time) so cold starts only pay for what Lambda uses
+import webhook_glean_zendesk as webhook_module
+import glean_breaker
+import ticket_dedup
+import ticket_queue
+import ticket_retry
+import token_sink
+import zendesk_diretorio
 
 # Alias the processing function
 processa_ticket = webhook_module.processa_ticket
+get_env_variable = webhook_module.get_env_variable
+
+MAX_VISIBILITY_TIMEOUT = 43200  # SQS limit (12 hours)
+OCUPADA = "ocupada"  # _processa_mensagem result: the ticket was busy and the event is pending on the lock holder
+
+# Load the agent/group directory during container init, so author lookups are in-memory from the first ticket
+zendesk_diretorio.pre_carregar()
+
+
+def _json_response(status_code, body):
+    return {
+        "statusCode": status_code,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps(body),
+    }
+
 
 def lambda_handler(event, context):
     """
-    AWS Lambda entry point for Zendesk to Glean webhook.
+    AWS Lambda entry point for Zendesk to Glean webhook (receiver).
     """
     # Parse event body if present (API Gateway proxy integration)
     try:
@@ -35,13 +61,168 @@ def lambda_handler(event, context):
 
     print("Lambda payload recebido:", json.dumps(payload, indent=2))
 
-    # Process the ticket asynchronously and return immediately
-    thread = threading.Thread(target=processa_ticket, args=(payload,))
-    thread.daemon = True
-    thread.start()
+    if not ticket_dedup.registrar_evento(payload):
+        return _json_response(200, {"status": "duplicate"})
 
-    return {
-        "statusCode": 200,
-        "headers": {"Content-Type": "application/json"},
-        "body": json.dumps({"status": "received"}),
-    }
\ No newline at end of file
+    fila = ticket_queue.get_queue()
+    if fila is None:
+        # No queue configured: process within this invocation instead of on a thread Lambda would freeze
+        logging.warning("Nenhuma fila configurada (TICKET_QUEUE_URL/TICKET_QUEUE_SQLITE_PATH). Processando o ticket na própria invocação.")
+        resultado = ticket_dedup.executar_evento(payload, processa_ticket)
+        token_sink.flush_pendentes()
+        if resultado is False:
+            # Failed (kept in the retry store) or busy (left pending): a non-2xx lets Zendesk retry the webhook
+            ticket_dedup.desfazer_evento(payload)
+            return _json_response(503, {"status": "retry", "message": "Ticket não processado; tente novamente"})
+        return _json_response(200, {"status": "processed" if resultado is True else "ignored"})
+
+    try:
+        # Delaying by the coalescing window lets a burst of updates collapse into its latest event
+        message_id = fila.send(payload, delay_seconds=ticket_dedup.janela_de_coalescencia())
+    except Exception as e:
+        # Non-2xx makes Zendesk retry the webhook, so the ticket is not lost
+        ticket_dedup.desfazer_evento(payload)
+        logging.error(f"Erro ao enfileirar payload do webhook: {e}", exc_info=True)
+        return _json_response(503, {"status": "error", "message": "Falha ao enfileirar o ticket"})
+
+    logging.info(f"Payload enfileirado (mensagem {message_id}).")
+    return _json_response(200, {"status": "received"})
+
+
+def _processa_mensagem(mensagem):
+    """
+    Runs one queued payload. Returns True when the message can be deleted from the queue, False
+    when it failed, or OCUPADA when another invocation holds the ticket's lock.
+    """
+    try:
+        resultado = ticket_dedup.executar_evento(mensagem.body, processa_ticket, ocupado=OCUPADA)
+        return resultado if resultado == OCUPADA else resultado is not False
+    except Exception as e:
+        logging.error(f"Erro inesperado ao processar mensagem {mensagem.id}: {e}", exc_info=True)
+        return False
+
+
+def processar_mensagens(mensagens, max_workers=None):
+    """
+    Processes a batch of messages with at most `max_workers` tickets in flight.
+    Returns (message, busy) pairs for the messages that must be delivered again.
+    """
+    if not mensagens:
+        return []
+    if max_workers is None:
+        max_workers = get_env_variable("WORKER_CONCURRENCY", default_value=4, var_type=int)
+    try:
+        # Stale agent directory: refresh it here, between batches, never on the webhook path
+        webhook_module.atualizar_diretorio()
+    except Exception as e:
+        logging.warning(f"Diretório do Zendesk não atualizado: {e}")
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(mensagens)))) as executor:
+        resultados = list(executor.map(_processa_mensagem, mensagens))
+    # Lambda congela o container ao retornar: grava os tokens em buffer antes disso
+    token_sink.flush_pendentes()
+    return [(m, resultado == OCUPADA) for m, resultado in zip(mensagens, resultados) if resultado is not True]
+
+
+def _atraso_de_reentrega(mensagem, atraso_minimo=0, ocupada=False):
+    """
+    Seconds until a failed message should be delivered again: the ticket's backoff from the
+    retry store, never before the Glean circuit's next probe. None when this event (same ticket
+    version) was moved to the dead letters (see ticket_retry) and must not be redelivered.
+    A busy message waits out the lock's lease: the lock holder runs the pending event, so the
+    redelivery only matters if the holder died (it then finds the event done or superseded).
+    """
+    if ocupada:
+        return int(min(MAX_VISIBILITY_TIMEOUT, max(atraso_minimo, ticket_dedup.lease_do_lock())))
+    atraso = ticket_retry.atraso_para(mensagem.body)
+    if atraso is None:
+        return None
+    # While the Glean circuit is open, retrying before the next probe would only fail again
+    espera_circuito = glean_breaker.get_protecao().segundos_ate_nova_tentativa()
+    return int(min(MAX_VISIBILITY_TIMEOUT, max(atraso_minimo, atraso, espera_circuito)))
+
+
+def worker_handler(event, context):
+    """
+    AWS Lambda entry point for the queue worker (SQS event source mapping).
+    Failed records are reported as batchItemFailures so SQS makes them visible again; their
+    visibility is set to the ticket's backoff from ticket_retry. Dead-lettered tickets are not
+    reported (they stay in the retry store for `python ticket_retry.py reprocessar`).
+    """
+    mensagens = []
+    for record in event.get("Records", []):
+        try:
+            body = json.loads(record["body"])
+        except (KeyError, ValueError):
+            logging.error(f"Registro SQS com corpo inválido descartado: {record.get('messageId')}")
+            continue
+        receive_count = int(record.get("attributes", {}).get("ApproximateReceiveCount", 1))
+        mensagens.append(ticket_queue.Mensagem(record["messageId"], body, record.get("receiptHandle"), receive_count))
+
+    falhas = []
+    fila = ticket_queue.get_queue()
+    for mensagem, ocupada in processar_mensagens(mensagens):
+        atraso = _atraso_de_reentrega(mensagem, ocupada=ocupada)
+        if atraso is None:
+            logging.error(f"Mensagem {mensagem.id} removida da fila: ticket movido para os dead letters.")
+            continue
+        falhas.append(mensagem)
+        if fila is not None and mensagem.receipt:
+            try:
+                fila.change_visibility(mensagem, atraso)
+            except Exception as e:  # Best effort: without it SQS retries after the visibility timeout
+                logging.warning(f"Não foi possível adiar a mensagem {mensagem.id} por {atraso}s: {e}")
+    if falhas:
+        logging.warning(f"{len(falhas)} de {len(mensagens)} mensagem(ns) falharam e serão reprocessadas.")
+    return {"batchItemFailures": [{"itemIdentifier": m.id} for m in falhas]}
+
+
+def drenar_fila(fila=None, batch_size=None, max_workers=None, parar_quando_vazia=True):
+    """
+    Polls the queue and processes it in batches (local worker and SQLite-backed tests).
+    Successful messages are deleted; failed ones reappear after the ticket's retry backoff
+    (at least WORKER_RETRY_DELAY_SECONDS). Dead-lettered tickets, and messages without a
+    pending retry record received more than WORKER_MAX_RECEIVES times, are logged and dropped.
+    Returns (processed, failed) counters.
+    """
+    fila = fila or ticket_queue.get_queue()
+    if fila is None:
+        raise ValueError("Nenhuma fila configurada (TICKET_QUEUE_URL ou TICKET_QUEUE_SQLITE_PATH).")
+    webhook_module.get_config()  # Fail fast on an invalid pipeline configuration before taking messages
+    batch_size = batch_size or get_env_variable("WORKER_BATCH_SIZE", default_value=10, var_type=int)
+    visibility_timeout = get_env_variable("WORKER_VISIBILITY_TIMEOUT", default_value=ticket_queue.DEFAULT_VISIBILITY_TIMEOUT, var_type=int)
+    retry_delay = get_env_variable("WORKER_RETRY_DELAY_SECONDS", default_value=30, var_type=int)
+    max_receives = get_env_variable("WORKER_MAX_RECEIVES", default_value=5, var_type=int)
+
+    processados, falhados = 0, 0
+    while True:
+        mensagens = fila.receive(max_messages=batch_size, visibility_timeout=visibility_timeout)
+        if not mensagens:
+            if parar_quando_vazia:
+                break
+            time.sleep(1)
+            continue
+        falhas = {m.id: ocupada for m, ocupada in processar_mensagens(mensagens, max_workers=max_workers)}
+        for mensagem in mensagens:
+            if mensagem.id not in falhas:
+                fila.delete(mensagem)
+                processados += 1
+                continue
+            atraso = _atraso_de_reentrega(mensagem, atraso_minimo=retry_delay, ocupada=falhas[mensagem.id])
+            if atraso is None:
+                logging.error(f"Mensagem {mensagem.id} removida da fila: ticket movido para os dead letters.")
+                fila.delete(mensagem)
+                falhados += 1
+            # With a pending retry record, the retry store bounds the attempts (deferrals don't count)
+            elif mensagem.receive_count >= max_receives and not ticket_retry.retomada(mensagem.body):
+                logging.error(f"Mensagem {mensagem.id} falhou {mensagem.receive_count} vezes. Descartando payload: {json.dumps(mensagem.body)}")
+                fila.delete(mensagem)
+                falhados += 1
+            else:
+                fila.change_visibility(mensagem, atraso)
+    logging.info(f"Fila drenada: {processados} processado(s), {falhados} descartado(s).")
+    return processados, falhados
+
+
+if __name__ == "__main__":
+    # Local worker: drains the queue configured in the environment until interrupted
+    drenar_fila(parar_quando_vazia=False)
@@ -0,0 +1,264 @@
+"""
+Configuração do pipeline Zendesk -> Glean, lida e validada uma única vez.
+
+`get_config()` monta um `ConfiguracaoPipeline` imutável a partir do ambiente na primeira
+chamada e o reaproveita nas seguintes (e entre invocações "quentes" do Lambda). A tabela de
+roteamento formulário -> applicationId e o conjunto de e-mails ignorados são construídos aqui,
+não a cada ticket. As opções dos módulos de estado (cache de respostas, modo de conversa,
+de-duplicação e retry) também ficam aqui: cada módulo monta seu store a partir deste snapshot e
+o remonta quando um recarregamento muda as suas opções. Uma configuração inválida levanta
+ValueError com todos os problemas de uma vez, antes de qualquer ticket ser processado.
+`recarregar_configuracao()` relê o ambiente.
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, Optional
+
+SYSTEM_PROMPT_PADRAO = (
+    "Você receberá o conteúdo de um ticket do Zendesk. A estrutura será assim:\n\n"
+    "-------------\nTicket ID: <número>\n"
+    " - subject: <assunto do ticket>\n"
+    " - comentário 1 (<autor> | Grupos: <grupos>): <conteúdo>\n"
+    "...\n\n"
+    "Com base nisso, gere uma sugestão de resposta para resolver o problema do cliente de forma clara e útil.\n\n"
+    "A resposta deve ser educada e profissional, mantendo um tom amigável.\n\n"
+)
+
+PREAMBULO_NOTA_PADRAO = (
+    "⚠️ Esta é uma sugestão gerada automaticamente por uma versão *piloto* do Assistente Glean para Zendesk. "
+    "Sou acionado ao marcar 'Glean' em qualquer ticket!\n\n"
+    "Por favor, revise a veracidade e clareza da resposta antes de enviar ao cliente. "
+    "Qualquer feedback pode ser enviado para #glean-hub!\n\n"
+)
+
+# Pares (variável do ID do formulário no Zendesk, variável do applicationId da Glean)
+ROTAS_FORMULARIO = (
+    ("PS_ZENDESK_ID", "PS_ID"),
+    ("FSE_ZENDESK_ID", "FSE_ID"),
+    ("FIN_ZENDESK_ID", "FIN_ID"),
+)
+
+PERSISTENCIAS_TOKEN = ("dynamodb", "none")
+BACKENDS_CACHE = ("memory", "dynamodb", "none")
+BACKENDS_CONVERSA = ("memory", "sqlite", "dynamodb")
+BACKENDS_DEDUP = ("memory", "sqlite", "dynamodb", "none")
+BACKENDS_RETRY = ("sqlite", "dynamodb", "none")
+
+
+@dataclass(frozen=True)
+class ConfiguracaoPipeline:
+    zendesk_subdomain: str
+    zendesk_email: str
+    zendesk_api_token: str = field(repr=False)
+    glean_api_url: str
+    glean_token: str = field(repr=False)
+    default_app_id: str
+    rotas_formulario: Mapping[str, str] # ticket_form_id (str) -> applicationId
+    zendesk_timeout: int = 10
+    zendesk_note_timeout: int = 15
+    zendesk_comments_page_size: int = 100
+    zendesk_base_url: str = "" # Padrão: https://<ZENDESK_SUBDOMAIN>.zendesk.com/api/v2
+    glean_timeout: int = 30
+    ignore_comment_emails: FrozenSet[str] = frozenset()
+    glean_system_prompt: str = SYSTEM_PROMPT_PADRAO
+    note_preamble: str = PREAMBULO_NOTA_PADRAO
+    prompt_compaction: bool = True
+    prompt_min_repeated_block_chars: int = 200
+    prompt_char_budget: int = 60000
+    token_persistence_method: str = "dynamodb"
+    save_glean_payload: bool = False
+    save_glean_response_txt: bool = False
+    # glean_cache
+    glean_cache_backend: str = "memory"
+    glean_cache_dynamodb_table: str = ""
+    glean_cache_ttl_seconds: int = 3600
+    glean_cache_max_entries: int = 256
+    # glean_conversa (modo incremental)
+    conversation_mode: bool = False
+    conversation_store: str = "memory"
+    conversation_sqlite_path: str = "/tmp/glean_conversas.sqlite3"
+    conversation_dynamodb_table: str = ""
+    conversation_ttl_seconds: int = 30 * 86400
+    # ticket_dedup
+    dedup_store: str = "memory"
+    dedup_sqlite_path: str = "/tmp/ticket_dedup.sqlite3"
+    dedup_dynamodb_table: str = ""
+    dedup_window_seconds: int = 10
+    dedup_retry_ttl_seconds: int = 300
+    dedup_lock_ttl_seconds: int = 300
+    # ticket_retry
+    retry_store: str = "sqlite"
+    retry_sqlite_path: str = "/tmp/ticket_retry.sqlite3"
+    retry_dynamodb_table: str = ""
+    retry_max_attempts: int = 5
+    retry_base_seconds: float = 30.0
+    retry_max_seconds: float = 3600.0
+
+    def application_id_para_formulario(self, form_id) -> Optional[str]:
+        """applicationId configurado para o formulário, ou None se o formulário não tem rota."""
+        if form_id is None:
+            return None
+        return self.rotas_formulario.get(str(form_id))
+
+
+def _bool(valor):
+    return valor.strip().lower() in ("true", "1", "t", "yes", "y")
+
+
+def carregar_configuracao(env=None):
+    """Lê e valida a configuração de `env` (padrão: os.environ). Levanta ValueError listando todos os problemas."""
+    env = os.environ if env is None else env
+    problemas = []
+
+    def obrigatoria(nome):
+        valor = (env.get(nome) or "").strip()
+        if not valor:
+            problemas.append(f"variável obrigatória '{nome}' não definida")
+        return valor
+
+    def inteiro(nome, padrao, minimo=1):
+        bruto = env.get(nome)
+        if bruto is None or not bruto.strip():
+            return padrao
+        try:
+            valor = int(bruto)
+        except ValueError:
+            problemas.append(f"'{nome}' deve ser inteiro (recebido '{bruto}')")
+            return padrao
+        if valor < minimo:
+            problemas.append(f"'{nome}' deve ser >= {minimo} (recebido {valor})")
+        return valor
+
+    def decimal(nome, padrao, minimo=0.0):
+        bruto = env.get(nome)
+        if bruto is None or not bruto.strip():
+            return padrao
+        try:
+            valor = float(bruto)
+        except ValueError:
+            problemas.append(f"'{nome}' deve ser numérico (recebido '{bruto}')")
+            return padrao
+        if valor < minimo:
+            problemas.append(f"'{nome}' deve ser >= {minimo} (recebido {valor})")
+        return valor
+
+    def opcao(nome, padrao, validas):
+        valor = (env.get(nome) or padrao).strip().lower()
+        if valor not in validas:
+            problemas.append(f"{nome} '{valor}' inválido (use {' | '.join(validas)})")
+        return valor
+
+    def tabela(nome, backend):
+        """Nome da tabela DynamoDB, obrigatório quando o backend é dynamodb."""
+        valor = (env.get(nome) or "").strip()
+        if backend == "dynamodb" and not valor:
+            problemas.append(f"'{nome}' é obrigatória com o backend dynamodb")
+        return valor
+
+    rotas = {}
+    for var_form, var_app in ROTAS_FORMULARIO:
+        form_id, app_id = (env.get(var_form) or "").strip(), (env.get(var_app) or "").strip()
+        if form_id and app_id:
+            if form_id in rotas and rotas[form_id] != app_id:
+                problemas.append(f"formulário {form_id} mapeado para mais de um applicationId ({var_form})")
+            rotas[form_id] = app_id
+
+    default_app_id = (env.get("DEFAULT_GLEAN_APP_ID") or env.get("FSE_ID") or "").strip()
+    if not default_app_id:
+        problemas.append("nenhum applicationId padrão: defina DEFAULT_GLEAN_APP_ID ou FSE_ID")
+
+    persistencia = (env.get("TOKEN_PERSISTENCE_METHOD") or "dynamodb").strip().lower()
+    if persistencia not in PERSISTENCIAS_TOKEN:
+        problemas.append(f"TOKEN_PERSISTENCE_METHOD '{persistencia}' inválido (use {' | '.join(PERSISTENCIAS_TOKEN)})")
+
+    cache_backend = opcao("GLEAN_CACHE_BACKEND", "memory", BACKENDS_CACHE)
+    conversa_store = opcao("GLEAN_CONVERSATION_STORE", "memory", BACKENDS_CONVERSA)
+    dedup_store = opcao("DEDUP_STORE", "memory", BACKENDS_DEDUP)
+    no_lambda = bool((env.get("AWS_LAMBDA_FUNCTION_NAME") or "").strip())
+    retry_store = opcao("RETRY_STORE", "dynamodb" if no_lambda else "sqlite", BACKENDS_RETRY)
+    if no_lambda and retry_store == "sqlite":
+        # O /tmp é de um container só e some com ele: os dead letters (e o reprocessamento pela CLI) se perderiam
+        problemas.append("RETRY_STORE 'sqlite' não é durável no Lambda; use dynamodb (ou none)")
+    if (env.get("TICKET_QUEUE_URL") or "").strip() and dedup_store in ("memory", "sqlite"):
+        # Receptor e workers rodam em containers separados: um store local não vê o `ultimo:` do
+        # receptor (sem coalescência) nem o lock dos outros workers (duas notas para o mesmo ticket)
+        problemas.append(f"DEDUP_STORE '{dedup_store}' não é compartilhado entre containers; com TICKET_QUEUE_URL use dynamodb (ou none)")
+
+    zendesk_subdomain = obrigatoria("ZENDESK_SUBDOMAIN")
+    # ZENDESK_API_BASE_URL aponta o pipeline para outro servidor (ex.: os stubs de benchmarks/)
+    zendesk_base_url = (env.get("ZENDESK_API_BASE_URL") or "").strip().rstrip("/") or f"https://{zendesk_subdomain}.zendesk.com/api/v2"
+
+    config = dict(
+        zendesk_subdomain=zendesk_subdomain,
+        zendesk_email=obrigatoria("ZENDESK_EMAIL"),
+        zendesk_api_token=obrigatoria("ZENDESK_API_TOKEN"),
+        glean_api_url=obrigatoria("GLEAN_API_URL"),
+        glean_token=obrigatoria("GLEAN_TOKEN"),
+        default_app_id=default_app_id,
+        rotas_formulario=MappingProxyType(rotas),
+        zendesk_timeout=inteiro("ZENDESK_API_TIMEOUT", 10),
+        zendesk_note_timeout=inteiro("ZENDESK_API_TIMEOUT", 15),
+        zendesk_comments_page_size=inteiro("ZENDESK_COMMENTS_PAGE_SIZE", 100),
+        zendesk_base_url=zendesk_base_url,
+        glean_timeout=inteiro("GLEAN_API_TIMEOUT", 30),
+        ignore_comment_emails=frozenset(
+            e.strip() for e in env.get("IGNORE_COMMENT_EMAILS", "sistema@vtex.com.br,glean@vtex.com").split(",") if e.strip()
+        ),
+        glean_system_prompt=env.get("GLEAN_SYSTEM_PROMPT", SYSTEM_PROMPT_PADRAO),
+        note_preamble=env.get("ZENDESK_GLEAN_NOTE_PREAMBLE", PREAMBULO_NOTA_PADRAO),
+        prompt_compaction=_bool(env.get("PROMPT_COMPACTION", "True")),
+        prompt_min_repeated_block_chars=inteiro("PROMPT_MIN_REPEATED_BLOCK_CHARS", 200),
+        prompt_char_budget=inteiro("PROMPT_CHAR_BUDGET", 60000, minimo=0),
+        token_persistence_method=persistencia,
+        save_glean_payload=_bool(env.get("SAVE_GLEAN_PAYLOAD", "False")),
+        save_glean_response_txt=_bool(env.get("SAVE_GLEAN_RESPONSE_TXT", "False")),
+        glean_cache_backend=cache_backend,
+        glean_cache_dynamodb_table=tabela("GLEAN_CACHE_DYNAMODB_TABLE", cache_backend),
+        glean_cache_ttl_seconds=inteiro("GLEAN_CACHE_TTL_SECONDS", 3600),
+        glean_cache_max_entries=inteiro("GLEAN_CACHE_MAX_ENTRIES", 256),
+        conversation_mode=_bool(env.get("GLEAN_CONVERSATION_MODE", "False")),
+        conversation_store=conversa_store,
+        conversation_sqlite_path=env.get("GLEAN_CONVERSATION_SQLITE_PATH") or "/tmp/glean_conversas.sqlite3",
+        conversation_dynamodb_table=tabela("GLEAN_CONVERSATION_DYNAMODB_TABLE", conversa_store),
+        conversation_ttl_seconds=inteiro("GLEAN_CONVERSATION_TTL_SECONDS", 30 * 86400),
+        dedup_store=dedup_store,
+        dedup_sqlite_path=env.get("DEDUP_SQLITE_PATH") or "/tmp/ticket_dedup.sqlite3",
+        dedup_dynamodb_table=tabela("DEDUP_DYNAMODB_TABLE", dedup_store),
+        dedup_window_seconds=inteiro("DEDUP_WINDOW_SECONDS", 10, minimo=0),
+        dedup_retry_ttl_seconds=inteiro("DEDUP_RETRY_TTL_SECONDS", 300),
+        dedup_lock_ttl_seconds=inteiro("DEDUP_LOCK_TTL_SECONDS", 300),
+        retry_store=retry_store,
+        retry_sqlite_path=env.get("RETRY_SQLITE_PATH") or "/tmp/ticket_retry.sqlite3",
+        retry_dynamodb_table=tabela("RETRY_DYNAMODB_TABLE", retry_store),
+        retry_max_attempts=inteiro("RETRY_MAX_ATTEMPTS", 5),
+        retry_base_seconds=decimal("RETRY_BASE_SECONDS", 30.0),
+        retry_max_seconds=decimal("RETRY_MAX_SECONDS", 3600.0),
+    )
+    if problemas:
+        raise ValueError("Configuração inválida do pipeline: " + "; ".join(problemas))
+    return ConfiguracaoPipeline(**config)
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_config():
+    """Retorna a configuração do container, carregando e validando o ambiente na primeira chamada."""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = carregar_configuracao()
+    return _config
+
+
+def recarregar_configuracao(env=None):
+    """Relê e valida o ambiente. Em caso de erro, a configuração anterior continua valendo."""
+    global _config
+    nova = carregar_configuracao(env)
+    with _config_lock:
+        _config = nova
+    return nova
@@ -0,0 +1,160 @@
+"""
+Compactação dos comentários e orçamento de tamanho do prompt enviado à Glean.
+
+Os corpos dos comentários chegam com histórico de e-mail citado, assinaturas e blocos de log
+colados várias vezes. Antes de montar o prompt:
+
+1. `CompactadorComentarios.compactar` remove o histórico citado e a assinatura de cada corpo
+   e troca blocos longos já vistos no ticket por um marcador.
+2. `aplicar_orcamento` (ou `OrcamentoPrompt`, para comentários lidos do mais novo para o mais
+   antigo) mantém o cabeçalho (ID e assunto) e os comentários mais novos, descartando os mais
+   antigos primeiro até caber em PROMPT_CHAR_BUDGET caracteres.
+"""
+import hashlib
+import re
+
+MARCADOR_REPETIDO = "[trecho repetido omitido]"
+MARCADOR_TRUNCADO = " [...] "
+
+# Linhas que iniciam o histórico citado de uma resposta por e-mail; tudo a partir delas é descartado
+_INICIO_CITACAO = re.compile(
+    r"^\s*("
+    r"On .{0,200} wrote:|Em .{0,200} escreveu:|El .{0,200} escribió:|"
+    r"-{2,}\s*(Original Message|Mensagem original|Mensaje original)\s*-{2,}|"
+    r"_{10,}"
+    r")\s*$",
+    re.IGNORECASE,
+)
+# "From:"/"De:" sozinha aparece em texto comum ("De: segunda a sexta..."); só abre citação como
+# início de um bloco de cabeçalho de e-mail, com outros campos do cabeçalho logo em seguida
+_CABECALHO_REMETENTE = re.compile(r"^\s*\**(From|De):\**\s.+$", re.IGNORECASE)
+_CAMPO_CABECALHO = re.compile(
+    r"^\s*\**(Sent|Date|To|Cc|Subject|Enviad[oa]|Data|Para|Assunto|Fecha|Asunto):\**\s.*$",
+    re.IGNORECASE,
+)
+_LINHAS_DO_CABECALHO = 4 # Linhas procuradas logo abaixo do remetente
+_MIN_CAMPOS_DO_CABECALHO = 2 # "De: 10/01" + "Para: 15/01" sozinhos ainda são texto comum
+# Linhas que iniciam uma assinatura
+_INICIO_ASSINATURA = re.compile(
+    r"^\s*(--\s*|Sent from my .+|Enviado do meu .+|Enviado desde mi .+|Get Outlook for .+)$",
+    re.IGNORECASE,
+)
+_ESPACOS = re.compile(r"\s+")
+
+
+def _inicia_cabecalho(linhas, i):
+    """A linha `i` é o "From:"/"De:" de um cabeçalho de e-mail citado (seguido de Sent, To, Assunto...)."""
+    if not _CABECALHO_REMETENTE.match(linhas[i]):
+        return False
+    seguintes = [linha for linha in linhas[i + 1:i + 1 + _LINHAS_DO_CABECALHO] if linha.strip()]
+    return sum(1 for linha in seguintes if _CAMPO_CABECALHO.match(linha)) >= _MIN_CAMPOS_DO_CABECALHO
+
+
+def _remover_citacoes_e_assinatura(corpo):
+    linhas = []
+    originais = corpo.splitlines()
+    for i, linha in enumerate(originais):
+        if _INICIO_CITACAO.match(linha) or _INICIO_ASSINATURA.match(linha) or _inicia_cabecalho(originais, i):
+            break
+        if linha.lstrip().startswith(">"): # Linha citada isolada
+            continue
+        linhas.append(linha)
+    return "\n".join(linhas)
+
+
+class CompactadorComentarios:
+    """Compacta os corpos dos comentários de um ticket e contabiliza os bytes economizados."""
+
+    def __init__(self, min_bloco_repetido=200):
+        self.min_bloco_repetido = min_bloco_repetido
+        self._blocos_vistos = set()
+        self.bytes_originais = 0
+        self.bytes_compactados = 0
+
+    def compactar(self, corpo):
+        """Retorna o corpo limpo em uma única linha (o formato do prompt)."""
+        corpo = corpo or ""
+        self.bytes_originais += len(corpo.encode("utf-8"))
+        limpo = _remover_citacoes_e_assinatura(corpo)
+        if not limpo.strip() and corpo.strip():
+            limpo = corpo # Não apaga um comentário inteiro: a heurística pode ter errado
+
+        blocos = []
+        for bloco in re.split(r"\n\s*\n", limpo): # Parágrafos / blocos colados
+            bloco = _ESPACOS.sub(" ", bloco).strip()
+            if not bloco:
+                continue
+            if len(bloco) >= self.min_bloco_repetido:
+                digest = hashlib.sha1(bloco.encode("utf-8")).digest()
+                if digest in self._blocos_vistos:
+                    bloco = MARCADOR_REPETIDO
+                else:
+                    self._blocos_vistos.add(digest)
+            blocos.append(bloco)
+        resultado = " ".join(blocos)
+        self.bytes_compactados += len(resultado.encode("utf-8"))
+        return resultado
+
+
+def truncar_meio(texto, limite):
+    """Corta o meio de um texto longo, preservando o começo e o fim."""
+    if len(texto) <= limite:
+        return texto
+    metade = max(0, (limite - len(MARCADOR_TRUNCADO)) // 2)
+    return texto[:metade] + MARCADOR_TRUNCADO + texto[len(texto) - metade:]
+
+
+class OrcamentoPrompt:
+    """
+    Acumula as linhas de comentário, da mais nova para a mais antiga, dentro de `orcamento`
+    caracteres. `adicionar` retorna False quando a linha não cabe: as mais antigas também
+    ficariam de fora, então quem lê os comentários pode parar ali.
+    """
+
+    def __init__(self, cabecalho, orcamento):
+        self.cabecalho = cabecalho
+        self._restante = orcamento - len(cabecalho) if orcamento and orcamento > 0 else None
+        self._mantidas = [] # Da mais nova para a mais antiga
+        self.esgotado = False
+
+    def adicionar(self, linha):
+        if self.esgotado:
+            return False
+        if self._restante is None or len(linha) <= self._restante:
+            self._mantidas.append(linha)
+        elif not self._mantidas: # O comentário mais novo sempre entra, mesmo truncado
+            linha = truncar_meio(linha.rstrip("\n"), max(self._restante - 1, 0)) + "\n"
+            self._mantidas.append(linha)
+        else:
+            self.esgotado = True
+            return False
+        if self._restante is not None:
+            self._restante -= len(linha)
+        return True
+
+    def __len__(self):
+        return len(self._mantidas)
+
+    def montar(self, omitidos=None):
+        """Texto final em ordem cronológica. `omitidos=None`: quantidade desconhecida (leitura interrompida)."""
+        if omitidos:
+            aviso = f" - [{omitidos} comentário(s) mais antigo(s) omitido(s) por limite de tamanho]\n"
+        elif omitidos is None and self.esgotado:
+            aviso = " - [comentários mais antigos omitidos por limite de tamanho]\n"
+        else:
+            aviso = ""
+        return self.cabecalho + aviso + "".join(reversed(self._mantidas))
+
+
+def aplicar_orcamento(cabecalho, linhas, orcamento):
+    """
+    Junta o cabeçalho e as linhas de comentário respeitando `orcamento` caracteres.
+    Os comentários mais novos (fim da lista) têm prioridade; os antigos são descartados primeiro.
+    Retorna (texto, quantidade_de_comentarios_omitidos).
+    """
+    orcamento_prompt = OrcamentoPrompt(cabecalho, orcamento)
+    for linha in reversed(linhas):
+        if not orcamento_prompt.adicionar(linha):
+            break
+    omitidos = len(linhas) - len(orcamento_prompt)
+    return orcamento_prompt.montar(omitidos), omitidos
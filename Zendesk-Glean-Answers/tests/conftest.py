@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ) # Os módulos do pipeline são importados como irmãos, como no Lambda
+
+
+class Relogio:
+    """Relógio controlado pelo teste, para os componentes que aceitam `clock`."""
+
+    def __init__(self, agora=1000.0):
+        self.agora = agora
+
+    def __call__(self):
+        return self.agora
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio():
+    return Relogio()
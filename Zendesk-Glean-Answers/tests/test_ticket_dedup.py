@@ -0,0 +1,77 @@
+import kv_store
+from ticket_dedup import DeduplicadorTickets
+
+
+def _deduplicador(relogio):
+    return DeduplicadorTickets(kv_store.MemoryStore(clock=relogio), janela_seconds=10, ttl_reenvio_seconds=300, lease_seconds=60)
+
+
+def test_reenvio_exato_e_descartado(relogio):
+    dedup = _deduplicador(relogio)
+    assert dedup.aceitar_evento(1, "v1")
+    assert not dedup.aceitar_evento(1, "v1")
+    dedup.desfazer_evento(1, "v1")
+    assert dedup.aceitar_evento(1, "v1")
+
+
+def test_evento_superado_nao_executa(relogio):
+    dedup = _deduplicador(relogio)
+    dedup.aceitar_evento(1, "v1")
+    dedup.aceitar_evento(1, "v2")
+    chamadas = []
+    assert dedup.executar(1, "v1", chamadas.append, "v1") == DeduplicadorTickets.SUPERADO
+    assert dedup.executar(1, "v2", chamadas.append, "v2") is None
+    assert chamadas == ["v2"]
+
+
+def test_evento_com_ticket_ocupado_fica_pendente_e_o_dono_do_lock_executa(relogio):
+    dedup = _deduplicador(relogio)
+    chamadas, concorrentes = [], []
+
+    def processa(payload):
+        chamadas.append(payload["versao"])
+        if payload["versao"] == "v1":
+            # Uma atualização chega enquanto o ticket ainda está em processamento
+            dedup.aceitar_evento(1, "v2")
+            concorrentes.append(dedup.executar(1, "v2", processa, {"versao": "v2"}))
+        return True
+
+    dedup.aceitar_evento(1, "v1")
+    assert dedup.executar(1, "v1", processa, {"versao": "v1"}) is True
+    assert concorrentes == [DeduplicadorTickets.OCUPADO]
+    assert chamadas == ["v1", "v2"]
+    assert dedup.store.get("lock:1") is None
+    assert dedup.store.get("pendente:1") is None
+
+    # A nova entrega da mensagem que ficou pendente não executa o evento de novo
+    assert dedup.executar(1, "v2", processa, {"versao": "v2"}) == DeduplicadorTickets.SUPERADO
+    assert chamadas == ["v1", "v2"]
+
+
+def test_evento_pendente_superado_nao_executa(relogio):
+    dedup = _deduplicador(relogio)
+    chamadas = []
+
+    def processa(payload):
+        chamadas.append(payload["versao"])
+        if payload["versao"] == "v1":
+            dedup.aceitar_evento(1, "v2")
+            dedup.executar(1, "v2", processa, {"versao": "v2"})
+            dedup.aceitar_evento(1, "v3") # Chega depois de v2 ficar pendente e ainda não foi entregue
+        return True
+
+    dedup.aceitar_evento(1, "v1")
+    dedup.executar(1, "v1", processa, {"versao": "v1"})
+    assert chamadas == ["v1"]
+    assert dedup.executar(1, "v3", processa, {"versao": "v3"}) is True
+    assert chamadas == ["v1", "v3"]
+
+
+def test_lock_de_dono_que_morreu_expira_com_o_lease(relogio):
+    dedup = _deduplicador(relogio)
+    dedup.store.reservar("lock:1", "dono-morto", dedup.lease_seconds)
+    chamadas = []
+    assert dedup.executar(1, "v1", chamadas.append, "v1") == DeduplicadorTickets.OCUPADO
+    relogio.avancar(dedup.lease_seconds)
+    assert dedup.executar(1, "v1", chamadas.append, "v1") is None
+    assert chamadas == ["v1"]
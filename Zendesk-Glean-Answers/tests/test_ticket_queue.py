@@ -0,0 +1,36 @@
+from ticket_queue import SqliteQueue
+
+
+def _fila(tmp_path, relogio):
+    return SqliteQueue(str(tmp_path / "fila.sqlite3"), clock=relogio)
+
+
+def test_mensagem_com_atraso_so_fica_visivel_depois_dele(tmp_path, relogio):
+    fila = _fila(tmp_path, relogio)
+    fila.send({"ticket": {"id": 1}}, delay_seconds=10)
+    assert fila.receive() == []
+    relogio.avancar(10)
+    [mensagem] = fila.receive()
+    assert mensagem.body == {"ticket": {"id": 1}}
+    assert mensagem.receive_count == 1
+
+
+def test_mensagem_nao_apagada_volta_depois_do_visibility_timeout(tmp_path, relogio):
+    fila = _fila(tmp_path, relogio)
+    fila.send({"ticket": {"id": 1}})
+    [primeira] = fila.receive(visibility_timeout=30)
+    assert fila.receive() == []
+    relogio.avancar(30)
+    [segunda] = fila.receive(visibility_timeout=30)
+    assert segunda.receive_count == 2
+
+    # O receipt da entrega expirada não apaga a mensagem redistribuída
+    fila.delete(primeira)
+    assert len(fila) == 1
+    fila.change_visibility(segunda, 120)
+    relogio.avancar(119)
+    assert fila.receive() == []
+    relogio.avancar(1)
+    [terceira] = fila.receive()
+    fila.delete(terceira)
+    assert len(fila) == 0
@@ -0,0 +1,44 @@
+from token_sink import DynamoDBTokenSink, TabelaEmMemoria
+
+
+class TabelaQueFalha(TabelaEmMemoria):
+    def __init__(self, falhas):
+        super().__init__()
+        self.falhas = falhas
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        if self.falhas:
+            self.falhas -= 1
+            raise RuntimeError("ProvisionedThroughputExceededException")
+        return super().batch_writer(overwrite_by_pkeys)
+
+
+def _item(ticket_id, timestamp):
+    return {"ticket_id": ticket_id, "timestamp_salvo_utc": timestamp, "token": f"t-{ticket_id}-{timestamp}"}
+
+
+def test_flush_grava_o_buffer_com_ttl(relogio):
+    tabela = TabelaEmMemoria()
+    sink = DynamoDBTokenSink(tabela, flush_interval=3600, ttl_seconds=3600, clock=relogio) # O teste controla os flushes
+    sink.adicionar(_item("1", "a"))
+    sink.adicionar(_item("1", "b"))
+    assert len(sink) == 2 and not tabela.itens
+    assert sink.flush() == 2
+    assert len(sink) == 0
+    assert [i["timestamp_salvo_utc"] for i in tabela.query("ticket_id = :t", {":t": "1"})["Items"]] == ["a", "b"]
+    assert tabela.itens[("1", "a")]["expira_em"] == int(relogio() + 3600)
+
+
+def test_lote_que_falha_volta_ao_buffer_ate_o_limite_de_tentativas(relogio):
+    sink = DynamoDBTokenSink(TabelaQueFalha(falhas=1), flush_interval=3600, max_tentativas=3, clock=relogio)
+    sink.adicionar(_item("1", "a"))
+    assert sink.flush() == 0
+    assert len(sink) == 1
+    assert sink.flush() == 1
+    assert sink.itens_gravados == 1
+
+    sink = DynamoDBTokenSink(TabelaQueFalha(falhas=5), flush_interval=3600, max_tentativas=2, clock=relogio)
+    sink.adicionar(_item("1", "a"))
+    sink.encerrar()
+    assert len(sink) == 0
+    assert sink.itens_descartados == 1
@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+
+import zendesk_rate_limit
+from zendesk_rate_limit import BACKFILL, AgendadorZendesk, prioridade
+
+
+class Resposta:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.fechada = False
+
+    def close(self):
+        self.fechada = True
+
+
+@pytest.fixture(autouse=True)
+def reavaliacao_rapida(monkeypatch):
+    # Quem espera reavalia o relógio do teste a cada 10 ms em vez de a cada segundo
+    monkeypatch.setattr(zendesk_rate_limit, "ESPERA_MAXIMA_SEM_SINAL", 0.01)
+
+
+def _em_thread(fn):
+    resultado = []
+    thread = threading.Thread(target=lambda: resultado.append(fn()), daemon=True)
+    thread.start()
+    return thread, resultado
+
+
+def test_429_bloqueia_todas_as_requisicoes_ate_o_retry_after(relogio):
+    agendador = AgendadorZendesk(max_tentativas_429=0, clock=relogio)
+    resposta = agendador.executar(lambda: Resposta(429, {"Retry-After": "30"}))
+    assert resposta.status_code == 429
+    stats = agendador.stats()
+    assert stats["bloqueado_por_segundos"] == 30
+    assert stats["limite_concorrencia"] == 4 # AIMD: metade de 8
+
+    thread, resultado = _em_thread(lambda: agendador.executar(lambda: Resposta(200)))
+    relogio.avancar(29)
+    thread.join(0.2)
+    assert thread.is_alive()
+    relogio.avancar(1)
+    thread.join(2)
+    assert not thread.is_alive()
+    assert resultado[0].status_code == 200
+
+
+def test_429_e_refeito_depois_do_retry_after(relogio):
+    agendador = AgendadorZendesk(max_tentativas_429=3, clock=relogio)
+    respostas = [Resposta(429, {"Retry-After": "30"}), Resposta(200)]
+    enviadas_em = []
+
+    def enviar():
+        enviadas_em.append(relogio())
+        return respostas[len(enviadas_em) - 1]
+
+    thread, resultado = _em_thread(lambda: agendador.executar(enviar))
+    thread.join(0.2)
+    assert len(enviadas_em) == 1 # Retry-After ainda não passou
+    relogio.avancar(30)
+    thread.join(2)
+    assert resultado[0].status_code == 200
+    assert enviadas_em == [1000.0, 1030.0]
+    assert respostas[0].fechada
+    assert agendador.stats()["respostas_429"] == 1
+
+
+def test_429_depois_do_limite_de_tentativas_volta_ao_chamador(relogio):
+    agendador = AgendadorZendesk(max_tentativas_429=1, clock=relogio)
+
+    def enviar():
+        relogio.avancar(1) # Um 429 zera os tokens; o segundo de resposta reabastece o bucket
+        return Resposta(429, {"Retry-After": "0"})
+
+    assert agendador.executar(enviar).status_code == 429
+    assert agendador.stats()["respostas_429"] == 2
+
+
+def test_backfill_nao_consome_a_reserva_do_interativo(relogio):
+    # 60/min com rajada de 5 s: 5 tokens, dos quais 25% (1,25) ficam para o interativo
+    agendador = AgendadorZendesk(taxa_por_minuto=60, rajada_segundos=5, reserva_interativa=0.25, clock=relogio)
+
+    def backfill():
+        with prioridade(BACKFILL):
+            return agendador.executar(lambda: Resposta(200))
+
+    for _ in range(3):
+        assert backfill().status_code == 200
+    thread, resultado = _em_thread(backfill)
+    thread.join(0.2)
+    assert thread.is_alive() # Restam 2 tokens: abaixo de 1 + reserva para o backfill
+
+    # O interativo usa a reserva sem esperar
+    assert agendador.executar(lambda: Resposta(200)).status_code == 200
+    assert agendador.executar(lambda: Resposta(200)).status_code == 200
+    assert agendador.stats()["tokens"] == 0
+
+    relogio.avancar(3) # Reabastece 3 tokens: o backfill volta a passar
+    thread.join(2)
+    assert resultado[0].status_code == 200
+
+
+def test_cabecalhos_do_zendesk_ajustam_a_taxa_e_os_tokens(relogio):
+    agendador = AgendadorZendesk(taxa_por_minuto=400, utilizacao=0.5, clock=relogio)
+    agendador.executar(lambda: Resposta(200, {"X-Rate-Limit": "200", "X-Rate-Limit-Remaining": "3"}))
+    stats = agendador.stats()
+    assert stats["taxa_por_minuto"] == 100
+    assert stats["tokens"] == 3
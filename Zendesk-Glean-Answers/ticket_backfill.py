@@ -0,0 +1,424 @@
+"""
+Backfill em massa: gera sugestões para tickets já existentes, sem esperar um webhook.
+
+Os tickets vêm de uma das fontes do Zendesk, lidas página a página com paginação por cursor:
+- uma view (`--view ID`);
+- uma busca (`--busca "form:... status<solved"`, via /search/export);
+- o export incremental de tickets (`--incremental DESDE`, epoch ou data ISO). Ao fim do stream o
+  cursor fica no checkpoint, e rodar de novo processa só o que mudou desde então.
+
+Cada ticket passa por `processa_ticket`, o mesmo pipeline dos webhooks, em --concorrencia threads
+e no máximo --por-minuto tickets por minuto. As chamadas ao Zendesk rodam com prioridade BACKFILL
+(zendesk_rate_limit): os webhooks interativos passam na frente e a reserva deles é respeitada.
+Falhas seguem o retry normal do pipeline (ticket_retry).
+
+O progresso fica num checkpoint JSON (--checkpoint; padrão em BACKFILL_CHECKPOINT_DIR, /tmp): o
+cursor da página em andamento e os tickets dela já concluídos. Um backfill interrompido (Ctrl+C,
+erro, fim do container) continua de onde parou com o mesmo comando.
+
+    python ticket_backfill.py --view 360001234567 --concorrencia 4 --por-minuto 120
+    python ticket_backfill.py --busca "form:12345 status<solved" --limite 500
+    python ticket_backfill.py --incremental 2024-01-01 --formulario 12345
+    python ticket_backfill.py --view 360001234567 --simular
+"""
+import argparse
+import atexit
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import token_sink
+import zendesk_rate_limit
+
+PAGE_SIZE = 100 # Máximo da paginação por cursor de views e do search export
+STATUS_PADRAO = "new,open,pending,hold"
+DEFAULT_CHECKPOINT_DIR = "/tmp"
+
+
+class ErroFonteBackfill(Exception):
+    """Uma página da fonte não pôde ser lida; o checkpoint continua na página anterior."""
+
+
+def _get(session, url, params, timeout):
+    try:
+        response = session.get(url, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        raise ErroFonteBackfill(f"Erro ao ler {url}: {e}") from e
+    except ValueError as e:
+        raise ErroFonteBackfill(f"Resposta inválida de {url}: {e}") from e
+
+
+##--------------------------------------------------------------------------##
+## Fontes de tickets
+##--------------------------------------------------------------------------##
+class FonteView:
+    """Tickets de uma view, com paginação por cursor."""
+
+    def __init__(self, view_id):
+        self.view_id = str(view_id)
+
+    def descricao(self):
+        return {"tipo": "view", "view_id": self.view_id}
+
+    def pagina(self, session, base_url, cursor, timeout):
+        params = {"page[size]": PAGE_SIZE}
+        if cursor:
+            params["page[after]"] = cursor
+        dados = _get(session, f"{base_url}/views/{self.view_id}/tickets.json", params, timeout)
+        return _pagina_com_meta(dados, "tickets")
+
+    def total(self, session, base_url, timeout):
+        dados = _get(session, f"{base_url}/views/{self.view_id}/count.json", {}, timeout)
+        return (dados.get("view_count") or {}).get("value")
+
+
+class FonteBusca:
+    """Tickets de uma busca do Zendesk, pelo search export (cursor, sem o limite de 1000 resultados)."""
+
+    def __init__(self, consulta):
+        self.consulta = consulta
+
+    def descricao(self):
+        return {"tipo": "busca", "consulta": self.consulta}
+
+    def pagina(self, session, base_url, cursor, timeout):
+        params = {"query": self.consulta, "filter[type]": "ticket", "page[size]": PAGE_SIZE}
+        if cursor:
+            params["page[after]"] = cursor
+        dados = _get(session, f"{base_url}/search/export.json", params, timeout)
+        return _pagina_com_meta(dados, "results")
+
+    def total(self, session, base_url, timeout):
+        dados = _get(session, f"{base_url}/search/count.json", {"query": f"type:ticket {self.consulta}"}, timeout)
+        return dados.get("count")
+
+
+class FonteIncremental:
+    """Export incremental de tickets por cursor, a partir de `desde` (epoch)."""
+
+    def __init__(self, desde):
+        self.desde = int(desde)
+
+    def descricao(self):
+        return {"tipo": "incremental", "desde": self.desde}
+
+    def pagina(self, session, base_url, cursor, timeout):
+        params = {"cursor": cursor} if cursor else {"start_time": self.desde}
+        dados = _get(session, f"{base_url}/incremental/tickets/cursor.json", params, timeout)
+        # No fim do stream o cursor é guardado mesmo assim: é dele que parte a próxima execução
+        return dados.get("tickets", []), dados.get("after_cursor"), bool(dados.get("end_of_stream"))
+
+    def total(self, session, base_url, timeout):
+        return None # O export não informa o total
+
+
+def _pagina_com_meta(dados, chave):
+    """(tickets, próximo cursor, fim) de uma resposta com paginação por cursor em `meta`."""
+    meta = dados.get("meta") or {}
+    mais = bool(meta.get("has_more") and meta.get("after_cursor"))
+    return dados.get(chave, []), meta.get("after_cursor") if mais else None, not mais
+
+
+def _paginas(fonte, session, base_url, cursor, timeout):
+    """Gera (tickets, próximo cursor, fim) a partir de `cursor` até o fim da fonte."""
+    while True:
+        tickets, proximo, fim = fonte.pagina(session, base_url, cursor, timeout)
+        yield tickets, proximo, fim
+        if fim or not proximo:
+            return
+        cursor = proximo
+
+
+def _epoch(valor):
+    if re.fullmatch(r"\d+", valor):
+        return int(valor)
+    data = datetime.datetime.fromisoformat(valor)
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=datetime.timezone.utc)
+    return int(data.timestamp())
+
+
+##--------------------------------------------------------------------------##
+## Checkpoint e progresso
+##--------------------------------------------------------------------------##
+class Checkpoint:
+    """Cursor da página em andamento, tickets dela já concluídos e totais, gravados de forma atômica."""
+
+    def __init__(self, caminho, fonte):
+        self.caminho = caminho # None: só em memória (--simular)
+        self.fonte = fonte
+        self.cursor = None
+        self.feitos = set() # Tickets da página atual já processados
+        self.totais = {"ok": 0, "falha": 0, "ignorado": 0}
+        self.concluido = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def abrir(cls, caminho, fonte, reiniciar=False):
+        checkpoint = cls(caminho, fonte)
+        if reiniciar or not os.path.exists(caminho):
+            return checkpoint
+        with open(caminho, encoding="utf-8") as f:
+            dados = json.load(f)
+        if dados.get("fonte") != fonte:
+            raise ValueError(f"O checkpoint {caminho} é de outra fonte ({dados.get('fonte')}). Use --reiniciar ou outro --checkpoint.")
+        checkpoint.cursor = dados.get("cursor")
+        checkpoint.feitos = set(dados.get("feitos", []))
+        checkpoint.totais.update(dados.get("totais", {}))
+        checkpoint.concluido = bool(dados.get("concluido"))
+        return checkpoint
+
+    @property
+    def processados(self):
+        return sum(self.totais.values())
+
+    def marcar(self, ticket_id, resultado):
+        chave = {True: "ok", False: "falha"}.get(resultado, "ignorado")
+        with self._lock:
+            self.feitos.add(str(ticket_id))
+            self.totais[chave] += 1
+            self._gravar()
+
+    def avancar(self, cursor, concluido=False):
+        with self._lock:
+            self.cursor = cursor
+            self.feitos = set()
+            self.concluido = concluido
+            self._gravar()
+
+    def _gravar(self):
+        if self.caminho is None:
+            return
+        dados = {
+            "fonte": self.fonte,
+            "cursor": self.cursor,
+            "feitos": sorted(self.feitos),
+            "totais": self.totais,
+            "concluido": self.concluido,
+            "atualizado_em": datetime.datetime.utcnow().isoformat() + "Z",
+        }
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False)
+        os.replace(temporario, self.caminho) # Uma interrupção no meio da escrita não corrompe o checkpoint
+
+
+def caminho_padrao_do_checkpoint(fonte):
+    chave = hashlib.sha1(json.dumps(fonte, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+    diretorio = os.environ.get("BACKFILL_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+    return os.path.join(diretorio, f"backfill_{fonte['tipo']}_{chave}.json")
+
+
+def _duracao(segundos):
+    segundos = int(segundos)
+    return f"{segundos // 3600:d}:{segundos % 3600 // 60:02d}:{segundos % 60:02d}"
+
+
+class Progresso:
+    """Vazão e ETA da execução atual (os totais do checkpoint incluem execuções anteriores)."""
+
+    def __init__(self, checkpoint, total=None, intervalo=10.0):
+        self.checkpoint = checkpoint
+        self.total = total
+        self.intervalo = intervalo
+        self.inicio = time.monotonic()
+        self.nesta_execucao = 0
+        self._ultimo = 0.0
+        self._lock = threading.Lock()
+
+    def registrar(self):
+        with self._lock:
+            self.nesta_execucao += 1
+
+    def linha(self):
+        decorrido = time.monotonic() - self.inicio
+        por_minuto = self.nesta_execucao / decorrido * 60 if decorrido > 0 else 0.0
+        totais = self.checkpoint.totais
+        texto = f"{self.checkpoint.processados}"
+        if self.total:
+            texto += f"/{self.total}"
+        texto += (f" ticket(s) | {por_minuto:.1f}/min | ok {totais['ok']} falha {totais['falha']} "
+                  f"ignorado {totais['ignorado']} | {_duracao(decorrido)}")
+        if self.total and por_minuto > 0:
+            restantes = max(0, self.total - self.checkpoint.processados)
+            texto += f" | ETA {_duracao(restantes / por_minuto * 60)}"
+        return texto
+
+    def talvez_imprimir(self):
+        agora = time.monotonic()
+        if agora - self._ultimo >= self.intervalo:
+            self._ultimo = agora
+            print(self.linha(), flush=True)
+
+
+##--------------------------------------------------------------------------##
+## Execução
+##--------------------------------------------------------------------------##
+def _selecionado(ticket, status, formulario):
+    if status and ticket.get("status") not in status:
+        return False
+    return not formulario or str(ticket.get("ticket_form_id")) == str(formulario)
+
+
+def _payload(ticket):
+    """Payload no formato do webhook: o pipeline busca o resto do ticket."""
+    return {"ticket": {"id": ticket["id"], "updated_at": ticket.get("updated_at")}}
+
+
+def executar_backfill(fonte, checkpoint, processar, session, base_url, timeout, concorrencia=4,
+                      por_minuto=0, limite=None, status=None, formulario=None, progresso=None, parar=None):
+    """
+    Percorre a fonte a partir do checkpoint e chama `processar(payload)` para cada ticket
+    selecionado, com no máximo `concorrencia` em paralelo e `por_minuto` por minuto (0 = sem limite).
+    A página só é dada como concluída (cursor avançado) depois de todos os tickets dela terminarem.
+    """
+    parar = parar or threading.Event()
+    vagas = threading.BoundedSemaphore(max(1, concorrencia))
+    intervalo = 60.0 / por_minuto if por_minuto else 0.0
+    proximo_envio = time.monotonic()
+    enviados = 0
+
+    def tarefa(payload):
+        try:
+            with zendesk_rate_limit.prioridade(zendesk_rate_limit.BACKFILL):
+                resultado = processar(payload)
+        except Exception as e:
+            logging.error(f"Erro não tratado no backfill do ticket {payload['ticket']['id']}: {e}", exc_info=True)
+            resultado = False
+        finally:
+            vagas.release()
+        checkpoint.marcar(payload["ticket"]["id"], resultado)
+        if progresso:
+            progresso.registrar()
+
+    def aguardar_vaga():
+        while not vagas.acquire(timeout=1.0): # Acorda para imprimir o progresso e ver o `parar`
+            if progresso:
+                progresso.talvez_imprimir()
+            if parar.is_set():
+                return False
+        if progresso:
+            progresso.talvez_imprimir()
+        if parar.is_set():
+            vagas.release()
+            return False
+        return True
+
+    with zendesk_rate_limit.prioridade(zendesk_rate_limit.BACKFILL), \
+            ThreadPoolExecutor(max_workers=max(1, concorrencia), thread_name_prefix="backfill") as pool:
+        for tickets, proximo, fim in _paginas(fonte, session, base_url, checkpoint.cursor, timeout):
+            futuros = []
+            for ticket in tickets:
+                if str(ticket.get("id")) in checkpoint.feitos or not _selecionado(ticket, status, formulario):
+                    continue
+                if limite is not None and enviados >= limite or not aguardar_vaga():
+                    break
+                espera = proximo_envio - time.monotonic()
+                if espera > 0 and parar.wait(espera):
+                    vagas.release()
+                    break
+                proximo_envio = max(proximo_envio, time.monotonic()) + intervalo
+                futuros.append(pool.submit(tarefa, _payload(ticket)))
+                enviados += 1
+            for futuro in futuros:
+                futuro.result()
+            if parar.is_set() or (limite is not None and enviados >= limite):
+                return False # Página possivelmente incompleta: o cursor fica nela
+            checkpoint.avancar(proximo if proximo else checkpoint.cursor, concluido=fim)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera sugestões da Glean em massa para tickets existentes, com checkpoint.")
+    fontes = parser.add_mutually_exclusive_group(required=True)
+    fontes.add_argument("--view", help="ID da view do Zendesk")
+    fontes.add_argument("--busca", help="Consulta de busca do Zendesk (tickets)")
+    fontes.add_argument("--incremental", metavar="DESDE", help="Export incremental a partir de um epoch ou data ISO")
+    parser.add_argument("--status", default=STATUS_PADRAO, help=f"Status aceitos, separados por vírgula (padrão: {STATUS_PADRAO}; vazio = todos)")
+    parser.add_argument("--formulario", help="Só tickets deste ticket_form_id")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--por-minuto", type=float, default=60, help="Máximo de tickets iniciados por minuto (0 = sem limite)")
+    parser.add_argument("--limite", type=int, help="Processa no máximo N tickets nesta execução")
+    parser.add_argument("--checkpoint", help="Arquivo de checkpoint (padrão: derivado da fonte em BACKFILL_CHECKPOINT_DIR)")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora o checkpoint existente e começa do início")
+    parser.add_argument("--simular", action="store_true", help="Só lista os tickets selecionados, sem processar")
+    parser.add_argument("--progresso", type=float, default=10.0, help="Intervalo entre as linhas de progresso (s)")
+    parser.add_argument("--log", default="WARNING", help="Nível de log do pipeline")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+
+    if args.view:
+        fonte = FonteView(args.view)
+    elif args.busca:
+        fonte = FonteBusca(args.busca)
+    else:
+        fonte = FonteIncremental(_epoch(args.incremental))
+    status = {s.strip() for s in args.status.split(",") if s.strip()}
+
+    import webhook_glean_zendesk
+    atexit.register(token_sink.encerrar) # Grava os tokens em buffer dos últimos tickets (também após Ctrl+C)
+    base_url, session = webhook_glean_zendesk._zendesk_client()
+    timeout = webhook_glean_zendesk.get_config().zendesk_timeout
+
+    caminho = args.checkpoint or caminho_padrao_do_checkpoint(fonte.descricao())
+    try:
+        checkpoint = Checkpoint.abrir(caminho, fonte.descricao(), reiniciar=args.reiniciar)
+    except ValueError as e:
+        parser.error(str(e))
+    if checkpoint.concluido and not isinstance(fonte, FonteIncremental):
+        print(f"Backfill já concluído segundo {caminho} ({checkpoint.processados} ticket(s)). Use --reiniciar para refazer.")
+        return
+
+    try:
+        total = fonte.total(session, base_url, timeout)
+    except ErroFonteBackfill as e:
+        logging.warning(f"Total de tickets indisponível (sem ETA): {e}")
+        total = None
+    if total is not None:
+        print(f"Tickets na fonte: {total} (o ETA não desconta os filtros de status e formulário).")
+
+    if args.simular:
+        processar = lambda payload: print(payload["ticket"]["id"]) # Sem pipeline nem checkpoint em disco
+        checkpoint = Checkpoint(None, fonte.descricao())
+    else:
+        processar = webhook_glean_zendesk.processa_ticket
+        print(f"Checkpoint: {caminho}" + (f" (retomando: {checkpoint.processados} já processado(s))" if checkpoint.processados else ""))
+
+    progresso = Progresso(checkpoint, total=total, intervalo=args.progresso)
+    parar = threading.Event()
+    try:
+        completo = executar_backfill(
+            fonte, checkpoint, processar, session, base_url, timeout, concorrencia=args.concorrencia,
+            por_minuto=0 if args.simular else args.por_minuto, limite=args.limite, status=status, formulario=args.formulario,
+            progresso=progresso, parar=parar,
+        )
+    except KeyboardInterrupt:
+        parar.set()
+        print("\nInterrompido: aguardando os tickets em andamento...", file=sys.stderr)
+        completo = False
+    except ErroFonteBackfill as e:
+        print(f"\n{e}", file=sys.stderr)
+        completo = False
+
+    print(progresso.linha())
+    if args.simular:
+        return
+    if completo:
+        print("Backfill concluído." + (" Rode de novo para processar as atualizações seguintes." if isinstance(fonte, FonteIncremental) else ""))
+    else:
+        print(f"Backfill parcial. Rode o mesmo comando para continuar de {caminho}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Captura do tráfego real de um ticket, para replay determinístico (benchmarks/replay.py).
+
+Com CAPTURE_DIR definido, cada execução de `processa_ticket` (amostrada por CAPTURE_SAMPLE_RATE)
+grava um arquivo `<data>_<ticket>_<id>.json.gz` com:
+- o payload do webhook;
+- as URLs base do Zendesk e da Glean da configuração;
+- cada troca HTTP feita pelas sessões de http_client: método, URL, corpo enviado, status, alguns
+  cabeçalhos de resposta e o corpo recebido, linha a linha, com o instante em que cada linha chegou.
+  Os tempos são relativos ao início do ticket, então o replay reproduz a latência (e o TTFT da Glean).
+
+Antes de gravar, os dados são anonimizados. Cabeçalhos de requisição (Authorization) não são
+gravados. E-mails e sequências com cara de token viram pseudônimos estáveis, então o mesmo valor
+continua casando entre requisição e resposta. Telefones e CPF/CNPJ são mascarados.
+CAPTURE_SCRUB_PATTERNS acrescenta regex (separadas por vírgula) a mascarar.
+
+É o formato de captura que substitui, para replay, os dumps de SAVE_GLEAN_PAYLOAD e
+SAVE_GLEAN_RESPONSE_TXT (que continuam disponíveis para inspeção rápida).
+"""
+import contextlib
+import contextvars
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+FORMATO = 1
+CABECALHOS_GRAVADOS = ("Content-Type", "Retry-After", "X-Rate-Limit", "X-Rate-Limit-Remaining")
+
+_atual = contextvars.ContextVar("captura_ticket", default=None)
+_sal = os.environ.get("CAPTURE_SCRUB_SALT") or uuid.uuid4().hex # Pseudônimos estáveis no processo, não reversíveis
+
+_EMAIL = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}")
+_TOKEN = re.compile(r"(?<![A-Za-z0-9_\-])[A-Za-z0-9_\-]{32,}(?![A-Za-z0-9_\-])")
+_MASCARAS = (
+    re.compile(r"\b\d{3}\.\d{3}\.\d{3}-\d{2}\b"), # CPF
+    re.compile(r"\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b"), # CNPJ
+    re.compile(r"\+?\(?\d{2,3}\)?[\s.\-]?\d{4,5}[\s.\-]\d{4}\b"), # Telefone
+)
+
+
+def _pseudonimo(valor):
+    return hashlib.sha256((_sal + valor).encode("utf-8")).hexdigest()[:12]
+
+
+def _padroes_extras():
+    return [re.compile(p.strip()) for p in os.environ.get("CAPTURE_SCRUB_PATTERNS", "").split(",") if p.strip()]
+
+
+def anonimizar(texto, extras=()):
+    """Troca e-mails e tokens por pseudônimos estáveis e mascara documentos, telefones e `extras`."""
+    if not texto:
+        return texto
+    texto = _EMAIL.sub(lambda m: f"u{_pseudonimo(m.group(0).lower())}@exemplo.invalid", texto)
+    texto = _TOKEN.sub(lambda m: f"tok{_pseudonimo(m.group(0))}", texto)
+    for padrao in (*_MASCARAS, *extras):
+        texto = padrao.sub("[removido]", texto)
+    return texto
+
+
+class _Troca:
+    """Uma requisição HTTP e a resposta recebida, com os tempos relativos ao início da captura."""
+
+    def __init__(self, request, inicio_ms):
+        self.metodo = request.method
+        self.url = request.url
+        corpo = request.body
+        self.corpo = corpo.decode("utf-8", errors="replace") if isinstance(corpo, bytes) else corpo
+        self.inicio_ms = inicio_ms
+        self.cabecalhos_ms = None
+        self.status = None
+        self.cabecalhos = {}
+        self.erro = None
+        self._pedacos = [] # (ms desde o início da troca, bytes)
+
+    def registro(self, extras):
+        # Junta o corpo e o reparte por linha, cada linha com o instante em que terminou de chegar:
+        # um e-mail nunca fica dividido entre dois pedaços na hora de anonimizar
+        linhas, buffer, fim = [], b"", 0
+        for ms, dados in self._pedacos:
+            buffer += dados
+            while b"\n" in buffer:
+                linha, buffer = buffer.split(b"\n", 1)
+                linhas.append([ms, linha + b"\n"])
+            fim = ms
+        if buffer:
+            linhas.append([fim, buffer])
+        return {
+            "metodo": self.metodo,
+            "url": anonimizar(self.url, extras),
+            "corpo": anonimizar(self.corpo, extras),
+            "inicio_ms": round(self.inicio_ms, 1),
+            "cabecalhos_ms": None if self.cabecalhos_ms is None else round(self.cabecalhos_ms, 1),
+            "status": self.status,
+            "cabecalhos": self.cabecalhos,
+            "erro": self.erro,
+            "pedacos": [[round(ms, 1), anonimizar(dados.decode("utf-8", errors="replace"), extras)] for ms, dados in linhas],
+        }
+
+
+class _RawGravador:
+    """Envolve o `response.raw` do urllib3 e guarda cada pedaço lido, com o instante da leitura."""
+
+    def __init__(self, raw, troca, relogio):
+        self._raw = raw
+        self._troca = troca
+        self._relogio = relogio # ms desde o início da troca
+
+    def __getattr__(self, nome):
+        return getattr(self._raw, nome)
+
+    def _guardar(self, dados):
+        if dados:
+            self._troca._pedacos.append((self._relogio(), bytes(dados)))
+        return dados
+
+    def stream(self, *args, **kwargs):
+        for dados in self._raw.stream(*args, **kwargs):
+            yield self._guardar(dados)
+
+    def read(self, *args, **kwargs):
+        return self._guardar(self._raw.read(*args, **kwargs))
+
+
+class CapturaTicket:
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.inicio = time.perf_counter()
+        self.capturado_em = datetime.datetime.utcnow().isoformat() + "Z"
+        self.trocas = []
+        self._lock = threading.Lock()
+
+    def _ms(self, desde=None):
+        return (time.perf_counter() - (self.inicio if desde is None else desde)) * 1000
+
+    def nova_troca(self, request, inicio_envio):
+        troca = _Troca(request, (inicio_envio - self.inicio) * 1000)
+        with self._lock:
+            self.trocas.append(troca)
+        return troca
+
+    def registro(self):
+        extras = _padroes_extras()
+        bases = {}
+        try:
+            from pipeline_config import get_config
+            config = get_config()
+            bases = {"zendesk": config.zendesk_base_url, "glean": config.glean_api_url}
+        except Exception as e: # A captura não depende de uma configuração válida
+            logging.warning(f"Captura sem as URLs base do pipeline: {e}")
+        return {
+            "formato": FORMATO,
+            "capturado_em": self.capturado_em,
+            "ticket_id": str(self.payload.get("ticket", {}).get("id")),
+            "payload": json.loads(anonimizar(json.dumps(self.payload, ensure_ascii=False), extras)),
+            "bases": bases,
+            "duracao_ms": round(self._ms(), 1),
+            "trocas": [t.registro(extras) for t in self.trocas],
+        }
+
+
+def registrar_resposta(request, response, inicio_envio):
+    """Chamado pelo adapter de http_client depois de receber os cabeçalhos da resposta."""
+    captura = _atual.get()
+    if captura is None:
+        return
+    troca = captura.nova_troca(request, inicio_envio)
+    troca.cabecalhos_ms = (time.perf_counter() - inicio_envio) * 1000
+    troca.status = response.status_code
+    troca.cabecalhos = {nome: response.headers[nome] for nome in CABECALHOS_GRAVADOS if nome in response.headers}
+    response.raw = _RawGravador(response.raw, troca, lambda: (time.perf_counter() - inicio_envio) * 1000)
+
+
+def registrar_erro(request, erro, inicio_envio):
+    captura = _atual.get()
+    if captura is None:
+        return
+    troca = captura.nova_troca(request, inicio_envio)
+    troca.cabecalhos_ms = (time.perf_counter() - inicio_envio) * 1000
+    troca.erro = type(erro).__name__
+
+
+def _habilitada():
+    if not os.environ.get("CAPTURE_DIR"):
+        return False
+    try:
+        taxa = float(os.environ.get("CAPTURE_SAMPLE_RATE", 1.0))
+    except ValueError:
+        taxa = 1.0
+    return random.random() < taxa
+
+
+@contextlib.contextmanager
+def capturar_ticket(payload):
+    """Captura o tráfego HTTP do bloco se CAPTURE_DIR estiver definido (e o ticket cair na amostra)."""
+    if not _habilitada():
+        yield None
+        return
+    captura = CapturaTicket(payload)
+    token = _atual.set(captura)
+    try:
+        yield captura
+    finally:
+        _atual.reset(token)
+        salvar(captura, os.environ["CAPTURE_DIR"])
+
+
+def salvar(captura, diretorio):
+    try:
+        registro = captura.registro()
+        os.makedirs(diretorio, exist_ok=True)
+        nome = f"{time.strftime('%Y%m%d-%H%M%S')}_{registro['ticket_id']}_{uuid.uuid4().hex[:6]}.json.gz"
+        caminho = os.path.join(diretorio, nome)
+        with gzip.open(caminho, "wt", encoding="utf-8") as f:
+            json.dump(registro, f, ensure_ascii=False)
+        logging.info(f"Captura do ticket {registro['ticket_id']} salva em {caminho} ({len(registro['trocas'])} troca(s) HTTP).")
+        return caminho
+    except Exception as e: # A captura nunca pode derrubar o processamento do ticket
+        logging.error(f"Erro ao salvar captura do ticket: {e}", exc_info=True)
+        return None
+
+
+def carregar(caminho):
+    with gzip.open(caminho, "rt", encoding="utf-8") as f:
+        captura = json.load(f)
+    if captura.get("formato") != FORMATO:
+        raise ValueError(f"Formato de captura não suportado em {caminho}: {captura.get('formato')}")
+    return captura
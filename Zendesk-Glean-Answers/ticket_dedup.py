@@ -0,0 +1,231 @@
+"""
+De-duplicação, coalescência e single-flight de webhooks por ticket.
+
+O Zendesk dispara o gatilho a cada atualização do ticket e reenvia webhooks que não
+receberam resposta a tempo. Este módulo evita gerar várias sugestões para o mesmo ticket:
+
+- Reenvios exatos (mesmo ticket e mesma versão) são descartados no recebimento.
+- Rajadas dentro da janela são coalescidas: o receptor enfileira com atraso igual à janela
+  e o worker só executa o evento mais recente do ticket; os anteriores são descartados.
+- Execuções concorrentes do mesmo ticket são serializadas por um lock com lease. Um evento que
+  chega com o ticket ocupado fica marcado como pendente e quem detém o lock o executa ao
+  terminar, então a atualização mais nova nunca se perde (nem sem fila, no Flask local).
+
+O estado fica num store plugável: memória (um processo), SQLite (uma máquina) ou DynamoDB
+(vários containers Lambda). A versão do evento é `ticket.updated_at` do payload ou, na falta
+dele, o hash do payload. Sem `updated_at` não há como distinguir um reenvio de uma nova
+atualização com o mesmo conteúdo, então esses eventos não são descartados como reenvio.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import kv_store
+from pipeline_config import get_config
+
+
+def tem_versao(payload):
+    """True se o evento traz `ticket.updated_at` (uma versão real do ticket, não o hash do payload)."""
+    ticket = payload.get("ticket", {}) if isinstance(payload, dict) else {}
+    return bool(ticket.get("updated_at"))
+
+
+def versao_do_evento(payload):
+    """Identifica a versão do ticket no evento: `ticket.updated_at` ou o hash do payload."""
+    ticket = payload.get("ticket", {}) if isinstance(payload, dict) else {}
+    if ticket.get("updated_at"):
+        return str(ticket["updated_at"])
+    bruto = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(bruto).hexdigest()
+
+
+class DeduplicadorTickets:
+    """Aplica de-duplicação (no recebimento) e coalescência/single-flight (na execução)."""
+
+    # Resultados de `executar` quando a função não chega a rodar
+    SUPERADO = "superado"
+    OCUPADO = "ocupado"
+
+    def __init__(self, store, janela_seconds=10, ttl_reenvio_seconds=300, lease_seconds=300):
+        self.store = store
+        self.janela_seconds = janela_seconds
+        self.ttl_reenvio_seconds = ttl_reenvio_seconds
+        self.lease_seconds = lease_seconds
+
+    def aceitar_evento(self, ticket_id, versao, descartar_reenvio=True):
+        """
+        Registra o evento recebido. Retorna False se for um reenvio exato (mesmo ticket e versão)
+        e `descartar_reenvio` for True. O evento aceito passa a ser o mais recente do ticket.
+        """
+        if descartar_reenvio and not self.store.reservar(f"visto:{ticket_id}:{versao}", "1", self.ttl_reenvio_seconds):
+            logging.info(f"Reenvio do ticket {ticket_id} (versão {versao}) descartado.")
+            return False
+        self.store.put(f"ultimo:{ticket_id}", versao, self.ttl_reenvio_seconds)
+        return True
+
+    def desfazer_evento(self, ticket_id, versao):
+        """Esquece um evento aceito que não pôde ser enfileirado, para que o reenvio do Zendesk seja aceito."""
+        self.store.liberar(f"visto:{ticket_id}:{versao}")
+
+    def _superado(self, ticket_id, versao):
+        ultimo = self.store.get(f"ultimo:{ticket_id}")
+        if ultimo is not None and ultimo != versao:
+            logging.info(f"Evento do ticket {ticket_id} (versão {versao}) superado pela versão {ultimo}; coalescido.")
+            return True
+        if self.store.get(f"concluido:{ticket_id}") == versao: # Já executado como pendente por quem tinha o lock
+            logging.info(f"Evento do ticket {ticket_id} (versão {versao}) já foi processado.")
+            return True
+        return False
+
+    def _proximo_pendente(self, ticket_id, executadas):
+        """Retira o evento pendente do ticket; None se não houver ou se ele já foi superado/executado."""
+        chave = f"pendente:{ticket_id}"
+        bruto = self.store.get(chave)
+        if bruto is None:
+            return None
+        self.store.liberar(chave, bruto) # Só remove se ninguém marcou um evento mais novo nesse meio-tempo
+        evento = json.loads(bruto)
+        if evento["versao"] in executadas or self._superado(ticket_id, evento["versao"]):
+            return None
+        return evento
+
+    def executar(self, ticket_id, versao, fn, *args, **kwargs):
+        """
+        Executa `fn` para o evento, a menos que um evento mais novo do mesmo ticket já tenha
+        sido aceito (retorna SUPERADO) ou que outra execução do ticket esteja em andamento.
+        Nesse caso o evento fica pendente, com os argumentos (que devem ser serializáveis em JSON),
+        e quem detém o lock o executa ao terminar; retorna OCUPADO.
+        Retorna o resultado de `fn` para este evento.
+        """
+        if self._superado(ticket_id, versao):
+            return self.SUPERADO
+
+        dono = f"{os.getpid()}:{threading.get_ident()}:{time.time()}"
+        chave_lock = f"lock:{ticket_id}"
+        if not self.store.reservar(chave_lock, dono, self.lease_seconds):
+            pendente = json.dumps({"versao": versao, "args": args, "kwargs": kwargs}, ensure_ascii=False)
+            self.store.put(f"pendente:{ticket_id}", pendente, self.lease_seconds)
+            # O dono pode ter liberado o lock entre a reserva e a marcação: tenta mais uma vez
+            if not self.store.reservar(chave_lock, dono, self.lease_seconds):
+                logging.info(f"Ticket {ticket_id} já está em processamento; evento (versão {versao}) pendente para quando terminar.")
+                return self.OCUPADO
+
+        resultado = None
+        executadas = set()
+        primeiro = True
+        while True:
+            try:
+                while True:
+                    saida = fn(*args, **kwargs)
+                    executadas.add(versao)
+                    if primeiro:
+                        resultado, primeiro = saida, False
+                    elif saida is not False:
+                        # A mensagem que marcou o evento como pendente pode ser entregue de novo pela fila
+                        self.store.put(f"concluido:{ticket_id}", versao, self.ttl_reenvio_seconds)
+                    evento = self._proximo_pendente(ticket_id, executadas)
+                    if evento is None:
+                        break
+                    logging.info(f"Ticket {ticket_id}: executando o evento pendente (versão {evento['versao']}).")
+                    versao, args, kwargs = evento["versao"], evento["args"], evento["kwargs"]
+                    self.store.put(chave_lock, dono, self.lease_seconds) # Renova o lease para a nova execução
+            finally:
+                self.store.liberar(chave_lock, dono)
+            # Um evento pode ter sido marcado entre a última verificação e a liberação do lock
+            if self.store.get(f"pendente:{ticket_id}") is None or not self.store.reservar(chave_lock, dono, self.lease_seconds):
+                return resultado
+            evento = self._proximo_pendente(ticket_id, executadas)
+            if evento is None:
+                self.store.liberar(chave_lock, dono)
+                return resultado
+            versao, args, kwargs = evento["versao"], evento["args"], evento["kwargs"]
+
+
+_deduplicador = None
+_deduplicador_opcoes = None
+_deduplicador_lock = threading.Lock()
+_desabilitado = object()
+
+
+def _opcoes(config):
+    return (config.dedup_store, config.dedup_sqlite_path, config.dedup_dynamodb_table,
+            config.dedup_window_seconds, config.dedup_retry_ttl_seconds, config.dedup_lock_ttl_seconds)
+
+
+def get_deduplicador(config=None):
+    """
+    Retorna o deduplicador do container, ou None se desabilitado. As opções vêm de `config`
+    (padrão: get_config()); o store é remontado só quando um recarregamento as muda.
+    """
+    global _deduplicador, _deduplicador_opcoes
+    config = config or get_config()
+    opcoes = _opcoes(config)
+    if _deduplicador_opcoes != opcoes:
+        with _deduplicador_lock:
+            if _deduplicador_opcoes != opcoes:
+                backend, sqlite_path, tabela, janela, ttl_reenvio, lease = opcoes
+                if backend == "none":
+                    _deduplicador = _desabilitado
+                else:
+                    store = kv_store.criar_store(backend, sqlite_path=sqlite_path, dynamodb_table=tabela)
+                    _deduplicador = DeduplicadorTickets(
+                        store, janela_seconds=janela, ttl_reenvio_seconds=ttl_reenvio, lease_seconds=lease,
+                    )
+                _deduplicador_opcoes = opcoes
+                logging.info(f"De-duplicação de tickets usando store '{backend}'.")
+    return None if _deduplicador is _desabilitado else _deduplicador
+
+
+def _ticket_id(payload):
+    return payload.get("ticket", {}).get("id") if isinstance(payload, dict) else None
+
+
+def registrar_evento(payload):
+    """Lado do receptor: retorna False se o payload for um reenvio exato e deve ser descartado."""
+    deduplicador = get_deduplicador()
+    ticket_id = _ticket_id(payload)
+    if deduplicador is None or not ticket_id:
+        return True
+    return deduplicador.aceitar_evento(ticket_id, versao_do_evento(payload), descartar_reenvio=tem_versao(payload))
+
+
+def desfazer_evento(payload):
+    deduplicador = get_deduplicador()
+    ticket_id = _ticket_id(payload)
+    if deduplicador is not None and ticket_id:
+        deduplicador.desfazer_evento(ticket_id, versao_do_evento(payload))
+
+
+def executar_evento(payload, fn, ocupado=False):
+    """
+    Lado do worker: executa `fn(payload)` com coalescência e single-flight.
+    Retorna o resultado de `fn`, True quando o evento foi superado (nada a fazer) ou `ocupado`
+    (padrão False) quando o ticket está ocupado. Nesse caso o evento fica pendente e quem está
+    processando o ticket o executa ao terminar; com fila, a nova entrega da mensagem (depois de
+    `lease_do_lock()`) só cobre um dono do lock que morreu no meio da execução.
+    """
+    deduplicador = get_deduplicador()
+    ticket_id = _ticket_id(payload)
+    if deduplicador is None or not ticket_id:
+        return fn(payload)
+    resultado = deduplicador.executar(ticket_id, versao_do_evento(payload), fn, payload)
+    if resultado == DeduplicadorTickets.SUPERADO:
+        return True
+    if resultado == DeduplicadorTickets.OCUPADO:
+        return ocupado
+    return resultado
+
+
+def lease_do_lock():
+    """Lease (s) do lock por ticket: depois dele, um lock de um dono que morreu já expirou (0 se desabilitado)."""
+    deduplicador = get_deduplicador()
+    return deduplicador.lease_seconds if deduplicador is not None else 0
+
+
+def janela_de_coalescencia():
+    """Atraso, em segundos, com que o receptor deve enfileirar os eventos (0 se desabilitado)."""
+    deduplicador = get_deduplicador()
+    return deduplicador.janela_seconds if deduplicador is not None else 0
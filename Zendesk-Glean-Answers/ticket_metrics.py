@@ -0,0 +1,258 @@
+"""
+Instrumentação por ticket: tempo de cada etapa, chamadas HTTP por host e tamanhos.
+
+`processa_ticket` roda dentro de `medir_ticket(ticket_id)`. As funções que ele chama marcam
+suas etapas com `etapa(nome)` (ou o decorator `medido(nome)`); as chamadas HTTP são contadas
+pelo adapter de http_client. Fora de um ticket em medição, tudo isso é no-op. As etapas podem
+ser aninhadas (ex.: `texto` inclui `zendesk_comentarios` e `zendesk_autores`) e uma etapa
+repetida acumula o tempo.
+
+No fim do ticket o registro é:
+- logado em uma linha `metricas_ticket {json}`;
+- impresso no formato CloudWatch Embedded Metric Format (EMF) se METRICS_EMF=true;
+- anexado a METRICS_FILE (JSON Lines), se definido;
+- guardado entre os METRICS_RECENT_TICKETS mais recentes, para `resumo()` (/metrics local).
+
+Relatório de p50/p95/p99 por etapa a partir de um arquivo (METRICS_FILE ou logs exportados):
+
+    python ticket_metrics.py relatorio metricas.jsonl
+"""
+import argparse
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+PREFIXO_LOG = "metricas_ticket "
+PERCENTIS = (50, 95, 99)
+
+_atual = contextvars.ContextVar("medicao_ticket", default=None)
+_recentes = deque(maxlen=int(os.environ.get("METRICS_RECENT_TICKETS", 500)))
+_arquivo_lock = threading.Lock()
+
+
+class MedicaoTicket:
+    """Tempos, chamadas HTTP e tamanhos de um ticket."""
+
+    def __init__(self, ticket_id):
+        self.ticket_id = str(ticket_id)
+        self.etapas = {} # nome -> segundos (acumulados)
+        self.http = {} # host -> [chamadas, segundos]
+        self.tamanhos = {}
+        self.resultado = None
+
+    def adicionar_etapa(self, nome, segundos):
+        self.etapas[nome] = self.etapas.get(nome, 0.0) + segundos
+
+    def adicionar_http(self, host, segundos):
+        chamadas, total = self.http.get(host, (0, 0.0))
+        self.http[host] = (chamadas + 1, total + segundos)
+
+    def registro(self):
+        return {
+            "ticket_id": self.ticket_id,
+            "resultado": self.resultado,
+            "etapas_ms": {nome: round(s * 1000, 1) for nome, s in self.etapas.items()},
+            "http": {host: {"chamadas": n, "ms": round(s * 1000, 1)} for host, (n, s) in self.http.items()},
+            "tamanhos": dict(self.tamanhos),
+        }
+
+
+@contextlib.contextmanager
+def medir_ticket(ticket_id):
+    """Mede o ticket inteiro (etapa `total`) e publica o registro ao sair."""
+    medicao = MedicaoTicket(ticket_id)
+    token = _atual.set(medicao)
+    inicio = time.perf_counter()
+    try:
+        yield medicao
+    except BaseException:
+        medicao.resultado = "erro"
+        raise
+    finally:
+        medicao.adicionar_etapa("total", time.perf_counter() - inicio)
+        _atual.reset(token)
+        _publicar(medicao.registro())
+
+
+@contextlib.contextmanager
+def etapa(nome):
+    medicao = _atual.get()
+    if medicao is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.adicionar_etapa(nome, time.perf_counter() - inicio)
+
+
+def medido(nome):
+    """Decorator: a chamada da função conta como a etapa `nome` do ticket em medição."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with etapa(nome):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def registrar_duracao(nome, segundos):
+    medicao = _atual.get()
+    if medicao is not None and segundos is not None:
+        medicao.adicionar_etapa(nome, segundos)
+
+
+def registrar_tamanho(nome, valor, acumular=False):
+    medicao = _atual.get()
+    if medicao is not None:
+        medicao.tamanhos[nome] = medicao.tamanhos.get(nome, 0) + valor if acumular else valor
+
+
+def registrar_http(url, segundos):
+    medicao = _atual.get()
+    if medicao is not None:
+        medicao.adicionar_http(urlsplit(url).netloc or "desconhecido", segundos)
+
+
+##--------------------------------------------------------------------------##
+## Publicação
+##--------------------------------------------------------------------------##
+def _habilitado(nome):
+    return os.environ.get(nome, "False").strip().lower() in ("true", "1", "t", "yes", "y")
+
+
+def documento_emf(registro, namespace=None, servico=None, timestamp_ms=None):
+    """Registro do ticket no CloudWatch Embedded Metric Format (uma métrica por etapa, host e tamanho)."""
+    servico = servico or os.environ.get("METRICS_SERVICE_NAME", "zendesk-glean")
+    metricas, valores = [], {}
+    for nome, ms in registro["etapas_ms"].items():
+        metricas.append({"Name": f"etapa_{nome}", "Unit": "Milliseconds"})
+        valores[f"etapa_{nome}"] = ms
+    for host, dados in registro["http"].items():
+        metricas.append({"Name": f"http_chamadas_{host}", "Unit": "Count"})
+        valores[f"http_chamadas_{host}"] = dados["chamadas"]
+    for nome, valor in registro["tamanhos"].items():
+        metricas.append({"Name": nome, "Unit": "Bytes" if nome.endswith("_bytes") else "Count"})
+        valores[nome] = valor
+    return {
+        "_aws": {
+            "Timestamp": timestamp_ms if timestamp_ms is not None else int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": namespace or os.environ.get("METRICS_NAMESPACE", "ZendeskGlean"),
+                "Dimensions": [["Servico"]],
+                "Metrics": metricas,
+            }],
+        },
+        "Servico": servico,
+        "ticket_id": registro["ticket_id"], # Propriedade (não dimensão): pesquisável no Logs Insights
+        "resultado": str(registro["resultado"]),
+        **valores,
+    }
+
+
+def _publicar(registro):
+    _recentes.append(registro)
+    logging.info(PREFIXO_LOG + json.dumps(registro, ensure_ascii=False))
+    if _habilitado("METRICS_EMF"):
+        # O Lambda envia o stdout ao CloudWatch Logs, que extrai as métricas das linhas EMF
+        print(json.dumps(documento_emf(registro), ensure_ascii=False), flush=True)
+    caminho = os.environ.get("METRICS_FILE")
+    if caminho:
+        try:
+            with _arquivo_lock, open(caminho, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.error(f"Erro ao gravar métricas do ticket em {caminho}: {e}")
+
+
+##--------------------------------------------------------------------------##
+## Resumo
+##--------------------------------------------------------------------------##
+def recentes():
+    """Registros dos tickets mais recentes (até METRICS_RECENT_TICKETS), do mais antigo para o mais novo."""
+    return list(_recentes)
+
+
+def percentil(valores_ordenados, p):
+    """Percentil pelo método do posto mais próximo."""
+    if not valores_ordenados:
+        return None
+    posto = max(1, -(-p * len(valores_ordenados) // 100)) # ceil(p/100 * n)
+    return valores_ordenados[posto - 1]
+
+
+def resumo(registros=None):
+    """p50/p95/p99 (ms) por etapa e chamadas HTTP médias por host, sobre `registros` (padrão: os recentes)."""
+    registros = list(_recentes) if registros is None else list(registros)
+    por_etapa, por_host = {}, {}
+    for registro in registros:
+        for nome, ms in registro.get("etapas_ms", {}).items():
+            por_etapa.setdefault(nome, []).append(ms)
+        for host, dados in registro.get("http", {}).items():
+            por_host.setdefault(host, []).append(dados["chamadas"])
+    etapas = {}
+    for nome, valores in sorted(por_etapa.items()):
+        valores.sort()
+        etapas[nome] = {"n": len(valores), **{f"p{p}": percentil(valores, p) for p in PERCENTIS}}
+    http = {host: round(sum(v) / len(registros), 2) for host, v in sorted(por_host.items())}
+    return {"tickets": len(registros), "etapas_ms": etapas, "http_chamadas_por_ticket": http}
+
+
+def _ler_registros(linhas):
+    """Aceita JSON Lines de METRICS_FILE ou linhas de log com o prefixo `metricas_ticket`."""
+    for linha in linhas:
+        if PREFIXO_LOG in linha:
+            linha = linha.split(PREFIXO_LOG, 1)[1]
+        linha = linha.strip()
+        if not linha.startswith("{"):
+            continue
+        try:
+            registro = json.loads(linha)
+        except json.JSONDecodeError:
+            continue
+        if "etapas_ms" in registro:
+            yield registro
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relatório de latência por etapa do processamento de tickets.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_relatorio = sub.add_parser("relatorio", help="p50/p95/p99 por etapa a partir de METRICS_FILE ou de logs")
+    p_relatorio.add_argument("arquivos", nargs="*", help="Arquivos (padrão: stdin)")
+    p_relatorio.add_argument("--json", action="store_true", help="Saída em JSON")
+    args = parser.parse_args(argv)
+
+    registros = []
+    if args.arquivos:
+        for caminho in args.arquivos:
+            with open(caminho, encoding="utf-8") as f:
+                registros.extend(_ler_registros(f))
+    else:
+        registros.extend(_ler_registros(sys.stdin))
+    dados = resumo(registros)
+    if args.json:
+        print(json.dumps(dados, indent=2, ensure_ascii=False))
+        return
+
+    print(f"{dados['tickets']} ticket(s)\n")
+    print(f"{'etapa':<24}{'n':>6}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for nome, estat in dados["etapas_ms"].items():
+        print(f"{nome:<24}{estat['n']:>6}{estat['p50']:>12.1f}{estat['p95']:>12.1f}{estat['p99']:>12.1f}")
+    if dados["http_chamadas_por_ticket"]:
+        print("\nChamadas HTTP por ticket (média):")
+        for host, media in dados["http_chamadas_por_ticket"].items():
+            print(f"  {host}: {media}")
+
+
+if __name__ == "__main__":
+    main()
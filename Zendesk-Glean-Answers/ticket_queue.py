@@ -0,0 +1,179 @@
+"""
+Fila durável entre o receptor do webhook e o worker que processa os tickets.
+
+O receptor apenas enfileira o payload; o worker consome em lotes. Uma mensagem só é apagada
+depois de processada com sucesso. Se o worker falhar ou morrer, ela volta a ficar visível
+quando o visibility timeout expira e é tentada de novo.
+
+Backends:
+- SqsQueue: Amazon SQS (produção). O boto3 só é importado quando este backend é usado.
+- SqliteQueue: arquivo SQLite local, com a mesma semântica de visibilidade, para testes
+  e para o servidor Flask local.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import aws_clients
+
+# id: identificador estável da mensagem; receipt: handle da entrega atual (muda a cada recebimento)
+Mensagem = namedtuple("Mensagem", ["id", "body", "receipt", "receive_count"])
+
+DEFAULT_VISIBILITY_TIMEOUT = 120
+DEFAULT_SQLITE_PATH = "/tmp/ticket_queue.sqlite3"
+
+
+class SqliteQueue:
+    """Fila local em SQLite com visibility timeout, segura para vários threads e processos."""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS mensagens ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " body TEXT NOT NULL,"
+                " visivel_em REAL NOT NULL,"
+                " receive_count INTEGER NOT NULL DEFAULT 0,"
+                " receipt TEXT,"
+                " criado_em REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_mensagens_visivel ON mensagens (visivel_em)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return _Transacao(conn)
+
+    def send(self, body, delay_seconds=0):
+        agora = self._clock()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO mensagens (body, visivel_em, criado_em) VALUES (?, ?, ?)",
+                (json.dumps(body, ensure_ascii=False), agora + delay_seconds, agora),
+            )
+            return str(cur.lastrowid)
+
+    def receive(self, max_messages=10, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        agora = self._clock()
+        mensagens = []
+        with self._conn() as conn:
+            linhas = conn.execute(
+                "SELECT id, body, receive_count FROM mensagens WHERE visivel_em <= ? ORDER BY id LIMIT ?",
+                (agora, max_messages),
+            ).fetchall()
+            for msg_id, body, receive_count in linhas:
+                receipt = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE mensagens SET visivel_em = ?, receive_count = ?, receipt = ? WHERE id = ?",
+                    (agora + visibility_timeout, receive_count + 1, receipt, msg_id),
+                )
+                mensagens.append(Mensagem(str(msg_id), json.loads(body), receipt, receive_count + 1))
+        return mensagens
+
+    def delete(self, mensagem):
+        # O receipt garante que uma entrega expirada (e já redistribuída) não apague a mensagem
+        with self._conn() as conn:
+            conn.execute("DELETE FROM mensagens WHERE id = ? AND receipt = ?", (int(mensagem.id), mensagem.receipt))
+
+    def change_visibility(self, mensagem, visibility_timeout):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE mensagens SET visivel_em = ? WHERE id = ? AND receipt = ?",
+                (self._clock() + visibility_timeout, int(mensagem.id), mensagem.receipt),
+            )
+
+    def __len__(self):
+        with self._conn() as conn:
+            return conn.execute("SELECT COUNT(*) FROM mensagens").fetchone()[0]
+
+
+class _Transacao:
+    """Context manager que abre uma transação IMMEDIATE (lock de escrita) na conexão."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class SqsQueue:
+    """Fila Amazon SQS. Espelha a interface de SqliteQueue."""
+
+    def __init__(self, queue_url, region_name=None, client=None):
+        self.queue_url = queue_url
+        self.client = client if client is not None else aws_clients.sqs_client(region_name)
+
+    def send(self, body, delay_seconds=0):
+        resposta = self.client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(body, ensure_ascii=False),
+            DelaySeconds=int(delay_seconds),
+        )
+        return resposta.get("MessageId")
+
+    def receive(self, max_messages=10, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, wait_seconds=10):
+        resposta = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(int(max_messages), 10),  # Limite do SQS por chamada
+            VisibilityTimeout=int(visibility_timeout),
+            WaitTimeSeconds=int(wait_seconds),
+            AttributeNames=["ApproximateReceiveCount"],
+        )
+        return [
+            Mensagem(
+                m["MessageId"],
+                json.loads(m["Body"]),
+                m["ReceiptHandle"],
+                int(m.get("Attributes", {}).get("ApproximateReceiveCount", 1)),
+            )
+            for m in resposta.get("Messages", [])
+        ]
+
+    def delete(self, mensagem):
+        self.client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=mensagem.receipt)
+
+    def change_visibility(self, mensagem, visibility_timeout):
+        self.client.change_message_visibility(
+            QueueUrl=self.queue_url, ReceiptHandle=mensagem.receipt, VisibilityTimeout=int(visibility_timeout)
+        )
+
+
+_fila_padrao = None
+_fila_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Retorna a fila configurada no ambiente (uma por container), ou None se nenhuma estiver configurada.
+    TICKET_QUEUE_URL seleciona o SQS; TICKET_QUEUE_SQLITE_PATH seleciona a fila local.
+    """
+    global _fila_padrao
+    if _fila_padrao is None:
+        with _fila_lock:
+            if _fila_padrao is None:
+                queue_url = os.environ.get("TICKET_QUEUE_URL")
+                sqlite_path = os.environ.get("TICKET_QUEUE_SQLITE_PATH")
+                if queue_url:
+                    logging.info(f"Usando fila SQS: {queue_url}")
+                    _fila_padrao = SqsQueue(queue_url, region_name=os.environ.get("AWS_REGION"))
+                elif sqlite_path:
+                    logging.info(f"Usando fila SQLite local: {sqlite_path}")
+                    _fila_padrao = SqliteQueue(sqlite_path)
+    return _fila_padrao
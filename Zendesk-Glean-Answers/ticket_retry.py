@@ -0,0 +1,411 @@
+"""
+Retry durável e dead letters dos tickets que falharam no pipeline.
+
+Quando uma etapa de `processa_ticket` falha, o ticket é registrado com a etapa, o motivo e o
+que já foi obtido (ex.: a resposta da Glean quando só a postagem da nota falhou). A próxima
+tentativa é agendada com backoff exponencial com jitter; depois de RETRY_MAX_ATTEMPTS
+tentativas o registro vira dead letter. Adiamentos (a Glean recusou a chamada por circuito
+aberto ou falta de vaga) reagendam o ticket sem contar tentativa, então uma indisponibilidade
+longa da Glean não manda a fila inteira para os dead letters. Na nova tentativa do mesmo
+evento, o pipeline retoma da etapa que falhou: uma nota que não foi postada reaproveita a
+resposta já recebida, sem chamar a Glean de novo.
+
+Com fila (ticket_queue), o worker usa o agendamento daqui para a próxima entrega. Sem fila,
+ou para inspecionar e reprocessar os dead letters:
+
+    python ticket_retry.py listar [--estado pendente|morta]
+    python ticket_retry.py mostrar <ticket_id>
+    python ticket_retry.py executar-vencidas [--limite N]
+    python ticket_retry.py reprocessar <ticket_id>... | --mortas
+    python ticket_retry.py descartar <ticket_id>...
+"""
+import argparse
+import atexit
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+import aws_clients
+from pipeline_config import get_config
+from ticket_dedup import versao_do_evento
+
+ETAPA_TICKET = "zendesk_ticket"
+ETAPA_COMENTARIOS = "zendesk_comentarios"
+ETAPA_GLEAN = "glean"
+ETAPA_NOTA = "nota"
+
+PENDENTE = "pendente"
+MORTA = "morta"
+
+DEFAULT_SQLITE_PATH = "/tmp/ticket_retry.sqlite3"
+
+
+def atraso_backoff(tentativa, base_segundos, max_segundos, rng=random.random):
+    """Backoff exponencial com jitter: entre metade e o total de base * 2^(tentativa-1), limitado a max."""
+    teto = min(float(max_segundos), float(base_segundos) * (2 ** max(0, tentativa - 1)))
+    return teto / 2 + rng() * teto / 2
+
+
+class SqliteRetryStore:
+    """Registros de retry em SQLite (WAL), um por ticket."""
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS falhas ("
+            " ticket_id TEXT PRIMARY KEY,"
+            " estado TEXT NOT NULL,"
+            " proxima_em REAL NOT NULL,"
+            " dados TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_falhas_estado ON falhas (estado, proxima_em)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, ticket_id):
+        linha = self._conn().execute("SELECT dados FROM falhas WHERE ticket_id = ?", (str(ticket_id),)).fetchone()
+        return None if linha is None else json.loads(linha[0])
+
+    def put(self, registro):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO falhas (ticket_id, estado, proxima_em, dados) VALUES (?, ?, ?, ?)",
+            (registro["ticket_id"], registro["estado"], registro["proxima_em"], json.dumps(registro, ensure_ascii=False)),
+        )
+
+    def delete(self, ticket_id):
+        self._conn().execute("DELETE FROM falhas WHERE ticket_id = ?", (str(ticket_id),))
+
+    def listar(self, estado=None, vencidas_ate=None, limite=None):
+        sql, args = "SELECT dados FROM falhas WHERE 1 = 1", []
+        if estado:
+            sql, args = sql + " AND estado = ?", args + [estado]
+        if vencidas_ate is not None:
+            sql, args = sql + " AND proxima_em <= ?", args + [vencidas_ate]
+        sql += " ORDER BY proxima_em"
+        if limite:
+            sql, args = sql + " LIMIT ?", args + [int(limite)]
+        return [json.loads(d) for (d,) in self._conn().execute(sql, args)]
+
+
+class DynamoDBRetryStore:
+    """Registros de retry em DynamoDB: chave de partição `ticket_id` (string), registro em JSON em `dados`."""
+
+    def __init__(self, table_name, table=None):
+        self.table = table if table is not None else aws_clients.dynamodb_table(table_name)
+
+    def get(self, ticket_id):
+        item = self.table.get_item(Key={"ticket_id": str(ticket_id)}, ConsistentRead=True).get("Item")
+        return None if not item else json.loads(item["dados"])
+
+    def put(self, registro):
+        self.table.put_item(Item={
+            "ticket_id": registro["ticket_id"],
+            "estado": registro["estado"],
+            "proxima_em": int(registro["proxima_em"]),
+            "dados": json.dumps(registro, ensure_ascii=False),
+        })
+
+    def delete(self, ticket_id):
+        self.table.delete_item(Key={"ticket_id": str(ticket_id)})
+
+    def listar(self, estado=None, vencidas_ate=None, limite=None):
+        # Scan: usado só pela CLI e pelo reprocessamento, sobre uma tabela pequena de falhas
+        filtros, valores = [], {}
+        if estado:
+            filtros.append("estado = :estado")
+            valores[":estado"] = estado
+        if vencidas_ate is not None:
+            filtros.append("proxima_em <= :agora")
+            valores[":agora"] = int(vencidas_ate)
+        parametros = {"FilterExpression": " AND ".join(filtros), "ExpressionAttributeValues": valores} if filtros else {}
+        registros = []
+        while True:
+            resposta = self.table.scan(**parametros)
+            registros.extend(json.loads(item["dados"]) for item in resposta.get("Items", []))
+            if not resposta.get("LastEvaluatedKey"):
+                break
+            parametros["ExclusiveStartKey"] = resposta["LastEvaluatedKey"]
+        registros.sort(key=lambda r: r["proxima_em"])
+        return registros[:limite] if limite else registros
+
+
+class GerenciadorRetry:
+    """Registra falhas por etapa, agenda novas tentativas e decide quando um ticket vira dead letter."""
+
+    def __init__(self, store, max_tentativas=5, base_segundos=30, max_segundos=3600, clock=time.time):
+        self.store = store
+        self.max_tentativas = max(1, int(max_tentativas))
+        self.base_segundos = float(base_segundos)
+        self.max_segundos = float(max_segundos)
+        self._clock = clock
+
+    def registrar_falha(self, payload, etapa, motivo, contexto=None):
+        """Registra a falha de `etapa` e agenda a próxima tentativa. Retorna o registro atualizado."""
+        ticket_id = str(payload["ticket"]["id"])
+        versao = versao_do_evento(payload)
+        anterior = self.store.get(ticket_id)
+        if anterior and anterior.get("versao") != versao:
+            anterior = None # Evento mais novo do ticket (mesmo depois de um dead letter): recomeça a contagem
+        tentativas = (anterior or {}).get("tentativas", 0) + 1
+        agora = self._clock()
+        estado = MORTA if tentativas >= self.max_tentativas else PENDENTE
+        registro = {
+            "ticket_id": ticket_id,
+            "versao": versao,
+            "payload": payload,
+            "etapa": etapa,
+            "motivo": str(motivo),
+            "contexto": contexto or {},
+            "tentativas": tentativas,
+            "estado": estado,
+            "primeira_falha_em": (anterior or {}).get("primeira_falha_em", agora),
+            "atualizado_em": agora,
+            "proxima_em": agora + (0 if estado == MORTA else atraso_backoff(tentativas, self.base_segundos, self.max_segundos)),
+        }
+        self.store.put(registro)
+        if estado == MORTA:
+            logging.error(f"Ticket {ticket_id} movido para dead letter após {tentativas} tentativa(s). Etapa: {etapa}. Motivo: {motivo}")
+        else:
+            logging.warning(
+                f"Ticket {ticket_id} falhou na etapa '{etapa}' ({motivo}). Tentativa {tentativas} de "
+                f"{self.max_tentativas}; próxima em {registro['proxima_em'] - agora:.0f}s."
+            )
+        return registro
+
+    def registrar_adiamento(self, payload, etapa, motivo, tentar_em=0.0):
+        """
+        Reagenda o evento sem contar tentativa (a chamada nem foi feita), para daqui a `tentar_em`
+        segundos e no mínimo o primeiro passo do backoff. Retorna o registro atualizado.
+        """
+        ticket_id = str(payload["ticket"]["id"])
+        versao = versao_do_evento(payload)
+        anterior = self.store.get(ticket_id)
+        if anterior and anterior.get("versao") != versao:
+            anterior = None
+        anterior = anterior or {}
+        agora = self._clock()
+        registro = {
+            "ticket_id": ticket_id,
+            "versao": versao,
+            "payload": payload,
+            "etapa": etapa,
+            "motivo": str(motivo),
+            "contexto": {},
+            "tentativas": anterior.get("tentativas", 0),
+            "adiamentos": anterior.get("adiamentos", 0) + 1,
+            "estado": PENDENTE,
+            "primeira_falha_em": anterior.get("primeira_falha_em", agora),
+            "atualizado_em": agora,
+            "proxima_em": agora + max(float(tentar_em or 0), atraso_backoff(1, self.base_segundos, self.max_segundos)),
+        }
+        self.store.put(registro)
+        logging.warning(
+            f"Ticket {ticket_id} adiado na etapa '{etapa}' ({motivo}); próxima em "
+            f"{registro['proxima_em'] - agora:.0f}s, sem contar tentativa ({registro['adiamentos']} adiamento(s))."
+        )
+        return registro
+
+    def retomada(self, payload):
+        """Registro pendente do mesmo evento (para retomar da etapa que falhou), ou None."""
+        registro = self.store.get(str(payload["ticket"]["id"]))
+        if registro and registro.get("estado") == PENDENTE and registro.get("versao") == versao_do_evento(payload):
+            return registro
+        return None
+
+    def concluir(self, payload):
+        self.store.delete(str(payload["ticket"]["id"]))
+
+    def segundos_ate_nova_tentativa(self, payload):
+        """
+        Segundos até a próxima tentativa deste evento; None se ele virou dead letter; 0 se não há
+        registro do evento (o registro de outra versão do ticket não vale para esta mensagem).
+        """
+        registro = self.store.get(str(payload["ticket"]["id"]))
+        if not registro or registro.get("versao") != versao_do_evento(payload):
+            return 0.0
+        if registro["estado"] == MORTA:
+            return None
+        return max(0.0, registro["proxima_em"] - self._clock())
+
+    def reativar(self, ticket_id):
+        """Volta um registro (ex.: dead letter) para pendente, com tentativas zeradas e vencido agora."""
+        registro = self.store.get(str(ticket_id))
+        if registro:
+            registro.update(estado=PENDENTE, tentativas=0, proxima_em=self._clock(), atualizado_em=self._clock())
+            self.store.put(registro)
+        return registro
+
+
+_gerenciador = None
+_gerenciador_opcoes = None
+_gerenciador_lock = threading.Lock()
+_desabilitado = object()
+
+
+def _opcoes(config):
+    return (config.retry_store, config.retry_sqlite_path, config.retry_dynamodb_table,
+            config.retry_max_attempts, config.retry_base_seconds, config.retry_max_seconds)
+
+
+def get_gerenciador_retry(config=None):
+    """
+    Gerenciador do container, ou None se desabilitado. As opções vêm de `config` (padrão:
+    get_config()); o store é remontado só quando um recarregamento as muda.
+    RETRY_STORE: sqlite (padrão local) | dynamodb (padrão e obrigatório no Lambda) | none.
+    """
+    global _gerenciador, _gerenciador_opcoes
+    config = config or get_config()
+    opcoes = _opcoes(config)
+    if _gerenciador_opcoes != opcoes:
+        with _gerenciador_lock:
+            if _gerenciador_opcoes != opcoes:
+                backend, sqlite_path, tabela, max_tentativas, base_segundos, max_segundos = opcoes
+                if backend == "none":
+                    _gerenciador = _desabilitado
+                else:
+                    store = DynamoDBRetryStore(tabela) if backend == "dynamodb" else SqliteRetryStore(sqlite_path)
+                    _gerenciador = GerenciadorRetry(
+                        store, max_tentativas=max_tentativas, base_segundos=base_segundos, max_segundos=max_segundos,
+                    )
+                _gerenciador_opcoes = opcoes
+    return None if _gerenciador is _desabilitado else _gerenciador
+
+
+def registrar_falha(payload, etapa, motivo, contexto=None):
+    gerenciador = get_gerenciador_retry()
+    if gerenciador is None:
+        return None
+    try:
+        return gerenciador.registrar_falha(payload, etapa, motivo, contexto)
+    except Exception as e: # O registro não pode derrubar o processamento
+        logging.error(f"Erro ao registrar falha do ticket para retry: {e}", exc_info=True)
+        return None
+
+
+def registrar_adiamento(payload, etapa, motivo, tentar_em=0.0):
+    gerenciador = get_gerenciador_retry()
+    if gerenciador is None:
+        return None
+    try:
+        return gerenciador.registrar_adiamento(payload, etapa, motivo, tentar_em)
+    except Exception as e:
+        logging.error(f"Erro ao registrar adiamento do ticket para retry: {e}", exc_info=True)
+        return None
+
+
+def retomada(payload):
+    gerenciador = get_gerenciador_retry()
+    if gerenciador is None:
+        return None
+    try:
+        return gerenciador.retomada(payload)
+    except Exception as e:
+        logging.error(f"Erro ao consultar retry do ticket: {e}", exc_info=True)
+        return None
+
+
+def concluir(payload):
+    gerenciador = get_gerenciador_retry()
+    if gerenciador is not None:
+        try:
+            gerenciador.concluir(payload)
+        except Exception as e:
+            logging.error(f"Erro ao limpar registro de retry do ticket: {e}", exc_info=True)
+
+
+def atraso_para(payload):
+    """Atraso (s) até a próxima entrega do payload; None = dead letter (não entregar de novo); 0 = sem registro."""
+    gerenciador = get_gerenciador_retry()
+    if gerenciador is None or not isinstance(payload, dict) or not payload.get("ticket", {}).get("id"):
+        return 0.0
+    try:
+        return gerenciador.segundos_ate_nova_tentativa(payload)
+    except Exception as e:
+        logging.error(f"Erro ao consultar agendamento de retry: {e}", exc_info=True)
+        return 0.0
+
+
+##--------------------------------------------------------------------------##
+## CLI
+##--------------------------------------------------------------------------##
+def _resumo(registro):
+    quando = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(registro["proxima_em"]))
+    return (f"{registro['ticket_id']:>10}  {registro['estado']:<8}  {registro['etapa']:<20}  "
+            f"tentativas={registro['tentativas']:<3} próxima={quando}  {registro['motivo'][:80]}")
+
+
+def _reexecutar(gerenciador, registro):
+    """Reenfileira o payload se houver fila; senão processa o ticket aqui. Retorna True se deu certo."""
+    import ticket_queue
+    fila = ticket_queue.get_queue()
+    if fila is not None:
+        fila.send(registro["payload"])
+        logging.info(f"Ticket {registro['ticket_id']} reenfileirado.")
+        return True
+    from webhook_glean_zendesk import processa_ticket
+    return processa_ticket(registro["payload"]) is True
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Inspeciona e reprocessa tickets com falha (retry/dead letters).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_listar = sub.add_parser("listar")
+    p_listar.add_argument("--estado", choices=[PENDENTE, MORTA])
+    sub.add_parser("mostrar").add_argument("ticket_id")
+    p_vencidas = sub.add_parser("executar-vencidas", help="Processa agora os retries pendentes já vencidos")
+    p_vencidas.add_argument("--limite", type=int, default=50)
+    p_reprocessar = sub.add_parser("reprocessar", help="Reativa e reprocessa tickets (ex.: dead letters)")
+    p_reprocessar.add_argument("ticket_ids", nargs="*")
+    p_reprocessar.add_argument("--mortas", action="store_true", help="Todos os dead letters")
+    sub.add_parser("descartar").add_argument("ticket_ids", nargs="+")
+    args = parser.parse_args(argv)
+    import token_sink
+    atexit.register(token_sink.encerrar) # Tickets reprocessados aqui gravam tokens em buffer: grava o restante ao sair
+
+    gerenciador = get_gerenciador_retry()
+    if gerenciador is None:
+        parser.error("RETRY_STORE=none: não há registros de retry.")
+    store = gerenciador.store
+
+    if args.comando == "listar":
+        registros = store.listar(estado=args.estado)
+        for registro in registros:
+            print(_resumo(registro))
+        print(f"{len(registros)} registro(s).")
+    elif args.comando == "mostrar":
+        registro = store.get(args.ticket_id)
+        print(json.dumps(registro, indent=2, ensure_ascii=False) if registro else "Nenhum registro para este ticket.")
+    elif args.comando == "executar-vencidas":
+        vencidas = store.listar(estado=PENDENTE, vencidas_ate=time.time(), limite=args.limite)
+        ok = sum(1 for registro in vencidas if _reexecutar(gerenciador, registro))
+        print(f"{ok} de {len(vencidas)} ticket(s) vencido(s) processado(s) com sucesso.")
+    elif args.comando == "reprocessar":
+        ids = [r["ticket_id"] for r in store.listar(estado=MORTA)] if args.mortas else args.ticket_ids
+        ok = 0
+        for ticket_id in ids:
+            registro = gerenciador.reativar(ticket_id)
+            if registro is None:
+                print(f"Ticket {ticket_id}: nenhum registro.")
+            elif _reexecutar(gerenciador, registro):
+                ok += 1
+        print(f"{ok} de {len(ids)} ticket(s) reprocessado(s) com sucesso.")
+    elif args.comando == "descartar":
+        for ticket_id in args.ticket_ids:
+            store.delete(ticket_id)
+        print(f"{len(args.ticket_ids)} registro(s) descartado(s).")
+
+
+if __name__ == "__main__":
+    main()
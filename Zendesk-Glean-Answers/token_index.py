@@ -0,0 +1,96 @@
+"""
+Índice de tracking tokens da Glean por ticket, usado pelo webhook de feedback.
+
+Backends:
+- SqliteTokenStore (token_store.py): busca indexada no armazenamento local gravado pelo webhook.
+- IndiceTokensExcel: carrega a planilha (tokens.xlsx) uma vez em um dicionário
+  ticket_id -> [tokens] e só a relê quando o mtime do arquivo muda.
+- IndiceTokensDynamoDB: consulta a tabela gravada por `salvar_token_em_dynamodb`
+  com uma key condition na chave de partição `ticket_id` (sem Scan).
+"""
+import logging
+import os
+import threading
+
+import aws_clients
+from token_store import SqliteTokenStore
+
+
+def _chave(ticket_id):
+    # A planilha guarda o ID como número e o payload pode trazê-lo como string
+    return str(ticket_id).strip()
+
+
+class IndiceTokensExcel:
+    """Índice em memória da planilha de tokens, recarregado quando o arquivo muda."""
+
+    def __init__(self, path):
+        self.path = path
+        self._indice = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _carregar(self):
+        import pandas as pd # Só quem usa a planilha paga o import do pandas/openpyxl
+        df = pd.read_excel(self.path, usecols=["ticket_id", "tracking_token"], dtype=str)
+        indice = {}
+        for ticket_id, token in zip(df["ticket_id"], df["tracking_token"]):
+            if isinstance(ticket_id, str) and isinstance(token, str):
+                indice.setdefault(_chave(ticket_id), []).append(token)
+        return indice
+
+    def _atualizar_se_necessario(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            logging.error(f"Planilha de tokens '{self.path}' não encontrada.")
+            self._indice, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime != self._mtime:
+                self._indice = self._carregar()
+                self._mtime = mtime
+                logging.info(f"Índice de tokens carregado de '{self.path}': {len(self._indice)} ticket(s).")
+
+    def buscar(self, ticket_id):
+        self._atualizar_se_necessario()
+        return list(self._indice.get(_chave(ticket_id), ()))
+
+
+class IndiceTokensDynamoDB:
+    """Consulta por ticket na tabela de tokens (PK `ticket_id`, SK `timestamp_salvo_utc`)."""
+
+    def __init__(self, table_name, table=None):
+        self.table = table if table is not None else aws_clients.dynamodb_table(table_name)
+
+    def buscar(self, ticket_id):
+        parametros = {
+            "KeyConditionExpression": "ticket_id = :t",
+            "ExpressionAttributeValues": {":t": _chave(ticket_id)},
+            "ProjectionExpression": "glean_message_tracking_token",
+        }
+        tokens = []
+        while True:
+            resposta = self.table.query(**parametros)
+            tokens.extend(
+                item["glean_message_tracking_token"]
+                for item in resposta.get("Items", [])
+                if item.get("glean_message_tracking_token")
+            )
+            ultima_chave = resposta.get("LastEvaluatedKey")
+            if not ultima_chave:
+                return tokens
+            parametros["ExclusiveStartKey"] = ultima_chave
+
+
+def criar_indice(backend, excel_path=None, dynamodb_table=None, sqlite_path=None):
+    """backend: sqlite | excel | dynamodb."""
+    if backend == "sqlite":
+        return SqliteTokenStore(sqlite_path) if sqlite_path else SqliteTokenStore()
+    if backend == "dynamodb":
+        if not dynamodb_table:
+            raise ValueError("DYNAMODB_TOKENS_TABLE_NAME é obrigatório para o backend 'dynamodb'.")
+        return IndiceTokensDynamoDB(dynamodb_table)
+    return IndiceTokensExcel(excel_path)
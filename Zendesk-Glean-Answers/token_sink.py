@@ -0,0 +1,184 @@
+"""
+Gravação dos tracking tokens da Glean no DynamoDB fora do caminho crítico do ticket.
+
+`salvar_token_em_dynamodb` apenas coloca o item no buffer de `DynamoDBTokenSink`. O buffer é
+gravado com `batch_writer` (até 25 itens por BatchWriteItem) quando enche, a cada
+`flush_interval` segundos, no fim de cada invocação do worker e no encerramento do processo.
+Itens não processados são reenviados pelo próprio `batch_writer`; se o lote inteiro falhar,
+os itens voltam para o buffer e são tentados de novo até `max_tentativas` vezes.
+
+Cada item recebe o atributo de TTL `expira_em` (epoch em segundos) quando `ttl_seconds` > 0.
+`TabelaEmMemoria` imita a parte da API de Table usada aqui, para testes sem AWS.
+"""
+import logging
+import os
+import threading
+import time
+
+import aws_clients
+
+MAX_ITENS_POR_LOTE = 25 # Limite do BatchWriteItem
+
+
+class DynamoDBTokenSink:
+    """Buffer write-behind de itens para uma tabela DynamoDB."""
+
+    def __init__(self, table, max_batch=MAX_ITENS_POR_LOTE, flush_interval=1.0, ttl_seconds=0,
+                 max_tentativas=3, chaves=("ticket_id", "timestamp_salvo_utc"), clock=time.time):
+        self.table = table
+        self.max_batch = max(1, int(max_batch))
+        self.flush_interval = float(flush_interval)
+        self.ttl_seconds = int(ttl_seconds or 0)
+        self.max_tentativas = max(1, int(max_tentativas))
+        self.chaves = list(chaves)
+        self._clock = clock
+        self._pendentes = [] # (item, tentativas)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self.itens_gravados = 0
+        self.itens_descartados = 0
+
+    def adicionar(self, item):
+        if self.ttl_seconds > 0:
+            item = dict(item, expira_em=int(self._clock() + self.ttl_seconds))
+        with self._lock:
+            self._pendentes.append((item, 0))
+            cheio = len(self._pendentes) >= self.max_batch
+            if self._thread is None and not self._parar.is_set():
+                self._thread = threading.Thread(target=self._loop, name="token-sink", daemon=True)
+                self._thread.start()
+        if cheio:
+            self._acordar.set()
+
+    def _loop(self):
+        while not self._parar.is_set():
+            self._acordar.wait(self.flush_interval)
+            self._acordar.clear()
+            self.flush()
+
+    def flush(self):
+        """Grava tudo o que está no buffer. Retorna quantos itens foram gravados."""
+        with self._flush_lock: # Um flush por vez: o thread de fundo e o fim da invocação podem coincidir
+            with self._lock:
+                lote, self._pendentes = self._pendentes, []
+            if not lote:
+                return 0
+            try:
+                # overwrite_by_pkeys de-duplica itens com a mesma chave dentro do lote
+                with self.table.batch_writer(overwrite_by_pkeys=self.chaves) as writer:
+                    for item, _ in lote:
+                        writer.put_item(Item=item)
+            except Exception as e:
+                self._reenfileirar(lote, e)
+                return 0
+            self.itens_gravados += len(lote)
+            logging.info(f"{len(lote)} token(s) da Glean gravado(s) no DynamoDB.")
+            return len(lote)
+
+    def _reenfileirar(self, lote, erro):
+        # Regravar um item já gravado é inofensivo (mesma chave), então o lote volta inteiro
+        novos = [(item, tentativas + 1) for item, tentativas in lote if tentativas + 1 < self.max_tentativas]
+        descartados = [item for item, tentativas in lote if tentativas + 1 >= self.max_tentativas]
+        self.itens_descartados += len(descartados)
+        logging.error(f"Erro ao gravar {len(lote)} token(s) no DynamoDB: {erro}. {len(novos)} voltam para o buffer.")
+        if descartados:
+            logging.error(f"{len(descartados)} token(s) descartado(s) após {self.max_tentativas} tentativas: {descartados}")
+        with self._lock:
+            self._pendentes[:0] = novos
+
+    def encerrar(self, timeout=None):
+        """Para o thread de fundo e grava o que restou no buffer."""
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        for _ in range(self.max_tentativas):
+            self.flush()
+            if not self._pendentes:
+                break
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pendentes)
+
+
+class TabelaEmMemoria:
+    """Fake de `Table` do boto3 (put_item, batch_writer e query por chave de partição) para testes."""
+
+    def __init__(self, chave_particao="ticket_id", chave_ordenacao="timestamp_salvo_utc"):
+        self.chave_particao = chave_particao
+        self.chave_ordenacao = chave_ordenacao
+        self.itens = {}
+        self._lock = threading.Lock()
+
+    def put_item(self, Item):
+        with self._lock:
+            self.itens[(Item[self.chave_particao], Item.get(self.chave_ordenacao))] = dict(Item)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return _BatchWriterEmMemoria(self)
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        # Suporta apenas "<chave_particao> = :valor", a forma usada por token_index
+        valor = next(iter(ExpressionAttributeValues.values()))
+        with self._lock:
+            itens = [dict(i) for (pk, _), i in sorted(self.itens.items(), key=lambda kv: str(kv[0][1])) if pk == valor]
+        return {"Items": itens}
+
+
+class _BatchWriterEmMemoria:
+    def __init__(self, tabela):
+        self.tabela = tabela
+        self._itens = []
+
+    def put_item(self, Item):
+        self._itens.append(Item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            for item in self._itens:
+                self.tabela.put_item(Item=item)
+        return False
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_token_sink():
+    """
+    Retorna o sink da tabela DYNAMODB_TOKENS_TABLE_NAME (um por container), ou None se não configurada.
+    DYNAMODB_TOKENS_TTL_DAYS (padrão 180; 0 desativa) define o atributo de TTL `expira_em`.
+    """
+    global _sink
+    if _sink is None:
+        table_name = os.environ.get("DYNAMODB_TOKENS_TABLE_NAME")
+        if not table_name:
+            return None
+        with _sink_lock:
+            if _sink is None:
+                _sink = DynamoDBTokenSink(
+                    aws_clients.dynamodb_table(table_name),
+                    max_batch=int(os.environ.get("DYNAMODB_TOKENS_BATCH_SIZE", MAX_ITENS_POR_LOTE)),
+                    flush_interval=float(os.environ.get("DYNAMODB_TOKENS_FLUSH_SECONDS", 1.0)),
+                    ttl_seconds=int(float(os.environ.get("DYNAMODB_TOKENS_TTL_DAYS", 180)) * 86400),
+                )
+    return _sink
+
+
+def flush_pendentes():
+    """Grava os tokens pendentes do sink do container, se houver (chamar antes de a invocação terminar)."""
+    if _sink is not None:
+        _sink.flush()
+
+
+def encerrar():
+    """Para o thread de fundo do sink do container e grava o restante (para o atexit do Flask)."""
+    if _sink is not None:
+        _sink.encerrar()
@@ -0,0 +1,132 @@
+"""
+Armazenamento local dos tracking tokens da Glean por ticket.
+
+Substitui o tokens.xlsx, que era carregado e regravado inteiro a cada ticket (custo crescente
+e arquivo corrompido quando dois threads gravavam ao mesmo tempo). Aqui cada token é um INSERT
+em SQLite com WAL: append em O(1), vários escritores seguros e busca indexada por ticket_id.
+
+A planilha continua existindo só como relatório/migração:
+
+    python token_store.py importar tokens.xlsx      # importação única (idempotente)
+    python token_store.py exportar relatorio.xlsx   # relatório offline
+"""
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = "tokens.sqlite3"
+
+
+class SqliteTokenStore:
+    """Tokens em SQLite (WAL). Um par (ticket_id, tracking_token) é gravado uma única vez."""
+
+    def __init__(self, path=DEFAULT_PATH, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " ticket_id TEXT NOT NULL,"
+            " tracking_token TEXT NOT NULL,"
+            " application_id TEXT,"
+            " salvo_em REAL NOT NULL,"
+            " UNIQUE (ticket_id, tracking_token))"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit: cada INSERT é uma transação curta; o WAL deixa leitores e escritores em paralelo
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def salvar(self, ticket_id, tracking_token, application_id=None):
+        self._conn().execute(
+            "INSERT OR IGNORE INTO tokens (ticket_id, tracking_token, application_id, salvo_em) VALUES (?, ?, ?, ?)",
+            (str(ticket_id), str(tracking_token), application_id, self._clock()),
+        )
+
+    def buscar(self, ticket_id):
+        linhas = self._conn().execute(
+            "SELECT tracking_token FROM tokens WHERE ticket_id = ? ORDER BY id", (str(ticket_id).strip(),)
+        ).fetchall()
+        return [linha[0] for linha in linhas]
+
+    def importar_excel(self, excel_path):
+        """Importa uma planilha ticket_id/tracking_token. Retorna quantos tokens novos foram gravados."""
+        from openpyxl import load_workbook
+        wb = load_workbook(excel_path, read_only=True)
+        linhas = wb.active.iter_rows(values_only=True)
+        cabecalho = [str(c).strip() if c is not None else "" for c in next(linhas, ())]
+        i_ticket, i_token = cabecalho.index("ticket_id"), cabecalho.index("tracking_token")
+        agora = self._clock()
+        registros = (
+            (str(linha[i_ticket]).strip(), str(linha[i_token]).strip(), None, agora)
+            for linha in linhas
+            if linha and linha[i_ticket] is not None and linha[i_token]
+        )
+        conn = self._conn()
+        antes = conn.total_changes
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO tokens (ticket_id, tracking_token, application_id, salvo_em) VALUES (?, ?, ?, ?)",
+                registros,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            wb.close()
+        return conn.total_changes - antes
+
+    def exportar_excel(self, excel_path):
+        """Gera a planilha de relatório com todos os tokens. Retorna quantas linhas foram escritas."""
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(["ticket_id", "tracking_token", "application_id", "salvo_em_utc"])
+        total = 0
+        for ticket_id, token, application_id, salvo_em in self._conn().execute(
+            "SELECT ticket_id, tracking_token, application_id, salvo_em FROM tokens ORDER BY id"
+        ):
+            ws.append([ticket_id, token, application_id, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(salvo_em))])
+            total += 1
+        wb.save(excel_path)
+        return total
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Importa/exporta o armazenamento de tracking tokens.")
+    parser.add_argument("--db", default=None, help="Arquivo SQLite (padrão: TOKEN_STORE_PATH)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("importar", help="Importa um tokens.xlsx existente").add_argument("planilha")
+    sub.add_parser("exportar", help="Exporta todos os tokens para uma planilha").add_argument("planilha")
+    args = parser.parse_args(argv)
+
+    if args.db is None:
+        from config import TOKEN_STORE_PATH
+        args.db = TOKEN_STORE_PATH
+    store = SqliteTokenStore(args.db)
+    if args.comando == "importar":
+        novos = store.importar_excel(args.planilha)
+        logging.info(f"{novos} token(s) novo(s) importado(s) de '{args.planilha}' para '{args.db}' (total {len(store)}).")
+    else:
+        total = store.exportar_excel(args.planilha)
+        logging.info(f"{total} token(s) exportado(s) de '{args.db}' para '{args.planilha}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Cache em memória com TTL e limite de entradas.
+
+Instâncias criadas no nível do módulo sobrevivem entre invocações "quentes" do Lambda,
+então o mesmo dado não é buscado de novo enquanto o container estiver vivo.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_AUSENTE = object()
+
+
+class TTLCache:
+    """Cache LRU thread-safe com expiração por tempo (TTL) e tamanho máximo."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, clock=time.monotonic):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._clock = clock
+        self._dados = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Retorna o valor da chave se presente e não expirado; caso contrário, `default`."""
+        with self._lock:
+            item = self._dados.get(key, _AUSENTE)
+            if item is _AUSENTE:
+                self.misses += 1
+                return default
+            expira_em, valor = item
+            if expira_em <= self._clock():
+                del self._dados[key]
+                self.misses += 1
+                return default
+            self._dados.move_to_end(key)
+            self.hits += 1
+            return valor
+
+    def set(self, key, value, ttl_seconds=None):
+        """Armazena o valor, removendo as entradas menos usadas se o limite for excedido."""
+        ttl = self.ttl_seconds if ttl_seconds is None else float(ttl_seconds)
+        with self._lock:
+            self._dados[key] = (self._clock() + ttl, value)
+            self._dados.move_to_end(key)
+            while len(self._dados) > self.max_entries:
+                self._dados.popitem(last=False)
+
+    def get_many(self, keys):
+        """Retorna um dicionário apenas com as chaves encontradas (e válidas) no cache."""
+        encontrados = {}
+        for key in keys:
+            valor = self.get(key, _AUSENTE)
+            if valor is not _AUSENTE:
+                encontrados[key] = valor
+        return encontrados
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._dados.pop(key, _AUSENTE)
+        return default if item is _AUSENTE else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._dados)
+
+    def __contains__(self, key):
+        return self.get(key, _AUSENTE) is not _AUSENTE
@@ -0,0 +1,987 @@
+"""
+Pipeline Zendesk -> Glean -> nota interna. Importado pelo Lambda (lambda_zendesk_glean.py)
+e executado localmente com Flask via `python webhook-glean-zendesk.py`.
+
+Só o que o caminho do Lambda usa é importado no topo: o Flask fica no bloco `__main__`,
+o python-dotenv só é carregado fora do Lambda e o boto3 só quando uma persistência em
+DynamoDB é usada (aws_clients).
+"""
+import requests
+import json
+import datetime
+import time
+import os
+import logging
+import warnings
+import functools
+
+# No Lambda as variáveis vêm da configuração da função; o .env só é lido em execução local
+if not os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+import glean_breaker
+import glean_cache
+import glean_conversa
+import glean_stream
+import http_client
+import prompt_budget
+import ticket_capture
+import ticket_metrics
+import ticket_retry
+from pipeline_config import get_config, recarregar_configuracao
+import token_sink
+import zendesk_comentarios
+import zendesk_diretorio
+import zendesk_rate_limit
+from ttl_cache import TTLCache
+
+
+# Configura o logging para registrar informações úteis no CloudWatch
+if not logging.getLogger().hasHandlers():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+warnings.filterwarnings("ignore", category=UserWarning, module="urllib3")
+
+def get_env_variable(var_name, default_value=None, is_secret=False, var_type=str):
+    """
+    Busca uma variável de ambiente, registra e lança erro se obrigatória e não encontrada.
+    Converte para o tipo especificado.
+    """
+    value_str = os.environ.get(var_name)
+
+    if value_str is None:
+        if default_value is not None:
+            return default_value
+        else:
+            logging.error(f"Variável de ambiente obrigatória '{var_name}' não definida.")
+            raise ValueError(f"Variável de ambiente obrigatória '{var_name}' não definida.")
+
+    try:
+        if var_type == bool:
+            return value_str.lower() in ('true', '1', 't', 'yes', 'y')
+        return var_type(value_str)
+    except ValueError:
+        logging.error(f"Não foi possível converter a variável de ambiente '{var_name}' ('{value_str}') para o tipo {var_type}.")
+        raise ValueError(f"Variável de ambiente '{var_name}' com formato inválido.")
+
+##--------------------------------------------------------------------------##
+# Funções de interação com APIs (Zendesk, Glean)
+##--------------------------------------------------------------------------##
+
+@functools.lru_cache(maxsize=None)
+def _zendesk_client():
+    """
+    Retorna (base_url, sessão) do Zendesk. As credenciais vêm da configuração do container
+    e a sessão mantém o pool de conexões keep-alive entre invocações.
+    """
+    config = get_config()
+    base_url = config.zendesk_base_url
+    session = http_client.get_session(
+        base_url,
+        auth=(config.zendesk_email, config.zendesk_api_token),
+        headers={'Content-Type': 'application/json'},
+        timeout=config.zendesk_timeout,
+        agendador=zendesk_rate_limit.get_agendador(), # Rate limit da conta, Retry-After e prioridade
+    )
+    return base_url, session
+
+@functools.lru_cache(maxsize=None)
+def _glean_client():
+    """Retorna (api_url, sessão) da Glean, com o token da configuração do container."""
+    config = get_config()
+    session = http_client.get_session(
+        config.glean_api_url,
+        headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {config.glean_token}'},
+        timeout=config.glean_timeout,
+    )
+    return config.glean_api_url, session
+
+def recarregar_config():
+    """
+    Relê e valida a configuração do ambiente (só quando chamada explicitamente) e descarta as
+    sessões HTTP montadas com as credenciais anteriores. Se a nova configuração for inválida,
+    levanta ValueError e a anterior continua valendo.
+    """
+    config = recarregar_configuracao()
+    _zendesk_client.cache_clear()
+    _glean_client.cache_clear()
+    http_client.close_all()
+    logging.info("Configuração do pipeline recarregada.")
+    return config
+
+@ticket_metrics.medido("zendesk_ticket")
+def buscar_dados_completos_do_ticket(ticket_id):
+    """Busca os dados completos do ticket via API do Zendesk."""
+    base_url, session = _zendesk_client()
+    url = f"{base_url}/tickets/{ticket_id}.json"
+
+    logging.info(f"Buscando dados completos para o ticket ID: {ticket_id}")
+    try:
+        # comment_count permite numerar os comentários lendo só os mais novos
+        response = session.get(url, params={'include': 'comment_count'}, timeout=get_config().zendesk_timeout)
+        response.raise_for_status() 
+        return response.json().get("ticket", {}) 
+    except requests.exceptions.Timeout:
+        logging.error(f"Timeout ao buscar dados completos do ticket {ticket_id} da API do Zendesk.")
+    except requests.exceptions.HTTPError as http_err:
+        # Log response text if available for better debugging
+        response_text = ""
+        if 'response' in locals() and hasattr(response, 'text'):
+            response_text = response.text
+        logging.error(f"Erro HTTP ao buscar dados completos do ticket {ticket_id}: {http_err} - {response_text}")
+    except requests.exceptions.RequestException as req_err:
+        logging.error(f"Erro de requisição ao buscar dados completos do ticket {ticket_id}: {req_err}")
+    except json.JSONDecodeError:
+        logging.error(f"Erro ao decodificar JSON dos dados completos do ticket {ticket_id}.")
+    return {}
+
+def buscar_comentarios_do_ticket(ticket_id, usuarios_sideload=None):
+    """
+    Busca todos os comentários do ticket, em ordem cronológica, seguindo a paginação por cursor.
+    Se `usuarios_sideload` for um dicionário, pede o sideload dos autores (include=users) e o preenche por ID.
+    Retorna None se a busca falhar, para o ticket não ser respondido com base em dados parciais.
+    """
+    base_url, session = _zendesk_client()
+    config = get_config()
+    logging.info(f"Buscando comentários para o ticket ID: {ticket_id}")
+    try:
+        return list(zendesk_comentarios.iterar_comentarios(
+            session, base_url, ticket_id, config.zendesk_timeout, page_size=config.zendesk_comments_page_size,
+            mais_recentes_primeiro=False, usuarios_sideload=usuarios_sideload,
+        ))
+    except zendesk_comentarios.ErroBuscaComentarios as e:
+        logging.error(str(e))
+    return None
+
+##--------------------------------------------------------------------------##
+# Resolução de autores (email e grupos) com cache entre invocações
+##--------------------------------------------------------------------------##
+ZENDESK_SHOW_MANY_LIMIT = 100 # Máximo de IDs aceitos por /users/show_many.json
+
+# Cache no nível do módulo: sobrevive entre invocações "quentes" do Lambda
+_autores_cache = TTLCache(
+    max_entries=get_env_variable('AUTHOR_CACHE_MAX_ENTRIES', default_value=2000, var_type=int),
+    ttl_seconds=get_env_variable('AUTHOR_CACHE_TTL_SECONDS', default_value=3600, var_type=int),
+)
+
+def _buscar_grupos_do_usuario(user_id, timeout_seconds):
+    """Busca os nomes dos grupos de um único usuário (fallback quando o sideload não traz os grupos)."""
+    base_url, session = _zendesk_client()
+    groups_url = f"{base_url}/users/{user_id}/groups.json"
+    logging.info(f"Buscando grupos para o usuário ID: {user_id}")
+    try:
+        res_groups = session.get(groups_url, timeout=timeout_seconds)
+        res_groups.raise_for_status()
+        groups_data = res_groups.json().get("groups", [])
+        return [g.get("name", "Nome do Grupo Ausente") for g in groups_data]
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Erro ao buscar grupos do usuário {user_id}: {e}")
+        return ["Erro ao buscar grupos"]
+    except json.JSONDecodeError:
+        logging.error(f"Erro ao decodificar JSON dos grupos do usuário {user_id}.")
+        return ["Erro ao buscar grupos (JSON)"]
+
+def _buscar_usuarios_em_lote(user_ids):
+    """
+    Busca vários usuários de uma vez via /users/show_many.json com sideload de grupos.
+    Retorna {user_id: (email, [nomes_de_grupos])} apenas para os usuários resolvidos com sucesso.
+    """
+    base_url, session = _zendesk_client()
+    timeout_seconds = get_config().zendesk_timeout
+    url = f"{base_url}/users/show_many.json"
+
+    resolvidos = {}
+    ids = list(user_ids)
+    for inicio in range(0, len(ids), ZENDESK_SHOW_MANY_LIMIT):
+        lote = ids[inicio:inicio + ZENDESK_SHOW_MANY_LIMIT]
+        params = {'ids': ",".join(str(i) for i in lote), 'include': 'groups'}
+        logging.info(f"Buscando {len(lote)} usuário(s) em lote: {params['ids']}")
+        try:
+            response = session.get(url, params=params, timeout=timeout_seconds)
+            response.raise_for_status()
+            dados = response.json()
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Erro ao buscar usuários em lote ({params['ids']}): {e}")
+            continue
+        except json.JSONDecodeError:
+            logging.error(f"Erro ao decodificar JSON dos usuários em lote ({params['ids']}).")
+            continue
+
+        grupos_por_id = {g.get("id"): g.get("name", "Nome do Grupo Ausente") for g in dados.get("groups", [])}
+        for user_data in dados.get("users", []):
+            user_id = user_data.get("id")
+            email = user_data.get("email") or "Email não encontrado"
+            if user_data.get("role") == "end-user":
+                group_names = [] # Usuários finais não pertencem a grupos; evita uma chamada extra
+            elif "group_ids" in user_data:
+                group_names = [grupos_por_id[g] for g in user_data["group_ids"] if g in grupos_por_id]
+            else:
+                group_names = _buscar_grupos_do_usuario(user_id, timeout_seconds)
+            resolvidos[user_id] = (email, group_names)
+    return resolvidos
+
+@ticket_metrics.medido("zendesk_autores")
+def resolver_autores(author_ids, usuarios_conhecidos=None):
+    """
+    Resolve email e grupos de todos os autores distintos informados.
+    Consulta primeiro o diretório pré-carregado de agentes (zendesk_diretorio, só leitura em
+    memória), depois o cache, e busca os ausentes em lote. Retorna {author_id: (email, [grupos])}.
+    `usuarios_conhecidos` (ex.: sideload de comentários) resolve usuários finais sem nova chamada.
+    """
+    distintos = [a for a in dict.fromkeys(author_ids) if a is not None] # Preserva a ordem, sem repetições
+    autores = {}
+    diretorio = zendesk_diretorio.get_diretorio()
+    if diretorio is not None:
+        for autor_id in distintos:
+            info = diretorio.resolver(autor_id)
+            if info is not None:
+                autores[autor_id] = info
+    do_diretorio = len(autores)
+
+    for user_data in (usuarios_conhecidos or {}).values():
+        if user_data.get("role") == "end-user" and user_data.get("id") not in _autores_cache:
+            _autores_cache.set(user_data.get("id"), (user_data.get("email") or "Email não encontrado", []))
+
+    autores.update(_autores_cache.get_many([a for a in distintos if a not in autores]))
+    ausentes = [a for a in distintos if a not in autores]
+    if ausentes:
+        buscados = _buscar_usuarios_em_lote(ausentes)
+        for autor_id, info in buscados.items():
+            _autores_cache.set(autor_id, info)
+        autores.update(buscados)
+        for autor_id in ausentes:
+            if autor_id not in autores: # Não cacheia falhas para tentar de novo no próximo ticket
+                autores[autor_id] = ("Email não encontrado", [])
+    logging.info(f"Autores resolvidos: {len(distintos)} (diretório: {do_diretorio}, cache: {len(distintos) - len(ausentes) - do_diretorio}, buscados: {len(ausentes)})")
+    return autores
+
+def atualizar_diretorio():
+    """Atualiza o diretório de agentes se ele estiver velho (worker, entre lotes; ver zendesk_diretorio)."""
+    diretorio = zendesk_diretorio.get_diretorio()
+    if diretorio is None:
+        return False
+    base_url, session = _zendesk_client()
+    return zendesk_diretorio.atualizar_se_velho(diretorio, session, base_url, get_config().zendesk_timeout)
+
+def get_user_info(user_id):
+    """Busca informações do usuário (email e grupos) no Zendesk, usando o cache de autores."""
+    return resolver_autores([user_id])[user_id]
+
+@ticket_metrics.medido("texto")
+def gerar_texto_completo_do_ticket(ticket_id, ticket_details, comentarios, usuarios=None, config=None):
+    """Gera um texto consolidado com informações do ticket e comentários."""
+    config = config or get_config()
+    subject = ticket_details.get("subject", "Sem assunto")
+
+    cabecalho = f"-------------\nTicket ID: {ticket_id}\n"
+    cabecalho += f" - subject: {subject}\n"
+    compactador = _novo_compactador(config)
+    linhas = _renderizar_comentarios(ticket_id, comentarios, usuarios, compactador=compactador, config=config)
+    return _montar_com_orcamento(ticket_id, cabecalho, linhas, compactador, config=config)
+
+@ticket_metrics.medido("texto")
+def gerar_texto_do_ticket_em_stream(ticket_id, ticket_details, paginas, total_comentarios, usuarios=None, config=None):
+    """
+    Gera o mesmo texto de `gerar_texto_completo_do_ticket` a partir de páginas de comentários do
+    mais novo para o mais antigo, parando de ler (e de buscar páginas) assim que o orçamento do
+    prompt se esgota. `total_comentarios` numera os comentários sem ler os mais antigos.
+    """
+    config = config or get_config()
+    subject = ticket_details.get("subject", "Sem assunto")
+    cabecalho = f"-------------\nTicket ID: {ticket_id}\n"
+    cabecalho += f" - subject: {subject}\n"
+    compactador = _novo_compactador(config)
+    orcamento = prompt_budget.OrcamentoPrompt(cabecalho, config.prompt_char_budget)
+    ignore_emails = config.ignore_comment_emails
+    lidos, renderizados, bytes_lidos = 0, 0, len(cabecalho.encode("utf-8"))
+    try:
+        for pagina in paginas:
+            autores = resolver_autores((c.get("author_id") for c in pagina), usuarios_conhecidos=usuarios)
+            for comentario in pagina:
+                idx = max(1, total_comentarios - lidos)
+                lidos += 1
+                linha = _renderizar_linha(ticket_id, idx, comentario, autores, ignore_emails, compactador)
+                if linha is None:
+                    continue
+                renderizados += 1
+                bytes_lidos += len(linha.encode("utf-8"))
+                if not orcamento.adicionar(linha):
+                    break
+            if orcamento.esgotado:
+                logging.info(f"Orçamento do prompt do ticket {ticket_id} atingido após {lidos} comentário(s) lidos; comentários mais antigos não foram buscados.")
+                break
+    finally:
+        paginas.close() # Interrompe a paginação: as páginas restantes não são baixadas
+
+    omitidos = None if orcamento.esgotado else renderizados - len(orcamento)
+    conteudo = orcamento.montar(omitidos)
+    _registrar_tamanho_do_prompt(ticket_id, conteudo, bytes_lidos, compactador, omitidos)
+    return conteudo
+
+@ticket_metrics.medido("texto")
+def gerar_texto_incremental_do_ticket(ticket_id, novos_comentarios, usuarios=None, inicio=1, config=None):
+    """
+    Gera o texto de continuação com apenas os comentários novos (modo incremental).
+    Retorna string vazia se nenhum comentário novo for relevante (ex.: só a nota da própria Glean).
+    """
+    config = config or get_config()
+    compactador = _novo_compactador(config)
+    linhas = _renderizar_comentarios(ticket_id, novos_comentarios, usuarios, inicio=inicio, compactador=compactador, config=config)
+    if not linhas:
+        return ""
+    return _montar_com_orcamento(ticket_id, f"Novos comentários no Ticket ID {ticket_id}:\n", linhas, compactador, config=config)
+
+def _novo_compactador(config):
+    """Compactador de comentários por ticket, ou None se PROMPT_COMPACTION estiver desligado."""
+    if not config.prompt_compaction:
+        return None
+    return prompt_budget.CompactadorComentarios(min_bloco_repetido=config.prompt_min_repeated_block_chars)
+
+def _montar_com_orcamento(ticket_id, cabecalho, linhas, compactador=None, config=None):
+    """Aplica o orçamento de caracteres (PROMPT_CHAR_BUDGET) e registra quantos bytes foram economizados."""
+    orcamento = (config or get_config()).prompt_char_budget
+    conteudo, omitidos = prompt_budget.aplicar_orcamento(cabecalho, linhas, orcamento)
+    _registrar_tamanho_do_prompt(ticket_id, conteudo, len((cabecalho + "".join(linhas)).encode("utf-8")), compactador, omitidos)
+    return conteudo
+
+def _registrar_tamanho_do_prompt(ticket_id, conteudo, bytes_antes_do_orcamento, compactador, omitidos):
+    """Registra o tamanho final do prompt e quantos bytes a compactação e o orçamento economizaram."""
+    economia_compactacao = (compactador.bytes_originais - compactador.bytes_compactados) if compactador else 0
+    economia_orcamento = max(0, bytes_antes_do_orcamento - len(conteudo.encode("utf-8")))
+    logging.info(
+        f"Prompt do ticket {ticket_id}: {len(conteudo.encode('utf-8'))} bytes; economia de "
+        f"{economia_compactacao + economia_orcamento} bytes (compactação: {economia_compactacao}, "
+        f"orçamento: {economia_orcamento}, comentários omitidos: {'n/d' if omitidos is None else omitidos})."
+    )
+
+def _renderizar_comentarios(ticket_id, comentarios, usuarios=None, inicio=1, compactador=None, config=None):
+    """Renderiza uma linha por comentário, ignorando os autores de IGNORE_COMMENT_EMAILS."""
+    linhas = []
+    ignore_emails = (config or get_config()).ignore_comment_emails
+
+    # Resolve todos os autores distintos de uma vez, antes de montar o texto
+    autores = resolver_autores((c.get("author_id") for c in comentarios), usuarios_conhecidos=usuarios)
+
+    for idx, comentario in enumerate(comentarios, start=inicio):
+        linha = _renderizar_linha(ticket_id, idx, comentario, autores, ignore_emails, compactador)
+        if linha is not None:
+            linhas.append(linha)
+    return linhas
+
+def _renderizar_linha(ticket_id, idx, comentario, autores, ignore_emails, compactador=None):
+    """Linha do comentário no prompt, ou None se o autor estiver em IGNORE_COMMENT_EMAILS."""
+    autor_id = comentario.get("author_id")
+
+    if autor_id is None:
+        autor_email_str = "Autor Desconhecido"
+        grupos_str = "N/A"
+    else:
+        autor_email, grupos = autores[autor_id]
+        autor_email_str = str(autor_email) 
+        grupos_str = ", ".join(grupos) if grupos else "Nenhum grupo"
+
+    if autor_email_str in ignore_emails:
+        logging.info(f"Ignorando comentário de {autor_email_str} no ticket {ticket_id}")
+        return None
+    if compactador is not None:
+        corpo = compactador.compactar(comentario.get("body") or "")
+    else:
+        corpo = (comentario.get("body") or "").replace("\n", " ").strip()
+    return f" - comentário {idx} ({autor_email_str} | Grupos: {grupos_str}): {corpo}\n"
+
+
+def ask_glean(texto_ticket_completo, application_id, config=None):
+    """Envia o texto do ticket para a Glean e retorna a resposta e o token."""
+    try:
+        reply, token, _ = ask_glean_conversa(texto_ticket_completo, application_id, config=config)
+    except glean_breaker.GleanIndisponivel:
+        return None, None
+    return reply, token
+
+@ticket_metrics.medido("glean")
+def ask_glean_conversa(texto_ticket_completo, application_id, chat_id=None, config=None):
+    """
+    Envia o texto para a Glean e retorna (resposta, token, chat_id).
+    Com `chat_id`, o texto é enviado como continuação desse chat (modo incremental), sem repetir o prompt de sistema.
+    Levanta glean_breaker.GleanIndisponivel quando a chamada não foi feita (circuito aberto ou sem vaga):
+    é um adiamento, não uma falha do ticket.
+    """
+    config = config or get_config()
+    glean_api_url, glean_session = _glean_client()
+    system_prompt = config.glean_system_prompt
+    cache = None
+    if chat_id is None: # Continuações dependem do histórico do chat
+        try:
+            cache = glean_cache.get_answer_cache(config)
+        except Exception as e: # Ex.: falha ao criar o cliente do DynamoDB; segue sem cache, como num miss
+            logging.error(f"Cache de respostas da Glean indisponível; consultando a Glean sem cache: {e}")
+    chave_cache = glean_cache.chave_resposta(texto_ticket_completo, system_prompt, application_id) if cache else None
+    if cache:
+        entrada = cache.get(chave_cache)
+        if entrada:
+            logging.info(f"Resposta da Glean encontrada no cache (application_id: {application_id}). Glean não chamada.")
+            return formatar_resposta_com_citacoes(entrada["texto"], entrada["citacoes"]), entrada["token"], entrada.get("chat_id")
+
+    if chat_id:
+        payload = {
+            'stream': True,
+            'applicationId': application_id,
+            'chatId': chat_id,
+            'messages': [make_content_message(text=texto_ticket_completo)]
+        }
+    else:
+        payload = {
+            'stream': True,
+            'applicationId': application_id,
+            'messages': list(reversed([
+                make_system_message(system_prompt),
+                make_content_message(text=texto_ticket_completo)
+            ]))
+        }
+    if glean_conversa.modo_incremental_habilitado(config):
+        payload['saveChat'] = True # A Glean só devolve um chatId reutilizável para chats salvos
+    
+    if config.save_glean_payload:
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        extracted_ticket_id_str = "unknown_ticket"
+        try:
+            # Best effort to extract ticket_id from the generated text for filename
+            # Assumes "Ticket ID: <id>" is the second line of texto_ticket_completo
+            lines = texto_ticket_completo.strip().splitlines()
+            if len(lines) > 1 and lines[1].startswith("Ticket ID: "):
+                extracted_ticket_id_str = lines[1].split(': ')[1].strip()
+        except Exception: # Catch all for safety during string manipulation
+            logging.warning("Could not reliably extract ticket_id for payload filename.", exc_info=True)
+
+        filename = f"/tmp/envio_glean_{timestamp}_ticket_{extracted_ticket_id_str}.txt"
+        try:
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write("Payload enviado para a Glean:\n\n")
+                f.write(json.dumps(payload, indent=2))
+            logging.info(f"Payload para Glean salvo em {filename}")
+        except IOError as e:
+            logging.error(f"Erro ao salvar payload da Glean em arquivo: {e}")
+
+    logging.info(f"Enviando requisição para Glean para application_id: {application_id}")
+    ticket_metrics.registrar_tamanho("prompt_bytes", len(texto_ticket_completo.encode("utf-8")))
+    reply, token, chat_id_resposta = None, None, None # Initialize
+    try:
+        # Limite de concorrência + circuit breaker por applicationId: com a Glean degradada, falha na hora
+        with glean_breaker.get_protecao().chamada(application_id) as chamada_glean:
+            inicio_requisicao = time.monotonic()
+            response = glean_session.post(glean_api_url, json=payload, stream=True, timeout=config.glean_timeout)
+            response.raise_for_status()
+            logging.info(f"Resposta da Glean recebida com status {response.status_code}")
+            texto, citacoes, token, chat_id_resposta = ler_stream_glean(response, inicio=inicio_requisicao, chamada_glean=chamada_glean)
+            if not texto:
+                chamada_glean.marcar_falha() # Stream interrompido ou vazio conta como erro no breaker
+        chat_id_resposta = chat_id_resposta or chat_id
+        reply = formatar_resposta_com_citacoes(texto, citacoes)
+        ticket_metrics.registrar_tamanho("resposta_bytes", len(reply.encode("utf-8")))
+        logging.info(f"Processamento do stream da Glean concluído. Token presente: {token is not None}")
+        if cache and texto:
+            cache.set(chave_cache, {"texto": texto, "citacoes": citacoes, "token": token, "chat_id": chat_id_resposta})
+    except glean_breaker.GleanIndisponivel as e:
+        logging.warning(f"Chamada à Glean não realizada: {e}. Ticket será tentado novamente em ~{e.tentar_em:.0f}s.")
+        raise
+    except requests.exceptions.Timeout:
+        logging.error(f"Timeout ao chamar API da Glean.")
+    except requests.exceptions.HTTPError as http_err:
+        response_text = ""
+        if 'response' in locals() and hasattr(response, 'text'):
+            response_text = response.text
+        logging.error(f"Erro HTTP da API da Glean: {http_err} - {response_text}")
+    except requests.exceptions.RequestException as req_err:
+        logging.error(f"Erro de requisição para API da Glean: {req_err}")
+    except Exception as e: # Catch any other unexpected error during Glean call or response processing
+        logging.error(f"Erro inesperado ao chamar Glean ou processar resposta: {e}", exc_info=True) 
+    return reply, token, chat_id_resposta
+
+def make_system_message(text):
+    """Cria uma mensagem de sistema para a API da Glean."""
+    return {"author": "SYSTEM", 
+            "messageType": "CONTENT", 
+            "fragments": [{"text": text}]}
+
+def make_content_message(author='USER', text=None, citations=None):
+    """Cria uma mensagem de conteúdo para a API da Glean."""
+    message = {'author': author, 'messageType': 'CONTENT'}
+    if text: message['fragments'] = [{'text': text}]
+    if citations: message['citations'] = citations # Note: Glean's API might expect citations in a specific part of the request
+    return message
+
+def process_response_message_stream(response):
+    """Processa o stream de resposta da Glean, extraindo texto e citações."""
+    resposta_texto, citacoes_unicas, token_glean, _ = ler_stream_glean(response)
+    resposta_final = formatar_resposta_com_citacoes(resposta_texto, citacoes_unicas)
+    logging.info(f"Processamento do stream da Glean concluído. Token presente: {token_glean is not None}")
+    return resposta_final, token_glean
+
+def ler_stream_glean(response, inicio=None, chamada_glean=None):
+    """
+    Lê o stream de resposta da Glean e retorna (texto, citações únicas por URL, token, chat_id).
+    `inicio` (time.monotonic do envio da requisição) permite medir o tempo até o primeiro token,
+    que é passado a `chamada_glean` (glean_breaker) para a detecção de lentidão.
+    """
+    logging.info("Iniciando o processamento do stream da resposta da Glean...")
+    consumidor = glean_stream.ConsumidorStreamGlean(inicio=inicio)
+    try:
+        consumidor.consumir(response)
+    except Exception as e:
+        logging.error(f"Erro ao processar stream da Glean: {e}", exc_info=True)
+    ttft = f"{consumidor.tempo_primeiro_token:.2f}s" if consumidor.tempo_primeiro_token is not None else "n/a"
+    if consumidor.tempo_primeiro_token is not None:
+        if chamada_glean is not None:
+            chamada_glean.registrar_latencia(consumidor.tempo_primeiro_token)
+        ticket_metrics.registrar_duracao("glean_ttft", consumidor.tempo_primeiro_token)
+        ticket_metrics.registrar_duracao("glean_stream", consumidor.tempo_total - consumidor.tempo_primeiro_token)
+    logging.info(
+        f"Stream da Glean: {consumidor.linhas} linha(s), {len(consumidor.citacoes)} citação(ões) única(s), "
+        f"primeiro token em {ttft}, total {consumidor.tempo_total:.2f}s."
+    )
+    return consumidor.texto, consumidor.citacoes, consumidor.token, consumidor.chat_id
+
+def formatar_resposta_com_citacoes(resposta_texto, citacoes_unicas_lista):
+    """Anexa ao texto da resposta a seção de fontes citadas pela Glean."""
+    partes = [resposta_texto]
+    if citacoes_unicas_lista:
+        partes.append("\n\n🔍 *Fontes mencionadas pela Glean:*\n")
+        for i, citacao_obj in enumerate(citacoes_unicas_lista, start=1):
+            # Prioritize text, then title, then URL for display
+            fonte_texto = citacao_obj.get("text", "").strip() or \
+                          citacao_obj.get("sourceDocument", {}).get("title", "").strip() or \
+                          citacao_obj.get("url", "").strip() or \
+                          citacao_obj.get("sourceDocument", {}).get("url", "").strip()
+            if not fonte_texto: continue # Skip if no useful text/URL
+
+            url_citacao = citacao_obj.get("url") or citacao_obj.get("sourceDocument", {}).get("url")
+            if url_citacao:
+                partes.append(f"{i}. [{fonte_texto}]({url_citacao})\n")
+            else:
+                partes.append(f"{i}. {fonte_texto}\n")
+    return "".join(partes)
+
+def process_message_fragment(message):
+    """Extrai texto e citações de um fragmento de mensagem da Glean."""
+    text = ''
+    citations = [] # Initialize as empty list
+    if message.get('messageType') == 'CONTENT':
+        text = ''.join(fragment.get('text', '') for fragment in message.get('fragments', []))
+        # Citations are usually part of the message object, not inside fragments
+        message_citations = message.get('citations')
+        if message_citations: # Check if citations exist and is not None
+             citations.extend(message_citations)
+    return text, citations
+
+def salvar_resposta_em_txt(ticket_id, resposta_glean, config=None):
+    """Salva a resposta da Glean em um arquivo TXT no diretório /tmp/ (para debug)."""
+    if not (config or get_config()).save_glean_response_txt:
+        return # Skip saving if not enabled
+
+    file_path = f"/tmp/resposta_glean_ticket_{ticket_id}.txt"
+    try:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(resposta_glean)
+        logging.info(f"Resposta da Glean para ticket {ticket_id} salva em {file_path}")
+    except IOError as e:
+        logging.error(f"Erro ao salvar resposta da Glean para ticket {ticket_id} em TXT: {e}")
+
+@ticket_metrics.medido("zendesk_nota")
+def post_internal_note_to_zendesk(ticket_id, note_text, config=None):
+    """Posta uma nota interna no ticket do Zendesk. Retorna True se a nota foi postada."""
+    config = config or get_config()
+    base_url, session = _zendesk_client()
+    url = f"{base_url}/tickets/{ticket_id}.json"
+    aviso_glean = config.note_preamble
+    payload = {
+        "ticket": {
+            "comment": {
+                "body": aviso_glean + note_text,
+                "public": False # Ensures it's an internal note
+            }
+        }
+    }
+    logging.info(f"Postando nota interna no ticket Zendesk ID: {ticket_id}")
+    try:
+        response = session.put(url, json=payload, timeout=config.zendesk_note_timeout)
+        response.raise_for_status()
+        logging.info(f"Nota interna postada com sucesso no ticket {ticket_id} do Zendesk.")
+        return True
+    except requests.exceptions.Timeout:
+        logging.error(f"Timeout ao postar nota interna no ticket Zendesk {ticket_id}.")
+    except requests.exceptions.HTTPError as http_err:
+        response_text = ""
+        if 'response' in locals() and hasattr(response, 'text'):
+            response_text = response.text
+        logging.error(f"Erro HTTP ao postar nota interna no Zendesk para ticket {ticket_id}: {http_err} - {response_text}")
+    except requests.exceptions.RequestException as req_err:
+        logging.error(f"Erro de requisição ao postar nota interna no Zendesk para ticket {ticket_id}: {req_err}")
+    return False
+
+def buscar_formulario_para_tickets(ticket_id, ticket_data=None):
+    """Busca o ID do formulário do ticket no Zendesk (ou o lê de `ticket_data`, se já buscado)."""
+    if ticket_data is None:
+        ticket_data = buscar_dados_completos_do_ticket(ticket_id)
+    if ticket_data:
+        ticket_form_id = ticket_data.get("ticket_form_id")
+        if ticket_form_id is None:
+            logging.warning(f"ID do formulário do ticket (ticket_form_id) não encontrado para o ticket {ticket_id}.")
+        return ticket_form_id
+    logging.error(f"Não foi possível obter dados do ticket {ticket_id} para buscar form_id.")
+    return None
+
+class ContextoTicket:
+    """
+    Snapshot de um ticket para uma única invocação.
+    O ticket é buscado no máximo uma vez e alimenta o roteamento por formulário, a geração do
+    texto e a postagem da nota. Os comentários (com os autores em sideload) são lidos do mais
+    novo para o mais antigo, página a página, só até onde o texto precisa.
+    """
+
+    _NAO_BUSCADO = object()
+
+    def __init__(self, ticket_id, config=None):
+        self.ticket_id = str(ticket_id)
+        self.config = config or get_config()
+        self._ticket = None
+        self._comentarios = self._NAO_BUSCADO
+        self.usuarios = {} # Autores dos comentários (sideload), por ID
+        self.ultimo_comentario_id = None # ID do comentário mais novo lido
+
+    @property
+    def ticket(self):
+        if self._ticket is None:
+            self._ticket = buscar_dados_completos_do_ticket(self.ticket_id)
+        return self._ticket
+
+    @property
+    def form_id(self):
+        return buscar_formulario_para_tickets(self.ticket_id, ticket_data=self.ticket)
+
+    @property
+    def comentarios(self):
+        """Comentários do ticket, ou None se a busca falhou."""
+        if self._comentarios is self._NAO_BUSCADO:
+            self._comentarios = buscar_comentarios_do_ticket(self.ticket_id, usuarios_sideload=self.usuarios)
+            if self._comentarios:
+                self.ultimo_comentario_id = max(c.get("id") or 0 for c in self._comentarios)
+        return self._comentarios
+
+    @property
+    def total_comentarios(self):
+        """Quantidade de comentários do ticket (sideload comment_count), ou None se o Zendesk não a informou."""
+        return (self.ticket or {}).get("comment_count")
+
+    def paginas_de_comentarios(self):
+        """Páginas de comentários do mais novo para o mais antigo. Levanta ErroBuscaComentarios."""
+        base_url, session = _zendesk_client()
+        paginas = zendesk_comentarios.iterar_paginas(
+            session, base_url, self.ticket_id, self.config.zendesk_timeout,
+            page_size=self.config.zendesk_comments_page_size, usuarios_sideload=self.usuarios,
+        )
+        try:
+            for pagina in paginas:
+                if self.ultimo_comentario_id is None:
+                    self.ultimo_comentario_id = pagina[0].get("id")
+                yield pagina
+        finally:
+            paginas.close()
+
+    def gerar_texto(self):
+        """Texto completo do ticket para a Glean, ou None se a busca dos comentários falhou."""
+        if self.total_comentarios is None: # Sem a contagem, é preciso ler tudo para numerar os comentários
+            if self.comentarios is None:
+                return None
+            return gerar_texto_completo_do_ticket(self.ticket_id, self.ticket, self.comentarios, usuarios=self.usuarios, config=self.config)
+        try:
+            return gerar_texto_do_ticket_em_stream(
+                self.ticket_id, self.ticket, self.paginas_de_comentarios(), self.total_comentarios,
+                usuarios=self.usuarios, config=self.config,
+            )
+        except zendesk_comentarios.ErroBuscaComentarios as e:
+            logging.error(str(e))
+            return None
+
+    def comentarios_novos(self, estado_conversa):
+        """
+        Comentários posteriores aos já enviados à Glean (modo incremental), em ordem cronológica,
+        e a posição do primeiro deles no ticket. A leitura para no primeiro comentário já enviado.
+        Retorna None se a busca falhou.
+        """
+        if self.total_comentarios is None:
+            if self.comentarios is None:
+                return None
+            novos = glean_conversa.comentarios_novos(self.comentarios, estado_conversa)
+            return novos, len(self.comentarios) - len(novos) + 1
+        novos = []
+        paginas = self.paginas_de_comentarios()
+        try:
+            for pagina in paginas:
+                novos_da_pagina = glean_conversa.comentarios_novos(pagina, estado_conversa)
+                novos.extend(novos_da_pagina)
+                if len(novos_da_pagina) < len(pagina):
+                    break
+        except zendesk_comentarios.ErroBuscaComentarios as e:
+            logging.error(str(e))
+            return None
+        finally:
+            paginas.close()
+        novos.reverse()
+        return novos, max(1, self.total_comentarios - len(novos) + 1)
+
+##--------------------------------------------------------------------------##
+# Funções de Persistência de Token (Excel em /tmp/ ou DynamoDB)
+##--------------------------------------------------------------------------##
+@ticket_metrics.medido("token_persistencia")
+def salvar_token_em_dynamodb(ticket_id, token_glean, application_id):
+    """
+    Agenda a gravação do token da Glean na tabela DynamoDB (DYNAMODB_TOKENS_TABLE_NAME).
+    O item vai para o buffer de `token_sink`, gravado em lote fora do caminho crítico do ticket.
+    """
+    sink = token_sink.get_token_sink()
+    if sink is None:
+        logging.warning("Nome da tabela DynamoDB (DYNAMODB_TOKENS_TABLE_NAME) não configurado. Não salvando token no DynamoDB.")
+        return
+
+    timestamp_atual_utc = datetime.datetime.utcnow().isoformat() + "Z"
+    item_to_save = {
+        'ticket_id': str(ticket_id),             # Chave de Partição (PK)
+        'timestamp_salvo_utc': timestamp_atual_utc, # Chave de Classificação (SK) - permite múltiplos tokens por ticket ao longo do tempo
+        'glean_message_tracking_token': str(token_glean),
+        'glean_application_id': str(application_id) # AJUSTE: Adicionado application_id
+    }
+    sink.adicionar(item_to_save)
+    logging.info(f"Token Glean do ticket {ticket_id} agendado para gravação no DynamoDB.")
+
+##--------------------------------------------------------------------------##
+# Função principal de processamento do Webhook
+##--------------------------------------------------------------------------##
+def processa_ticket(payload_data, config=None):
+    """
+    Processa o payload do webhook do Zendesk.
+    Esta função é chamada pelo worker da fila (em `lambda_zendesk_glean.py`).
+    `config` (padrão: get_config()) é a configuração validada usada em todo o pipeline.
+
+    Retorna True quando a nota foi postada, False quando uma etapa falhou e o ticket deve
+    ser reprocessado, e None quando o payload ou a configuração impedem o processamento.
+    """
+    if not isinstance(payload_data, dict):
+        logging.error(f"Payload (payload_data) recebido não é um dicionário: {type(payload_data)}")
+        return
+
+    ticket_info = payload_data.get("ticket", {})
+    ticket_id = ticket_info.get("id") # Assume que o ID do ticket é um número ou string
+
+    if not ticket_id: # Checa se ticket_id é None ou vazio
+        logging.error(f"ID do Ticket (ticket.id) não encontrado ou inválido no payload: {json.dumps(payload_data)}")
+        return
+
+    # Converte ticket_id para string para consistência, especialmente se for usado como chave no DynamoDB
+    ticket_id_str = str(ticket_id)
+    logging.info(f"Iniciando processamento para Zendesk Ticket ID: {ticket_id_str}")
+
+    # Tempo por etapa, chamadas HTTP por host e tamanhos; com CAPTURE_DIR, também a captura para replay
+    with ticket_metrics.medir_ticket(ticket_id_str) as medicao, ticket_capture.capturar_ticket(payload_data):
+        medicao.resultado = _processar_ticket(payload_data, ticket_id_str, config)
+    return medicao.resultado
+
+def _processar_ticket(payload_data, ticket_id_str, config=None):
+    """Etapas de `processa_ticket` para um payload já validado (mesmos valores de retorno)."""
+    config = config or get_config() # Validada uma vez por container: configuração inválida falha aqui, não no meio do ticket
+    default_app_id = config.default_app_id
+
+    retry = ticket_retry.retomada(payload_data)
+    if retry and retry["etapa"] == ticket_retry.ETAPA_NOTA and retry["contexto"].get("resposta"):
+        # Só a postagem da nota falhou: reaproveita a resposta já recebida, sem chamar a Glean de novo
+        logging.info(f"Retomando ticket {ticket_id_str} na etapa '{ticket_retry.ETAPA_NOTA}' (tentativa {retry['tentativas'] + 1}).")
+        return _postar_nota(payload_data, ticket_id_str, retry["contexto"], config)
+
+    contexto = ContextoTicket(ticket_id_str, config) # Busca o ticket uma única vez para toda a invocação
+    form_id_raw = contexto.form_id
+    application_id = config.application_id_para_formulario(form_id_raw)
+
+    if form_id_raw is None:
+        logging.warning(f"Não foi possível determinar o form_id para o ticket {ticket_id_str}. Usando application_id padrão: {default_app_id}")
+        application_id = default_app_id
+    elif application_id is None:
+        logging.warning(f"Form ID {form_id_raw} não mapeado. Usando application_id padrão: {default_app_id}")
+        application_id = default_app_id
+    else:
+        logging.info(f"Application ID da Glean correspondente ao form ID {form_id_raw} encontrado: {application_id}")
+
+    logging.info(f"Application ID da Glean selecionado para o ticket {ticket_id_str}: {application_id}")
+    espera_circuito = glean_breaker.get_protecao().circuito_aberto(application_id)
+    if espera_circuito:
+        # Glean degradada para esta aplicação: adia o ticket sem gastar chamadas ao Zendesk
+        logging.warning(f"Circuito da Glean aberto para {application_id} (~{espera_circuito:.0f}s). Ticket {ticket_id_str} adiado para nova tentativa.")
+        return _adiar(payload_data, ticket_retry.ETAPA_GLEAN, f"circuito aberto para {application_id}", espera_circuito)
+
+    if not contexto.ticket:
+        logging.error(f"Não foi possível buscar detalhes completos para o ticket {ticket_id_str}. Processamento interrompido.")
+        return _falhar(payload_data, ticket_retry.ETAPA_TICKET, "falha ao buscar o ticket no Zendesk")
+    chat_id = None
+    modo_incremental = glean_conversa.modo_incremental_habilitado(config)
+    estado_conversa = glean_conversa.carregar_estado(ticket_id_str, config) if modo_incremental else None
+    if estado_conversa and estado_conversa.get("chat_id") and estado_conversa.get("application_id") == application_id:
+        # Modo incremental: envia só os comentários novos, como continuação do chat anterior
+        resultado_novos = contexto.comentarios_novos(estado_conversa)
+        if resultado_novos is None:
+            return _falha_nos_comentarios(payload_data, ticket_id_str)
+        novos, inicio = resultado_novos
+        texto_ticket_completo = gerar_texto_incremental_do_ticket(ticket_id_str, novos, contexto.usuarios, inicio=inicio, config=config)
+        if not texto_ticket_completo:
+            logging.info(f"Nenhum comentário novo relevante no ticket {ticket_id_str} desde a última sugestão. Não chamando a Glean.")
+            return
+        chat_id = estado_conversa["chat_id"]
+        logging.info(f"Modo incremental: enviando {len(novos)} comentário(s) novo(s) no chat {chat_id} da Glean.")
+    else:
+        texto_ticket_completo = contexto.gerar_texto()
+        if texto_ticket_completo is None:
+            return _falha_nos_comentarios(payload_data, ticket_id_str)
+    if not texto_ticket_completo.strip():
+        logging.warning(f"Texto completo gerado para o ticket {ticket_id_str} está vazio. Não chamando a Glean.")
+        return
+
+    try:
+        response_from_glean, token_glean, chat_id = ask_glean_conversa(texto_ticket_completo, application_id, chat_id=chat_id, config=config)
+    except glean_breaker.GleanIndisponivel as e:
+        return _adiar(payload_data, ticket_retry.ETAPA_GLEAN, str(e), e.tentar_em)
+
+    if response_from_glean and chat_id and modo_incremental:
+        ultimo_comentario_id = contexto.ultimo_comentario_id or (estado_conversa or {}).get("ultimo_comentario_id") or 0
+        glean_conversa.salvar_estado(ticket_id_str, chat_id, ultimo_comentario_id, application_id, config)
+
+    if token_glean:
+        if config.token_persistence_method == "dynamodb":
+            salvar_token_em_dynamodb(ticket_id_str, token_glean, application_id) # AJUSTE: Passando application_id
+        else:
+            logging.info(f"Persistência de token desativada (TOKEN_PERSISTENCE_METHOD={config.token_persistence_method}).")
+    else:
+        logging.warning(f"Nenhum token de rastreamento da Glean recebido para o ticket {ticket_id_str}.")
+
+    if not response_from_glean:
+        logging.warning(f"Nenhuma resposta (conteúdo) da Glean para o ticket {ticket_id_str}.")
+        return _falhar(payload_data, ticket_retry.ETAPA_GLEAN, "nenhuma resposta da Glean")
+
+    salvar_resposta_em_txt(ticket_id_str, response_from_glean, config=config) # Salva em /tmp/ se habilitado
+    contexto_retry = {"resposta": response_from_glean, "token": token_glean, "application_id": application_id, "chat_id": chat_id}
+    return _postar_nota(payload_data, ticket_id_str, contexto_retry, config)
+
+
+def _falha_nos_comentarios(payload_data, ticket_id_str):
+    logging.error(f"Não foi possível buscar os comentários do ticket {ticket_id_str}. Processamento interrompido para nova tentativa.")
+    return _falhar(payload_data, ticket_retry.ETAPA_COMENTARIOS, "falha ao buscar os comentários no Zendesk")
+
+def _falhar(payload_data, etapa, motivo, contexto=None):
+    """Registra a falha da etapa para nova tentativa com backoff e retorna False (ticket a reprocessar)."""
+    ticket_retry.registrar_falha(payload_data, etapa, motivo, contexto)
+    return False
+
+def _adiar(payload_data, etapa, motivo, tentar_em):
+    """Como `_falhar`, mas sem gastar uma das RETRY_MAX_ATTEMPTS: a Glean recusou a chamada (circuito aberto ou sem vaga)."""
+    ticket_retry.registrar_adiamento(payload_data, etapa, motivo, tentar_em)
+    return False
+
+
+def _postar_nota(payload_data, ticket_id_str, contexto_retry, config):
+    """Última etapa: posta a nota. Em caso de falha, guarda a resposta para a próxima tentativa."""
+    if not post_internal_note_to_zendesk(ticket_id_str, contexto_retry["resposta"], config=config):
+        return _falhar(payload_data, ticket_retry.ETAPA_NOTA, "falha ao postar a nota interna no Zendesk", contexto_retry)
+    ticket_retry.concluir(payload_data)
+    logging.info(f"Processamento do Zendesk Ticket ID: {ticket_id_str} concluído.")
+    return True
+
+##--------------------------------------------------------------------------##
+## Bloco para execução local com Flask (para testes)
+##--------------------------------------------------------------------------##
+if __name__ == "__main__":
+    import atexit
+    from flask import Flask, request
+    import ticket_dedup
+    from bounded_executor import BoundedExecutor
+
+    flask_app = Flask(__name__)
+    # Registrado antes do pool: o atexit roda em ordem inversa, então os tokens são gravados depois que os tickets terminam
+    atexit.register(token_sink.encerrar)
+    # Pool limitado: evita um thread por webhook em rajadas de gatilhos/macros
+    ticket_executor = BoundedExecutor(
+        max_workers=get_env_variable('FLASK_WORKER_POOL_SIZE', default_value=4, var_type=int),
+        max_queue=get_env_variable('FLASK_WORKER_QUEUE_SIZE', default_value=50, var_type=int),
+    )
+    atexit.register(ticket_executor.shutdown, wait=True) # Drena os tickets em andamento ao encerrar
+    zendesk_diretorio.pre_carregar() # Agentes e grupos em memória antes do primeiro webhook
+    atualizar_diretorio() # Servidor local: atualiza só na inicialização, não a cada webhook
+
+    @flask_app.route("/zendesk-to-glean", methods=["POST"])
+    def zendesk_webhook_flask_endpoint():
+        """Endpoint Flask para receber webhooks do Zendesk (para testes locais)."""
+        try:
+            webhook_data = request.get_json()
+            if webhook_data is None:
+                logging.error("Payload JSON vazio ou malformado recebido no endpoint Flask local.")
+                return {"status": "error", "message": "Payload JSON inválido"}, 400
+        except Exception as e: # Werkzeug pode levantar BadRequest em JSON malformado
+            logging.error(f"Erro ao obter JSON do request Flask local: {e}")
+            return {"status": "error", "message": "Erro ao processar payload JSON"}, 400
+
+        logging.info("Payload recebido (Flask local):")
+        # Use ensure_ascii=False para imprimir caracteres acentuados corretamente se houver no payload
+        logging.info(json.dumps(webhook_data, indent=2, ensure_ascii=False))
+        
+        logging.info("Simulando execução local. Certifique-se que as variáveis de ambiente para persistência (DynamoDB/Excel) e APIs estão configuradas se necessário.")
+
+        if not ticket_dedup.registrar_evento(webhook_data):
+            return {"status": "duplicate"}, 200
+
+        try:
+            # Com o ticket já em processamento, o evento fica pendente e é executado quando o atual terminar
+            future = ticket_executor.try_submit(ticket_dedup.executar_evento, webhook_data, processa_ticket)
+        except Exception as e:
+            logging.error(f"Erro ao agendar processamento (Flask local): {e}", exc_info=True)
+            return {"status": "error", "message": "Erro interno ao iniciar processamento"}, 500
+
+        if future is None:
+            ticket_dedup.desfazer_evento(webhook_data) # Aceita o reenvio do Zendesk após o 503
+            logging.warning(f"Pool de workers saturado; webhook recusado. Estado: {ticket_executor.stats()}")
+            return {"status": "busy", "message": "Fila de processamento cheia"}, 503, {"Retry-After": "30"}
+        logging.info("Ticket agendado no pool de processamento (Flask local).")
+        return {"status": "received"}, 200
+
+    @flask_app.route("/config/reload", methods=["POST"])
+    def reload_config_flask_endpoint():
+        """Relê as variáveis de ambiente da configuração do pipeline (Flask local)."""
+        try:
+            config = recarregar_config()
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}, 400
+        return {"status": "reloaded", "formularios_roteados": sorted(config.rotas_formulario)}, 200
+
+    @flask_app.route("/metrics", methods=["GET"])
+    def metrics_flask_endpoint():
+        """Profundidade da fila, pool de workers, rate limit do Zendesk, circuitos da Glean e latência por etapa (Flask local)."""
+        return {
+            **ticket_executor.stats(),
+            "zendesk": zendesk_rate_limit.get_agendador().stats(),
+            "glean_circuitos": glean_breaker.get_protecao().stats(),
+            "latencia": ticket_metrics.resumo(), # p50/p95/p99 por etapa dos tickets recentes
+        }, 200
+
+    try:
+        get_config() # Falha já na subida se a configuração do pipeline for inválida
+        flask_host = get_env_variable('FLASK_RUN_HOST', default_value='0.0.0.0')
+        flask_port = get_env_variable('FLASK_RUN_PORT', default_value=5001, var_type=int)
+        flask_debug = get_env_variable('FLASK_DEBUG_MODE', default_value="False", var_type=bool)
+        
+        logging.info(f"Iniciando servidor Flask local em http://{flask_host}:{flask_port}/ (Debug: {flask_debug})")
+        # Para testes locais com DynamoDB, certifique-se que suas credenciais AWS
+        # estão configuradas no ambiente (ex: via `aws configure`, variáveis de ambiente AWS_ACCESS_KEY_ID, etc.).
+        flask_app.run(host=flask_host, port=flask_port, debug=flask_debug)
+    except ValueError as e: # Captura erro de get_env_variable
+        logging.error(f"Erro ao carregar configuração para o servidor Flask local: {e}")
+    except Exception as e: # Outros erros ao iniciar o Flask
+        logging.error(f"Erro inesperado ao tentar iniciar o servidor Flask local: {e}", exc_info=True)
+
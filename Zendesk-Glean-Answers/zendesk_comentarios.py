@@ -0,0 +1,78 @@
+"""
+Leitura paginada e sob demanda dos comentários de um ticket do Zendesk.
+
+`/tickets/{id}/comments.json` devolve no máximo uma página por chamada. Aqui os comentários
+são lidos com paginação por cursor (`page[size]`, `page[after]`), do mais novo para o mais
+antigo, e entregues página a página. Quem consome pode parar a qualquer momento (orçamento
+do prompt atingido, comentário já processado no modo incremental) e as páginas seguintes não
+são baixadas. De cada comentário só ficam os campos que o pipeline usa. Os anexos, o HTML e
+os metadados de canal são descartados assim que a página é lida, então a memória fica
+limitada a uma página.
+"""
+import json
+import logging
+
+import requests
+
+import ticket_metrics
+
+PAGE_SIZE_MAXIMO = 100 # Máximo aceito pela paginação por cursor do Zendesk
+CAMPOS_COMENTARIO = ("id", "author_id", "body", "public", "created_at")
+
+
+class ErroBuscaComentarios(Exception):
+    """Uma página de comentários não pôde ser lida; o ticket não deve ser respondido com dados parciais."""
+
+
+def _enxugar(comentario):
+    return {campo: comentario.get(campo) for campo in CAMPOS_COMENTARIO}
+
+
+def iterar_paginas(session, base_url, ticket_id, timeout, page_size=PAGE_SIZE_MAXIMO,
+                   mais_recentes_primeiro=True, usuarios_sideload=None):
+    """
+    Gera as páginas de comentários (listas enxutas) do ticket, seguindo o cursor até o fim.
+    Se `usuarios_sideload` for um dicionário, pede os autores de cada página (include=users)
+    e o preenche por ID. Levanta ErroBuscaComentarios se alguma página falhar.
+    """
+    url = f"{base_url}/tickets/{ticket_id}/comments.json"
+    params = {
+        "page[size]": max(1, min(int(page_size), PAGE_SIZE_MAXIMO)),
+        "sort": "-created_at" if mais_recentes_primeiro else "created_at",
+    }
+    if usuarios_sideload is not None:
+        params["include"] = "users"
+
+    paginas = 0
+    while True:
+        try:
+            with ticket_metrics.etapa("zendesk_comentarios"):
+                response = session.get(url, params=params, timeout=timeout)
+                response.raise_for_status()
+                dados = response.json()
+        except requests.exceptions.HTTPError as http_err:
+            raise ErroBuscaComentarios(f"Erro HTTP ao buscar comentários do ticket {ticket_id}: {http_err} - {http_err.response.text if http_err.response is not None else ''}") from http_err
+        except requests.exceptions.RequestException as req_err:
+            raise ErroBuscaComentarios(f"Erro de requisição ao buscar comentários do ticket {ticket_id}: {req_err}") from req_err
+        except json.JSONDecodeError as json_err:
+            raise ErroBuscaComentarios(f"Erro ao decodificar JSON dos comentários do ticket {ticket_id}.") from json_err
+
+        paginas += 1
+        if usuarios_sideload is not None:
+            usuarios_sideload.update({u.get("id"): u for u in dados.get("users", [])})
+        pagina = [_enxugar(c) for c in dados.get("comments", [])]
+        ticket_metrics.registrar_tamanho("comentarios_lidos", len(pagina), acumular=True)
+        meta = dados.get("meta") or {}
+        del dados # Libera o JSON bruto (anexos, html_body, via...) antes de entregar a página
+        logging.info(f"Página {paginas} de comentários do ticket {ticket_id}: {len(pagina)} comentário(s).")
+        if pagina:
+            yield pagina
+        if not meta.get("has_more") or not meta.get("after_cursor"):
+            return
+        params["page[after]"] = meta["after_cursor"]
+
+
+def iterar_comentarios(session, base_url, ticket_id, timeout, **opcoes):
+    """Os comentários de `iterar_paginas`, um a um."""
+    for pagina in iterar_paginas(session, base_url, ticket_id, timeout, **opcoes):
+        yield from pagina
@@ -0,0 +1,387 @@
+"""
+Diretório pré-carregado de agentes e grupos do Zendesk, para resolver autores sem chamadas HTTP.
+
+Agentes e grupos mudam pouco, mas a resolução de autores dos comentários buscava e-mail e
+grupos no Zendesk a cada ticket frio. Aqui fica um snapshot em memória com:
+- os agentes e admins (e-mail e IDs de grupo), lidos uma vez de /users (role agent/admin) e
+  depois atualizados pelo export incremental de usuários, por cursor;
+- os nomes dos grupos e as associações usuário-grupo (/groups e /group_memberships), relidos
+  inteiros a cada atualização (são poucos).
+Usuários finais não entram: chegam no sideload dos comentários e não têm grupos.
+
+O snapshot é gravado compactado (JSON + gzip) num arquivo em /tmp, num item do DynamoDB ou nos
+dois (DIRECTORY_STORE=file|dynamodb|both; padrão none = desligado). O container carrega o
+snapshot na inicialização. O worker da fila (nunca o caminho do webhook) roda a atualização
+incremental antes de um lote, de forma síncrona e com prioridade BACKFILL no rate limit do
+Zendesk, quando o snapshot passa de DIRECTORY_REFRESH_SECONDS. Cada atualização lê no máximo
+DIRECTORY_REFRESH_MAX_PAGES páginas do export incremental (quase tudo é churn de usuários
+finais, e o Zendesk limita esse endpoint a ~10 requisições/min); o cursor é salvo e o lote
+seguinte continua dali até alcançar o fim do stream. Depois de uma falha, a próxima tentativa
+espera um backoff exponencial. Um autor que não está no diretório (ex.: agente criado
+depois do snapshot) segue o caminho normal: cache de autores e busca em lote no Zendesk.
+
+    python zendesk_diretorio.py construir      # snapshot completo
+    python zendesk_diretorio.py atualizar      # incremental, a partir do cursor salvo
+    python zendesk_diretorio.py mostrar <user_id>
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import aws_clients
+import zendesk_rate_limit
+
+FORMATO = 1
+PAGE_SIZE = 100
+DEFAULT_FILE_PATH = "/tmp/zendesk_diretorio.json.gz"
+DEFAULT_DYNAMODB_KEY = "zendesk_diretorio"
+PAPEIS_DE_AGENTE = ("agent", "admin")
+MARGEM_DO_INCREMENTAL = 120 # O export incremental exige start_time mais de 1 minuto no passado
+BACKOFF_BASE_SEGUNDOS = 60 # Espera após a primeira falha de atualização; dobra a cada falha seguida
+
+
+class ErroDiretorio(Exception):
+    """Uma leitura do Zendesk falhou; o snapshot anterior continua valendo."""
+
+
+def _paginas(session, url, chave, params, timeout):
+    """Itens de `chave` em todas as páginas de um endpoint com paginação por cursor."""
+    params = dict(params, **{"page[size]": PAGE_SIZE})
+    while True:
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            dados = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise ErroDiretorio(f"Erro ao ler {url}: {e}") from e
+        yield from dados.get(chave, [])
+        meta = dados.get("meta") or {}
+        if not meta.get("has_more") or not meta.get("after_cursor"):
+            return
+        params["page[after]"] = meta["after_cursor"]
+
+
+class DiretorioZendesk:
+    """Agentes (e-mail, grupos) e nomes de grupos em memória, com o cursor do export incremental."""
+
+    def __init__(self, usuarios=None, grupos=None, cursor=None, desde=None, atualizado_em=0.0):
+        self.usuarios = usuarios or {} # user_id -> (email, [group_ids])
+        self.grupos = grupos or {} # group_id -> nome
+        self.cursor = cursor # Cursor do export incremental de usuários
+        self.desde = desde # start_time do primeiro incremental, quando ainda não há cursor
+        self.atualizado_em = atualizado_em
+        self.ultima_tentativa = 0.0 # Última atualização tentada neste container (com ou sem sucesso)
+        self.falhas_seguidas = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.usuarios)
+
+    def __contains__(self, user_id):
+        return user_id in self.usuarios
+
+    def resolver(self, user_id):
+        """(email, [nomes de grupos]) do agente, ou None se ele não está no diretório."""
+        usuario = self.usuarios.get(user_id)
+        if usuario is None:
+            return None
+        email, group_ids = usuario
+        return email, [self.grupos[g] for g in group_ids if g in self.grupos]
+
+    def idade(self):
+        return time.time() - self.atualizado_em
+
+    ##----------------------------------------------------------------------##
+    ## Serialização compacta
+    ##----------------------------------------------------------------------##
+    def para_bytes(self):
+        dados = {
+            "formato": FORMATO,
+            "cursor": self.cursor,
+            "desde": self.desde,
+            "atualizado_em": self.atualizado_em,
+            "grupos": {str(g): nome for g, nome in self.grupos.items()},
+            "usuarios": {str(u): [email, group_ids] for u, (email, group_ids) in self.usuarios.items()},
+        }
+        return gzip.compress(json.dumps(dados, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def de_bytes(cls, bruto):
+        dados = json.loads(gzip.decompress(bruto).decode("utf-8"))
+        if dados.get("formato") != FORMATO:
+            raise ValueError(f"Formato de diretório não suportado: {dados.get('formato')}")
+        return cls(
+            usuarios={int(u): (email, group_ids) for u, (email, group_ids) in dados["usuarios"].items()},
+            grupos={int(g): nome for g, nome in dados["grupos"].items()},
+            cursor=dados.get("cursor"),
+            desde=dados.get("desde"),
+            atualizado_em=dados.get("atualizado_em", 0.0),
+        )
+
+    ##----------------------------------------------------------------------##
+    ## Construção e atualização
+    ##----------------------------------------------------------------------##
+    @classmethod
+    def construir(cls, session, base_url, timeout):
+        """Snapshot completo: agentes/admins, grupos e associações."""
+        inicio = time.time()
+        usuarios = {}
+        for papel in PAPEIS_DE_AGENTE:
+            for usuario in _paginas(session, f"{base_url}/users.json", "users", {"role": papel}, timeout):
+                usuarios[usuario["id"]] = (usuario.get("email") or "Email não encontrado", [])
+        diretorio = cls(usuarios=usuarios, desde=int(inicio) - MARGEM_DO_INCREMENTAL)
+        diretorio._recarregar_grupos(session, base_url, timeout)
+        diretorio.atualizado_em = inicio
+        logging.info(f"Diretório do Zendesk construído: {len(usuarios)} agente(s), {len(diretorio.grupos)} grupo(s) em {time.time() - inicio:.1f}s.")
+        return diretorio
+
+    def atualizar(self, session, base_url, timeout, max_paginas=None):
+        """
+        Aplica o export incremental de usuários desde o cursor e relê grupos e associações.
+        Com `max_paginas`, para depois dessa quantidade de páginas guardando o cursor: o diretório
+        continua "velho" (sem reler grupos) e a próxima chamada segue dali. Retorna True quando
+        alcançou o fim do stream.
+        """
+        inicio = time.time()
+        usuarios = dict(self.usuarios)
+        params = {"cursor": self.cursor} if self.cursor else {"start_time": self.desde or int(inicio) - MARGEM_DO_INCREMENTAL}
+        url = f"{base_url}/incremental/users/cursor.json"
+        alterados = 0
+        paginas = 0
+        while True:
+            try:
+                response = session.get(url, params=params, timeout=timeout)
+                response.raise_for_status()
+                dados = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                raise ErroDiretorio(f"Erro ao ler {url}: {e}") from e
+            for usuario in dados.get("users", []):
+                alterados += 1
+                if usuario.get("role") in PAPEIS_DE_AGENTE and usuario.get("active", True):
+                    grupos_atuais = usuarios.get(usuario["id"], (None, []))[1]
+                    usuarios[usuario["id"]] = (usuario.get("email") or "Email não encontrado", grupos_atuais)
+                else: # Virou usuário final, foi desativado ou excluído
+                    usuarios.pop(usuario["id"], None)
+            paginas += 1
+            cursor = dados.get("after_cursor") or params.get("cursor")
+            completo = bool(dados.get("end_of_stream") or not dados.get("after_cursor"))
+            if completo or (max_paginas and paginas >= max_paginas):
+                break
+            params = {"cursor": cursor}
+        with self._lock: # Troca os dicionários inteiros: leitores nunca veem um estado pela metade
+            self.usuarios = usuarios
+            self.cursor = cursor
+        if not completo:
+            logging.info(f"Diretório do Zendesk: {alterados} usuário(s) em {paginas} página(s); o export incremental continua na próxima atualização.")
+            return False
+        self._recarregar_grupos(session, base_url, timeout)
+        self.atualizado_em = inicio
+        logging.info(f"Diretório do Zendesk atualizado: {alterados} usuário(s) alterado(s), {len(self.usuarios)} agente(s).")
+        return True
+
+    def _recarregar_grupos(self, session, base_url, timeout):
+        grupos = {g["id"]: g.get("name", "Nome do Grupo Ausente") for g in _paginas(session, f"{base_url}/groups.json", "groups", {}, timeout)}
+        por_usuario = {}
+        for associacao in _paginas(session, f"{base_url}/group_memberships.json", "group_memberships", {}, timeout):
+            por_usuario.setdefault(associacao["user_id"], []).append(associacao["group_id"])
+        with self._lock:
+            self.grupos = grupos
+            self.usuarios = {u: (email, por_usuario.get(u, [])) for u, (email, _) in self.usuarios.items()}
+
+    def proxima_tentativa_em(self, intervalo):
+        """Instante (epoch) a partir do qual vale tentar atualizar: idade > `intervalo` e fora do backoff."""
+        vence = self.atualizado_em + intervalo
+        if self.falhas_seguidas:
+            backoff = min(intervalo, BACKOFF_BASE_SEGUNDOS * 2 ** (self.falhas_seguidas - 1))
+            vence = max(vence, self.ultima_tentativa + backoff)
+        return vence
+
+
+##--------------------------------------------------------------------------##
+## Armazenamento do snapshot
+##--------------------------------------------------------------------------##
+class ArquivoDiretorioStore:
+    """Snapshot num arquivo local (ex.: /tmp, que sobrevive entre invocações do mesmo container)."""
+
+    def __init__(self, caminho=DEFAULT_FILE_PATH):
+        self.caminho = caminho
+
+    def carregar(self):
+        if not os.path.exists(self.caminho):
+            return None
+        with open(self.caminho, "rb") as f:
+            return DiretorioZendesk.de_bytes(f.read())
+
+    def salvar(self, diretorio):
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(diretorio.para_bytes())
+        os.replace(temporario, self.caminho)
+
+
+class DynamoDBDiretorioStore:
+    """Snapshot num item do DynamoDB: chave de partição `chave` (string), gzip em `dados` (binário)."""
+
+    def __init__(self, table_name, chave=DEFAULT_DYNAMODB_KEY, table=None):
+        self.chave = chave
+        self.table = table if table is not None else aws_clients.dynamodb_table(table_name)
+
+    def carregar(self):
+        item = self.table.get_item(Key={"chave": self.chave}).get("Item")
+        if not item:
+            return None
+        bruto = item["dados"]
+        return DiretorioZendesk.de_bytes(bytes(getattr(bruto, "value", bruto)))
+
+    def salvar(self, diretorio):
+        self.table.put_item(Item={"chave": self.chave, "dados": diretorio.para_bytes(), "atualizado_em": int(diretorio.atualizado_em)})
+
+
+def get_stores():
+    """Stores configurados em DIRECTORY_STORE (file | dynamodb | both | none), do mais rápido ao mais lento."""
+    modo = os.environ.get("DIRECTORY_STORE", "none").strip().lower()
+    stores = []
+    if modo in ("file", "both"):
+        stores.append(ArquivoDiretorioStore(os.environ.get("DIRECTORY_FILE_PATH", DEFAULT_FILE_PATH)))
+    if modo in ("dynamodb", "both"):
+        tabela = os.environ.get("DIRECTORY_DYNAMODB_TABLE", "").strip()
+        if not tabela:
+            raise ValueError(f"DIRECTORY_STORE={modo} exige DIRECTORY_DYNAMODB_TABLE.")
+        stores.append(DynamoDBDiretorioStore(tabela, chave=os.environ.get("DIRECTORY_DYNAMODB_KEY", DEFAULT_DYNAMODB_KEY)))
+    return stores
+
+
+def salvar(diretorio, stores=None):
+    for store in get_stores() if stores is None else stores:
+        try:
+            store.salvar(diretorio)
+        except Exception as e:
+            logging.error(f"Erro ao salvar o diretório do Zendesk em {type(store).__name__}: {e}")
+
+
+def carregar(stores=None):
+    """Primeiro snapshot disponível nos stores. Um snapshot vindo do DynamoDB também é gravado no arquivo."""
+    stores = get_stores() if stores is None else stores
+    for posicao, store in enumerate(stores):
+        try:
+            diretorio = store.carregar()
+        except Exception as e:
+            logging.warning(f"Diretório do Zendesk indisponível em {type(store).__name__}: {e}")
+            continue
+        if diretorio is not None:
+            salvar(diretorio, stores[:posicao]) # Próximos containers/invocações leem do arquivo local
+            return diretorio
+    return None
+
+
+##--------------------------------------------------------------------------##
+## Diretório do container
+##--------------------------------------------------------------------------##
+_diretorio = None
+_carregado = False
+_diretorio_lock = threading.Lock()
+
+
+def get_diretorio():
+    """
+    Diretório carregado uma vez por container, ou None se DIRECTORY_STORE=none, sem snapshot ou
+    com a configuração do diretório inválida (o erro é registrado uma vez e o pipeline segue sem ele).
+    """
+    global _diretorio, _carregado
+    if not _carregado:
+        with _diretorio_lock:
+            if not _carregado:
+                inicio = time.perf_counter()
+                try:
+                    _diretorio = carregar()
+                except Exception as e:
+                    logging.error(f"Diretório do Zendesk desabilitado neste container: {e}")
+                    _diretorio = None
+                _carregado = True
+                if _diretorio is not None:
+                    logging.info(f"Diretório do Zendesk carregado: {len(_diretorio)} agente(s) em {(time.perf_counter() - inicio) * 1000:.0f}ms (idade {_diretorio.idade():.0f}s).")
+    return _diretorio
+
+
+def pre_carregar():
+    """Chamado na inicialização do container: carrega o snapshot antes do primeiro ticket."""
+    if os.environ.get("DIRECTORY_STORE", "none").strip().lower() == "none":
+        return None
+    return get_diretorio() # Sem diretório o pipeline segue com a busca em lote no Zendesk
+
+
+def atualizar_se_velho(diretorio, session, base_url, timeout):
+    """
+    Atualiza o diretório (incremental, síncrono, prioridade BACKFILL) se ele passou de
+    DIRECTORY_REFRESH_SECONDS e não está em backoff por uma falha recente. Para o worker, entre
+    lotes: no caminho do webhook a espera cairia na latência do ticket. Lê até
+    DIRECTORY_REFRESH_MAX_PAGES páginas; o progresso parcial (cursor) também é salvo.
+    Retorna True se o diretório ficou em dia.
+    """
+    if diretorio is None:
+        return False
+    agora = time.time()
+    if agora < diretorio.proxima_tentativa_em(float(os.environ.get("DIRECTORY_REFRESH_SECONDS", 3600))):
+        return False
+    diretorio.ultima_tentativa = agora
+    try:
+        with zendesk_rate_limit.prioridade(zendesk_rate_limit.BACKFILL):
+            completo = diretorio.atualizar(
+                session, base_url, timeout, max_paginas=int(os.environ.get("DIRECTORY_REFRESH_MAX_PAGES", 2)),
+            )
+    except Exception as e:
+        diretorio.falhas_seguidas += 1
+        logging.warning(f"Atualização do diretório do Zendesk falhou ({diretorio.falhas_seguidas}x); mantendo o snapshot anterior: {e}")
+        return False
+    diretorio.falhas_seguidas = 0
+    salvar(diretorio)
+    return completo
+
+
+##--------------------------------------------------------------------------##
+## CLI
+##--------------------------------------------------------------------------##
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Constrói e atualiza o diretório de agentes e grupos do Zendesk.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("construir", help="Snapshot completo (agentes, grupos e associações)")
+    sub.add_parser("atualizar", help="Atualização incremental a partir do cursor salvo")
+    sub.add_parser("mostrar", help="Resolve um usuário pelo diretório salvo").add_argument("user_id", type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        stores = get_stores()
+    except ValueError as e:
+        parser.error(str(e))
+    if not stores:
+        parser.error("DIRECTORY_STORE=none: defina file, dynamodb ou both.")
+
+    if args.comando == "mostrar":
+        diretorio = carregar(stores)
+        if diretorio is None:
+            parser.error("Nenhum snapshot salvo. Rode `construir` primeiro.")
+        print(f"{len(diretorio)} agente(s), {len(diretorio.grupos)} grupo(s), idade {diretorio.idade():.0f}s.")
+        print(diretorio.resolver(args.user_id) or "Usuário fora do diretório (usuário final ou agente novo).")
+        return
+
+    import webhook_glean_zendesk
+    base_url, session = webhook_glean_zendesk._zendesk_client()
+    timeout = webhook_glean_zendesk.get_config().zendesk_timeout
+    diretorio = carregar(stores) if args.comando == "atualizar" else None
+    if diretorio is None:
+        diretorio = DiretorioZendesk.construir(session, base_url, timeout)
+    else:
+        diretorio.atualizar(session, base_url, timeout)
+    salvar(diretorio, stores)
+    print(f"Diretório salvo: {len(diretorio)} agente(s), {len(diretorio.grupos)} grupo(s), {len(diretorio.para_bytes())} bytes.")
+
+
+if __name__ == "__main__":
+    main()
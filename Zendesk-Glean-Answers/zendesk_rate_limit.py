@@ -0,0 +1,188 @@
+"""
+Agendador central das requisições ao Zendesk, ciente do rate limit da conta.
+
+Toda requisição feita pela sessão do Zendesk (http_client) passa por `AgendadorZendesk.executar`:
+
+- Token bucket: a taxa começa em ZENDESK_RATE_LIMIT_PER_MINUTE e é ajustada pelo cabeçalho
+  `X-Rate-Limit` (limite por minuto da conta) vezes ZENDESK_RATE_LIMIT_UTILIZATION. O cabeçalho
+  `X-Rate-Limit-Remaining` limita os tokens disponíveis ao que a conta ainda tem na janela.
+- Retry-After: um 429 bloqueia todas as requisições até o instante indicado e a requisição é
+  refeita (até ZENDESK_MAX_429_RETRIES vezes), em vez de devolver dados parciais ao pipeline.
+- AIMD: o número de requisições simultâneas cresce +1 a cada "janela" de sucessos e cai pela
+  metade a cada 429, entre 1 e ZENDESK_MAX_CONCURRENCY.
+- Prioridade: o trabalho interativo (webhooks) passa na frente do backfill. O backfill roda
+  dentro de `with prioridade(BACKFILL):` e não consome a reserva de tokens do interativo.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+
+INTERATIVO = 0
+BACKFILL = 1
+
+_prioridade = contextvars.ContextVar("prioridade_zendesk", default=INTERATIVO)
+
+ESPERA_MAXIMA_SEM_SINAL = 1.0 # Reavalia periodicamente mesmo sem notify (ex.: relógio/tempo de bloqueio)
+
+
+@contextlib.contextmanager
+def prioridade(nivel):
+    """Executa o bloco com a prioridade `nivel` (INTERATIVO ou BACKFILL) nas chamadas ao Zendesk."""
+    token = _prioridade.set(nivel)
+    try:
+        yield
+    finally:
+        _prioridade.reset(token)
+
+
+def _float_do_cabecalho(headers, nome):
+    try:
+        return float(headers.get(nome))
+    except (TypeError, ValueError):
+        return None
+
+
+class AgendadorZendesk:
+    """Token bucket + concorrência AIMD + Retry-After, com prioridade para o trabalho interativo."""
+
+    def __init__(self, taxa_por_minuto=400, utilizacao=0.9, max_concorrencia=8, rajada_segundos=5,
+                 reserva_interativa=0.25, max_tentativas_429=3, clock=time.monotonic):
+        self.utilizacao = float(utilizacao)
+        self.max_concorrencia = max(1, int(max_concorrencia))
+        self.rajada_segundos = float(rajada_segundos)
+        self.reserva_interativa = float(reserva_interativa)
+        self.max_tentativas_429 = max(0, int(max_tentativas_429))
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._definir_taxa(taxa_por_minuto / 60.0)
+        self._tokens = self._capacidade
+        self._atualizado_em = clock()
+        self._bloqueado_ate = 0.0
+        self._limite = float(self.max_concorrencia) # Limite AIMD de requisições simultâneas
+        self._em_voo = 0
+        self._esperando = {INTERATIVO: 0, BACKFILL: 0}
+        self.requisicoes = 0
+        self.respostas_429 = 0
+
+    def _definir_taxa(self, por_segundo):
+        self._taxa = max(por_segundo, 0.01)
+        self._capacidade = max(1.0, self._taxa * self.rajada_segundos)
+
+    def _reabastecer(self, agora):
+        self._tokens = min(self._capacidade, self._tokens + (agora - self._atualizado_em) * self._taxa)
+        self._atualizado_em = agora
+
+    def _espera(self, agora, nivel):
+        """Segundos até a requisição poder sair (0 = já), ou None para esperar um sinal."""
+        if agora < self._bloqueado_ate:
+            return self._bloqueado_ate - agora
+        if self._em_voo >= int(self._limite):
+            return None
+        if nivel == BACKFILL and self._esperando[INTERATIVO]:
+            return None
+        reserva = self._capacidade * self.reserva_interativa if nivel == BACKFILL else 0.0
+        if self._tokens < 1.0 + reserva:
+            return (1.0 + reserva - self._tokens) / self._taxa
+        return 0
+
+    def _adquirir(self, nivel):
+        with self._cond:
+            self._esperando[nivel] += 1
+            try:
+                while True:
+                    agora = self._clock()
+                    self._reabastecer(agora)
+                    espera = self._espera(agora, nivel)
+                    if espera == 0:
+                        self._tokens -= 1.0
+                        self._em_voo += 1
+                        return
+                    self._cond.wait(ESPERA_MAXIMA_SEM_SINAL if espera is None else min(espera, ESPERA_MAXIMA_SEM_SINAL))
+            finally:
+                self._esperando[nivel] -= 1
+
+    def _liberar(self, resposta):
+        with self._cond:
+            self._em_voo -= 1
+            self.requisicoes += 1
+            if resposta is not None:
+                self._observar(resposta)
+            self._cond.notify_all()
+
+    def _observar(self, resposta):
+        headers = resposta.headers
+        agora = self._clock()
+        limite_conta = _float_do_cabecalho(headers, "X-Rate-Limit")
+        if limite_conta:
+            self._definir_taxa(limite_conta * self.utilizacao / 60.0)
+            self._reabastecer(agora)
+        restante = _float_do_cabecalho(headers, "X-Rate-Limit-Remaining")
+        if restante is not None:
+            self._tokens = min(self._tokens, restante) # Outras integrações também consomem a cota da conta
+
+        if resposta.status_code == 429:
+            self.respostas_429 += 1
+            retry_after = _float_do_cabecalho(headers, "Retry-After")
+            self._bloqueado_ate = max(self._bloqueado_ate, agora + (retry_after if retry_after is not None else 1.0))
+            self._limite = max(1.0, self._limite / 2) # Decremento multiplicativo
+            self._tokens = min(self._tokens, 0.0)
+        elif resposta.status_code < 400:
+            self._limite = min(float(self.max_concorrencia), self._limite + 1.0 / self._limite) # Incremento aditivo
+
+    def executar(self, enviar):
+        """
+        Chama `enviar()` (que retorna um requests.Response) respeitando o rate limit.
+        Um 429 é refeito após o Retry-After; depois de max_tentativas_429 o 429 é devolvido ao chamador.
+        """
+        nivel = _prioridade.get()
+        for tentativa in range(self.max_tentativas_429 + 1):
+            self._adquirir(nivel)
+            resposta = None
+            try:
+                resposta = enviar()
+            finally:
+                self._liberar(resposta)
+            if resposta.status_code != 429 or tentativa == self.max_tentativas_429:
+                return resposta
+            logging.warning(
+                f"Zendesk respondeu 429 (Retry-After: {resposta.headers.get('Retry-After')}). "
+                f"Tentativa {tentativa + 1} de {self.max_tentativas_429}; concorrência reduzida para {int(self._limite)}."
+            )
+            resposta.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "taxa_por_minuto": round(self._taxa * 60, 1),
+                "tokens": round(self._tokens, 2),
+                "limite_concorrencia": int(self._limite),
+                "em_voo": self._em_voo,
+                "esperando_interativo": self._esperando[INTERATIVO],
+                "esperando_backfill": self._esperando[BACKFILL],
+                "bloqueado_por_segundos": round(max(0.0, self._bloqueado_ate - self._clock()), 2),
+                "requisicoes": self.requisicoes,
+                "respostas_429": self.respostas_429,
+            }
+
+
+_agendador = None
+_agendador_lock = threading.Lock()
+
+
+def get_agendador():
+    """Agendador compartilhado por todas as chamadas ao Zendesk do processo."""
+    global _agendador
+    if _agendador is None:
+        with _agendador_lock:
+            if _agendador is None:
+                _agendador = AgendadorZendesk(
+                    taxa_por_minuto=float(os.environ.get("ZENDESK_RATE_LIMIT_PER_MINUTE", 400)),
+                    utilizacao=float(os.environ.get("ZENDESK_RATE_LIMIT_UTILIZATION", 0.9)),
+                    max_concorrencia=int(os.environ.get("ZENDESK_MAX_CONCURRENCY", 8)),
+                    reserva_interativa=float(os.environ.get("ZENDESK_INTERACTIVE_RESERVE", 0.25)),
+                    max_tentativas_429=int(os.environ.get("ZENDESK_MAX_429_RETRIES", 3)),
+                )
+    return _agendador